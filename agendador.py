@@ -0,0 +1,202 @@
+"""Agendador do agente (cliente.py): dispara SCRIPT_PONTO no horário de cada tarefa.
+
+Substitui o `at`: os jobs ficam numa fila de prioridade (heap por horário) e são
+disparados com precisão de segundos por uma thread do processo de longa duração
+(`cliente.py --escutar`). A chave de cada job é data + hora + minuto, então a
+mesma tarefa consultada várias vezes não é agendada duas vezes.
+
+A fila é persistida em AGENDADOR_ARQUIVO (JSON, sob flock), o que permite
+sobreviver a reinícios e também que outro processo — `cliente.py` via cron,
+`--listar-agendados`, `--cancelar` — altere a fila. Mudanças de outro processo
+não acordam a thread, então enquanto espera ela confere o mtime do arquivo a
+cada AGENDADOR_VIGIA segundos e o relê quando muda. O campo `ativo_em` indica
+se há uma thread disparando os jobs.
+"""
+import datetime
+import fcntl
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+AGENDADOR_ARQUIVO = Path(os.getenv("AGENDADOR_ARQUIVO", Path.home() / ".cache" / "descall" / "agendador.json"))
+# Intervalo máximo entre sinais de vida no arquivo (segundos)
+AGENDADOR_INTERVALO = float(os.getenv("AGENDADOR_INTERVALO", "30"))
+# Intervalo entre conferências do mtime do arquivo durante a espera (segundos): é
+# o atraso máximo para notar um job incluído por outro processo
+AGENDADOR_VIGIA = float(os.getenv("AGENDADOR_VIGIA", "1"))
+# Atraso máximo aceito para disparar um job (ex.: agente reiniciado logo após o horário)
+AGENDADOR_TOLERANCIA = float(os.getenv("AGENDADOR_TOLERANCIA", "300"))
+
+
+@dataclass
+class Job:
+    chave: str  # "YYYY-MM-DD HH:MM"
+    quando: float  # epoch (segundos)
+    tarefa_id: Optional[int] = None
+
+    @classmethod
+    def para(cls, data: str, hora, minuto, segundo=0, tarefa_id: Optional[int] = None) -> "Job":
+        h, m, s = int(hora), int(minuto), int(segundo)
+        momento = datetime.datetime.strptime(data, "%Y-%m-%d").replace(hour=h, minute=m, second=s)
+        return cls(f"{data} {h:02d}:{m:02d}", momento.timestamp(), tarefa_id)
+
+    def resumo(self) -> dict:
+        return {**asdict(self), "horario": datetime.datetime.fromtimestamp(self.quando).isoformat(timespec="seconds")}
+
+
+class Agendador:
+    def __init__(
+        self,
+        arquivo=AGENDADOR_ARQUIVO,
+        disparar: Optional[Callable[[Job], None]] = None,
+        ao_perder: Optional[Callable[[Job], None]] = None,
+        tolerancia: float = AGENDADOR_TOLERANCIA,
+    ):
+        self.arquivo = Path(arquivo)
+        self.disparar = disparar
+        self.ao_perder = ao_perder
+        self.tolerancia = tolerancia
+        self._jobs: dict = {}
+        self._heap: list = []  # (quando, chave); entradas obsoletas são puladas
+        self._ativo_em = 0.0
+        self._mtime = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- persistência ---
+
+    @contextmanager
+    def _transacao(self, gravar: bool = True):
+        """Trava o arquivo entre processos, relê se mudou e grava ao final."""
+        self.arquivo.parent.mkdir(parents=True, exist_ok=True)
+        with self._cond, open(self.arquivo.with_suffix(".lock"), "w") as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+            self._recarregar()
+            yield
+            if gravar:
+                self._gravar()
+
+    def _recarregar(self) -> None:
+        try:
+            mtime = self.arquivo.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        dados = json.loads(self.arquivo.read_text(encoding="utf-8") or "{}")
+        self._ativo_em = dados.get("ativo_em", 0.0)
+        self._jobs = {j["chave"]: Job(j["chave"], j["quando"], j.get("tarefa_id")) for j in dados.get("jobs", [])}
+        self._heap = [(j.quando, j.chave) for j in self._jobs.values()]
+        heapq.heapify(self._heap)
+        self._mtime = mtime
+
+    def _mudou(self, desde) -> bool:
+        """O arquivo foi gravado (por este ou outro processo) desde o mtime `desde`?"""
+        if self._mtime != desde:
+            return True
+        try:
+            return self.arquivo.stat().st_mtime_ns != desde
+        except FileNotFoundError:
+            return desde is not None
+
+    def _gravar(self) -> None:
+        dados = {"ativo_em": self._ativo_em, "jobs": [asdict(j) for j in sorted(self._jobs.values(), key=lambda j: j.quando)]}
+        temporario = self.arquivo.with_suffix(".tmp")
+        temporario.write_text(json.dumps(dados, ensure_ascii=False, indent=1), encoding="utf-8")
+        temporario.replace(self.arquivo)
+        self._mtime = self.arquivo.stat().st_mtime_ns
+
+    # --- operações ---
+
+    def agendar(self, job: Job) -> bool:
+        """Inclui ou atualiza o job da chave. Retorna False se já estava agendado igual."""
+        with self._transacao():
+            if self._jobs.get(job.chave) == job:
+                return False
+            self._jobs[job.chave] = job
+            heapq.heappush(self._heap, (job.quando, job.chave))
+            self._cond.notify_all()
+        logger.info("Agendado: %s (tarefa %s)", job.chave, job.tarefa_id)
+        return True
+
+    def cancelar(self, chave: str) -> Optional[Job]:
+        """Remove o job da chave; retorna o job removido ou None."""
+        with self._transacao():
+            job = self._jobs.pop(chave, None)
+            self._cond.notify_all()
+        if job:
+            logger.info("Cancelado: %s (tarefa %s)", job.chave, job.tarefa_id)
+        return job
+
+    def listar(self) -> list:
+        with self._transacao(gravar=False):
+            return sorted(self._jobs.values(), key=lambda j: j.quando)
+
+    def ativo(self) -> bool:
+        """Há uma thread disparando os jobs (sinal de vida recente no arquivo)?"""
+        with self._transacao(gravar=False):
+            return time.time() - self._ativo_em < 2 * AGENDADOR_INTERVALO
+
+    # --- execução ---
+
+    def _vencidos(self, agora: float) -> list:
+        """Retira do heap os jobs cujo horário chegou; chamado dentro da transação."""
+        vencidos = []
+        while self._heap and self._heap[0][0] <= agora:
+            quando, chave = heapq.heappop(self._heap)
+            job = self._jobs.get(chave)
+            if job is None or job.quando != quando:
+                continue  # cancelado ou reagendado
+            del self._jobs[chave]
+            vencidos.append(job)
+        return vencidos
+
+    def _proximo(self) -> Optional[float]:
+        while self._heap and (self._heap[0][1] not in self._jobs or self._jobs[self._heap[0][1]].quando != self._heap[0][0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def executar(self) -> None:
+        """Laço de disparo (bloqueante)."""
+        logger.info("Agendador ativo (%s)", self.arquivo)
+        while True:
+            with self._transacao():
+                agora = time.time()
+                self._ativo_em = agora
+                vencidos = self._vencidos(agora)
+            for job in vencidos:
+                atraso = agora - job.quando
+                if atraso > self.tolerancia:
+                    logger.warning("Job %s perdido (atraso de %.0fs)", job.chave, atraso)
+                    if self.ao_perder:
+                        self.ao_perder(job)
+                    continue
+                logger.info("Disparando %s (tarefa %s, atraso %.3fs)", job.chave, job.tarefa_id, atraso)
+                try:
+                    self.disparar(job)
+                except Exception:
+                    logger.exception("Falha ao disparar %s", job.chave)
+            with self._cond:
+                proximo = self._proximo()
+                espera = AGENDADOR_INTERVALO if proximo is None else min(AGENDADOR_INTERVALO, proximo - time.time())
+                limite, versao = time.monotonic() + espera, self._mtime
+                while not self._mudou(versao):
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(min(restante, AGENDADOR_VIGIA))
+
+    def iniciar(self) -> threading.Thread:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self.executar, name="agendador", daemon=True)
+            self._thread.start()
+        return self._thread
@@ -0,0 +1,279 @@
+"""Benchmark de carga da API (main.py) com banco temporário.
+
+Para cada banco pedido, sobe o `app` com uvicorn num processo separado (o
+DATABASE_URL é lido na importação do main.py), semeia N mil tarefas via
+/api/agendar-lote e dispara requisições concorrentes em /api/agendar,
+/api/consultar, /api/listar-ultimas e /api/confirmar-execucao, medindo vazão e
+percentis de latência por rota.
+
+    python benchmark_api.py --bancos sqlite,postgres --linhas 5000 --clientes 16
+    python benchmark_api.py --gravar-baseline       # grava o resultado como referência
+
+Postgres: usa --postgres-url (ou BENCH_POSTGRES_URL); sem isso, cria um cluster
+temporário com initdb/pg_ctl se estiverem no PATH, senão pula o banco.
+
+Com uma baseline (BENCH_BASELINE, padrão benchmark_baseline.json), aponta as rotas
+cuja p95 subiu ou a vazão caiu mais que --tolerancia e sai com código 1. Latências
+absolutas só se comparam na mesma máquina: a baseline é gravada localmente (fica
+fora do git) com --gravar-baseline, por exemplo antes de uma mudança.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import requests
+
+from metricas import percentil
+
+DIRETORIO = Path(__file__).resolve().parent
+BENCH_BASELINE = Path(os.getenv("BENCH_BASELINE", DIRETORIO / "benchmark_baseline.json"))
+ROTAS = ("agendar", "consultar", "listar-ultimas", "confirmar-execucao")
+
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- Bancos ---
+
+
+@contextmanager
+def banco_sqlite():
+    with tempfile.TemporaryDirectory(prefix="bench-sqlite-") as diretorio:
+        yield f"sqlite:///{diretorio}/bench.db"
+
+
+@contextmanager
+def banco_postgres(url: str = None):
+    url = url or os.getenv("BENCH_POSTGRES_URL")
+    if url:
+        yield url
+        return
+    initdb, pg_ctl = shutil.which("initdb"), shutil.which("pg_ctl")
+    if not (initdb and pg_ctl):
+        yield None
+        return
+    with tempfile.TemporaryDirectory(prefix="bench-pg-") as diretorio:
+        dados, porta = Path(diretorio) / "dados", porta_livre()
+        subprocess.run([initdb, "-D", str(dados), "-U", "bench", "--auth=trust"], check=True, capture_output=True)
+        subprocess.run(
+            [pg_ctl, "-D", str(dados), "-o", f"-p {porta} -k {diretorio} -c listen_addresses=127.0.0.1",
+             "-l", str(Path(diretorio) / "pg.log"), "-w", "start"],
+            check=True, capture_output=True,
+        )
+        try:
+            yield f"postgresql://bench@127.0.0.1:{porta}/postgres"
+        finally:
+            subprocess.run([pg_ctl, "-D", str(dados), "-m", "fast", "stop"], capture_output=True)
+
+
+BANCOS = {"sqlite": banco_sqlite, "postgres": banco_postgres}
+
+
+# --- Servidor ---
+
+
+def conferir_dotenv() -> None:
+    """O main.py chama `load_dotenv(override=True)`: um DATABASE_URL no .env do projeto
+    trocaria o banco temporário pelo real. O filho roda com PYTHON_DOTENV_DISABLED,
+    que só o python-dotenv >= 1.1 respeita; com um mais antigo, recusa rodar.
+    """
+    from importlib.metadata import version
+
+    from dotenv import dotenv_values, find_dotenv
+
+    arquivo = find_dotenv()  # procura a partir deste diretório, o mesmo do main.py
+    if not arquivo or "DATABASE_URL" not in dotenv_values(arquivo):
+        return
+    if tuple(int(p) for p in version("python-dotenv").split(".")[:2]) < (1, 1):
+        raise SystemExit(
+            f"{arquivo} define DATABASE_URL e o python-dotenv instalado não pode ser desligado "
+            "(PYTHON_DOTENV_DISABLED exige >= 1.1): o benchmark gravaria no banco real"
+        )
+
+
+@contextmanager
+def servidor(database_url: str):
+    porta = porta_livre()
+    # Sem .env no filho: o banco é sempre o temporário (ver conferir_dotenv)
+    env = dict(os.environ, DATABASE_URL=database_url, TRABALHADOR_INTERVALO="0", PYTHON_DOTENV_DISABLED="1")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(porta), "--log-level", "warning"],
+        cwd=DIRETORIO, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{porta}"
+    try:
+        limite = time.monotonic() + 30
+        while True:
+            try:
+                if requests.get(f"{base}/health-check", timeout=1).ok:
+                    break
+            except requests.ConnectionError:
+                pass
+            if proc.poll() is not None or time.monotonic() > limite:
+                raise RuntimeError(f"servidor não subiu para {database_url}")
+            time.sleep(0.2)
+        yield base
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def horario(i: int, inicio: datetime.date) -> dict:
+    """Horário distinto para cada `i` (um por minuto, avançando os dias)."""
+    dia, minuto = divmod(i, 24 * 60)
+    return {
+        "data_execucao": (inicio + datetime.timedelta(days=dia)).isoformat(),
+        "hora": f"{minuto // 60:02d}",
+        "minuto": f"{minuto % 60:02d}",
+    }
+
+
+def semear(base: str, linhas: int, lote: int = 1000) -> list:
+    """Cria `linhas` tarefas via /api/agendar-lote; devolve os ids gravados."""
+    inicio = datetime.date.today() - datetime.timedelta(days=linhas // (24 * 60) + 1)
+    ids = []
+    with requests.Session() as s:
+        for comeco in range(0, linhas, lote):
+            itens = [horario(i, inicio) for i in range(comeco, min(linhas, comeco + lote))]
+            resp = s.post(f"{base}/api/agendar-lote", json={"agendamentos": itens}, timeout=120)
+            resp.raise_for_status()
+            ids.extend(t["id"] for t in resp.json()["tarefas"])
+    return ids
+
+
+# --- Carga ---
+
+
+def requisicao(rota: str, ids: list, rng: random.Random):
+    """(método, caminho, corpo) de uma requisição aleatória para `rota`."""
+    if rota == "agendar":
+        futuro = datetime.date.today() + datetime.timedelta(days=rng.randint(400, 800))
+        return "POST", "/api/agendar", horario(rng.randrange(24 * 60), futuro)
+    if rota == "consultar":
+        return "GET", "/api/consultar", None
+    if rota == "listar-ultimas":
+        return "GET", "/api/listar-ultimas?limit=20", None
+    return "POST", "/api/confirmar-execucao", {"id": rng.choice(ids), "status": rng.choice(["sucesso", "falha"])}
+
+
+def medir_rota(base: str, rota: str, ids: list, total: int, clientes: int, semente: int) -> dict:
+    """Dispara `total` requisições em `clientes` threads (uma Session por thread)."""
+    local = threading.local()
+    latencias, erros = [], [0]
+    lock = threading.Lock()
+
+    def uma(i: int):
+        if not hasattr(local, "sessao"):
+            local.sessao = requests.Session()
+        metodo, caminho, corpo = requisicao(rota, ids, random.Random(semente * 1_000_003 + i))
+        t0 = time.perf_counter()
+        try:
+            ok = local.sessao.request(metodo, base + caminho, json=corpo, timeout=30).ok
+        except requests.RequestException:
+            ok = False
+        duracao = time.perf_counter() - t0
+        with lock:
+            latencias.append(duracao)
+            erros[0] += not ok
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(clientes) as executor:
+        list(executor.map(uma, range(total)))
+    decorrido = time.perf_counter() - inicio
+    latencias.sort()
+    return {
+        "requisicoes": total,
+        "erros": erros[0],
+        "vazao_rps": round(total / decorrido, 1),
+        "p50_ms": round(percentil(latencias, 50) * 1000, 2),
+        "p95_ms": round(percentil(latencias, 95) * 1000, 2),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 2),
+    }
+
+
+def executar_banco(nome: str, args) -> dict:
+    with BANCOS[nome](**({"url": args.postgres_url} if nome == "postgres" else {})) as url:
+        if url is None:
+            print(f"[{nome}] sem Postgres disponível (use --postgres-url); pulando", file=sys.stderr)
+            return None
+        with servidor(url) as base:
+            t0 = time.perf_counter()
+            ids = semear(base, args.linhas)
+            print(f"[{nome}] {len(ids)} tarefas semeadas em {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+            resultado = {}
+            for indice, rota in enumerate(ROTAS):
+                resultado[rota] = medir_rota(base, rota, ids, args.requisicoes, args.clientes, args.semente + indice)
+                print(f"[{nome}] {rota}: {resultado[rota]}", file=sys.stderr)
+            return resultado
+
+
+def comparar(resultados: dict, baseline: dict, tolerancia: float) -> list:
+    """Regressões em relação à baseline: p95 maior ou vazão menor que a tolerância."""
+    regressoes = []
+    for banco, rotas in resultados.items():
+        for rota, atual in rotas.items():
+            ref = baseline.get(banco, {}).get(rota)
+            if not ref:
+                continue
+            if atual["p95_ms"] > ref["p95_ms"] * (1 + tolerancia):
+                regressoes.append(f"{banco} {rota}: p95 {ref['p95_ms']} -> {atual['p95_ms']} ms")
+            if atual["vazao_rps"] < ref["vazao_rps"] * (1 - tolerancia):
+                regressoes.append(f"{banco} {rota}: vazão {ref['vazao_rps']} -> {atual['vazao_rps']} req/s")
+            if atual["erros"] > ref.get("erros", 0):
+                regressoes.append(f"{banco} {rota}: erros {ref.get('erros', 0)} -> {atual['erros']}")
+    return regressoes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de carga da API com banco temporário.")
+    parser.add_argument("--bancos", default="sqlite,postgres", help="lista separada por vírgulas (sqlite, postgres)")
+    parser.add_argument("--postgres-url", help="Postgres já existente (padrão: BENCH_POSTGRES_URL ou initdb)")
+    parser.add_argument("--linhas", type=int, default=5000, help="tarefas semeadas antes da carga")
+    parser.add_argument("--requisicoes", type=int, default=1000, help="requisições por rota")
+    parser.add_argument("--clientes", type=int, default=16, help="clientes concorrentes")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--baseline", type=Path, default=BENCH_BASELINE)
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="variação aceita antes de apontar regressão")
+    parser.add_argument("--gravar-baseline", action="store_true", help="grava este resultado como baseline")
+    args = parser.parse_args()
+    conferir_dotenv()
+
+    resultados = {}
+    for nome in (n.strip() for n in args.bancos.split(",") if n.strip()):
+        if nome not in BANCOS:
+            parser.error(f"banco desconhecido: {nome} (opções: {', '.join(BANCOS)})")
+        resultado = executar_banco(nome, args)
+        if resultado is not None:
+            resultados[nome] = resultado
+
+    print(json.dumps(resultados, ensure_ascii=False, indent=2))
+    if args.gravar_baseline:
+        args.baseline.write_text(json.dumps(resultados, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline gravada em {args.baseline}", file=sys.stderr)
+        return
+    if not args.baseline.exists():
+        print(f"Sem baseline em {args.baseline} (use --gravar-baseline)", file=sys.stderr)
+        return
+    regressoes = comparar(resultados, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerancia)
+    for regressao in regressoes:
+        print(f"REGRESSÃO: {regressao}", file=sys.stderr)
+    sys.exit(1 if regressoes else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Benchmark de inicialização a frio dos pontos de entrada (login-ia.py, cliente.py, main.py).
+
+O cron dispara cliente.py/login-ia.py uma vez por execução, então o tempo até a
+primeira requisição HTTP é dominado por subir o interpretador e importar o script.
+Para cada ponto de entrada, roda `--repeticoes` processos novos que só executam o
+módulo (sem chamar main()) e mede, pela mediana:
+
+- partida_ms: do disparo do processo até o fim das importações do script;
+- importacao_ms: só a execução do módulo (sem a subida do interpretador).
+
+Falha (código 1) se a partida passar do orçamento do ponto de entrada ou se o
+script carregar na importação um módulo pesado que deve ser importado só no uso
+(ex.: selenium no login-ia.py, que o motor http nem usa).
+
+    python benchmark_inicializacao.py                 # todos, com orçamento
+    python benchmark_inicializacao.py login-ia --detalhar
+    python benchmark_inicializacao.py --orcamento cliente=300
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+DIRETORIO = Path(__file__).resolve().parent
+
+# Executa o script como módulo (o `if __name__ == "__main__"` não roda) e informa
+# quando terminou e o que ficou importado
+CODIGO_FILHO = """
+import json, runpy, sys, time
+inicio = time.perf_counter()
+runpy.run_path(sys.argv[1], run_name="__inicializacao__")
+fim = time.perf_counter()
+print(json.dumps({"fim": time.time(), "importacao_ms": (fim - inicio) * 1000, "modulos": sorted(sys.modules)}))
+"""
+
+# Módulos que só podem ser importados no primeiro uso
+PESADOS = ("selenium", "webdriver_manager", "google.generativeai", "PIL", "pytesseract")
+
+# Orçamento da partida (ms, mediana) e módulos proibidos na importação de cada ponto de entrada
+PONTOS_ENTRADA = {
+    "login-ia": {"script": "login-ia.py", "orcamento_ms": 300, "proibidos": PESADOS},
+    "cliente": {"script": "cliente.py", "orcamento_ms": 300, "proibidos": PESADOS + ("sqlalchemy", "fastapi")},
+    "main": {"script": "main.py", "orcamento_ms": 1500, "proibidos": PESADOS},
+}
+
+
+def medir(script: str, detalhar: bool = False) -> dict:
+    """Uma partida a frio de `script` num processo novo."""
+    comando = [sys.executable, *(["-X", "importtime"] if detalhar else []), "-c", CODIGO_FILHO, script]
+    inicio = time.time()
+    proc = subprocess.run(comando, cwd=DIRETORIO, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{script} falhou na importação:\n{proc.stderr[-2000:]}")
+    resultado = json.loads(proc.stdout.strip().splitlines()[-1])
+    resultado["partida_ms"] = (resultado.pop("fim") - inicio) * 1000
+    if detalhar:
+        resultado["importtime"] = proc.stderr
+    return resultado
+
+
+def mais_pesados(importtime: str, quantidade: int = 10) -> dict:
+    """Importações de primeiro nível com maior tempo acumulado (saída de -X importtime)."""
+    tempos = []
+    for linha in importtime.splitlines():
+        if not linha.startswith("import time:") or "|" not in linha:
+            continue
+        _, acumulado, nome = linha.split("|")
+        if acumulado.strip().isdigit() and not nome.startswith("  "):
+            tempos.append((int(acumulado) / 1000, nome.strip()))
+    return {nome: round(ms, 1) for ms, nome in sorted(tempos, reverse=True)[:quantidade]}
+
+
+def avaliar(nome: str, repeticoes: int, orcamento_ms: float, detalhar: bool) -> dict:
+    ponto = PONTOS_ENTRADA[nome]
+    medidas = [medir(ponto["script"]) for _ in range(repeticoes)]
+    carregados = set(medidas[-1]["modulos"])
+    resultado = {
+        "partida_ms": round(statistics.median(m["partida_ms"] for m in medidas), 1),
+        "importacao_ms": round(statistics.median(m["importacao_ms"] for m in medidas), 1),
+        "orcamento_ms": orcamento_ms,
+        "proibidos_carregados": [m for m in ponto["proibidos"] if m in carregados],
+    }
+    if detalhar:
+        resultado["mais_pesados_ms"] = mais_pesados(medir(ponto["script"], detalhar=True)["importtime"])
+    return resultado
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mede a inicialização a frio dos pontos de entrada.")
+    parser.add_argument("pontos", nargs="*", help=f"pontos de entrada ({', '.join(PONTOS_ENTRADA)}; padrão: todos)")
+    parser.add_argument("--repeticoes", type=int, default=int(os.getenv("INICIALIZACAO_REPETICOES", "5")))
+    parser.add_argument(
+        "--orcamento", action="append", default=[], metavar="NOME=MS", help="substitui o orçamento de um ponto de entrada"
+    )
+    parser.add_argument("--detalhar", action="store_true", help="inclui as importações mais pesadas (-X importtime)")
+    args = parser.parse_args()
+
+    orcamentos = {nome: ponto["orcamento_ms"] for nome, ponto in PONTOS_ENTRADA.items()}
+    for item in args.orcamento:
+        nome, _, valor = item.partition("=")
+        if nome not in orcamentos or not valor:
+            parser.error(f"orçamento inválido: {item} (use NOME=MS, com NOME em {', '.join(PONTOS_ENTRADA)})")
+        orcamentos[nome] = float(valor)
+
+    for nome in args.pontos:
+        if nome not in PONTOS_ENTRADA:
+            parser.error(f"ponto de entrada desconhecido: {nome} (opções: {', '.join(PONTOS_ENTRADA)})")
+
+    resultados, violacoes = {}, []
+    for nome in args.pontos or PONTOS_ENTRADA:
+        resultado = resultados[nome] = avaliar(nome, args.repeticoes, orcamentos[nome], args.detalhar)
+        print(f"[{nome}] partida {resultado['partida_ms']} ms (importação {resultado['importacao_ms']} ms)", file=sys.stderr)
+        if resultado["partida_ms"] > orcamentos[nome]:
+            violacoes.append(f"{nome}: partida {resultado['partida_ms']} ms > orçamento {orcamentos[nome]} ms")
+        if resultado["proibidos_carregados"]:
+            violacoes.append(f"{nome}: importa na inicialização {', '.join(resultado['proibidos_carregados'])}")
+
+    print(json.dumps(resultados, ensure_ascii=False, indent=2))
+    for violacao in violacoes:
+        print(f"ORÇAMENTO: {violacao}", file=sys.stderr)
+    sys.exit(1 if violacoes else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Cache em processo para respostas de leitura da API (main.py).
+
+O backend padrão é TTL + LRU em memória; outros podem ser registrados em
+`BACKENDS` (a interface é a de `CacheNulo`). As rotas de escrita chamam
+`invalidar()`, que limpa tudo e avança a `geracao`: um valor calculado antes
+de uma escrita não é guardado depois dela.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+@dataclass(frozen=True)
+class EntradaCache:
+    dados: Any  # valor já em tipos primitivos (JSON)
+    corpo: bytes  # JSON serializado, enviado como está
+    etag: str
+
+    @classmethod
+    def de(cls, dados: Any) -> "EntradaCache":
+        corpo = json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return cls(dados, corpo, '"' + hashlib.sha1(corpo).hexdigest() + '"')
+
+
+class CacheNulo:
+    """Backend que não guarda nada (CACHE_BACKEND=nenhum); só conta as consultas."""
+
+    def __init__(self, ttl: float = 0, tamanho_max: int = 0):
+        self.ttl = ttl
+        self.tamanho_max = tamanho_max
+        self.geracao = 0
+        self.estatisticas = {"hits": 0, "misses": 0, "invalidacoes": 0, "nao_modificado": 0}
+        self._lock = threading.Lock()
+
+    def obter(self, chave) -> Optional[EntradaCache]:
+        with self._lock:
+            self.estatisticas["misses"] += 1
+        return None
+
+    def guardar(self, chave, entrada: EntradaCache, geracao: int) -> None:
+        pass
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self.geracao += 1
+            self.estatisticas["invalidacoes"] += 1
+
+    def contar_nao_modificado(self) -> None:
+        with self._lock:
+            self.estatisticas["nao_modificado"] += 1
+
+    def __len__(self) -> int:
+        return 0
+
+    def resumo(self) -> dict:
+        with self._lock:
+            consultas = self.estatisticas["hits"] + self.estatisticas["misses"]
+            return {
+                "backend": type(self).__name__,
+                "ttl": self.ttl,
+                "tamanho": len(self),
+                "tamanho_max": self.tamanho_max,
+                **self.estatisticas,
+                "taxa_hits": round(self.estatisticas["hits"] / consultas, 4) if consultas else None,
+            }
+
+
+class CacheMemoria(CacheNulo):
+    """TTL + LRU em um OrderedDict (o item mais antigo sai quando passa de `tamanho_max`)."""
+
+    def __init__(self, ttl: float = 10, tamanho_max: int = 256):
+        super().__init__(ttl, tamanho_max)
+        self._itens: OrderedDict = OrderedDict()
+
+    def obter(self, chave) -> Optional[EntradaCache]:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._itens[chave]
+                self.estatisticas["misses"] += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.estatisticas["hits"] += 1
+            return item[1]
+
+    def guardar(self, chave, entrada: EntradaCache, geracao: int) -> None:
+        with self._lock:
+            if geracao != self.geracao:
+                return  # houve escrita enquanto o valor era calculado
+            self._itens[chave] = (time.monotonic() + self.ttl, entrada)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_max:
+                self._itens.popitem(last=False)
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self._itens.clear()
+        super().invalidar()
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+
+BACKENDS = {"memoria": CacheMemoria, "nenhum": CacheNulo}
+
+
+def criar_cache(backend: str, ttl: float, tamanho_max: int) -> CacheNulo:
+    if backend not in BACKENDS:
+        raise ValueError(f"CACHE_BACKEND desconhecido: {backend} (opções: {', '.join(BACKENDS)})")
+    return BACKENDS[backend](ttl=ttl, tamanho_max=tamanho_max)
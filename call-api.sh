@@ -2,6 +2,8 @@
 # cronjob para chamar a API do cliente para envio de relatórios
 # 1,5 12 * * 1-5 /opt/descall/call-api.sh
 # 30,45 18 * * 1-5 /opt/descall/call-api.sh
+# Alternativa sem cron: manter `python3 cliente.py --escutar` rodando (ex.: serviço systemd),
+# que recebe as tarefas pelo stream /api/tarefas/stream assim que são criadas
 
 
 PROJETO_DIR="/opt/descall"
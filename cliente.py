@@ -1,49 +1,47 @@
+import argparse
+import json
 import logging
+import time
 import requests
 import datetime
 import subprocess
+import socket
+import threading
 import os
 from dotenv import load_dotenv
 from typing import Optional
+from agendador import Agendador, Job
+from relator import obter_relator
 
 # Carrega variáveis de ambiente
 load_dotenv(override=True)
 
 URL = os.getenv("URL_API")
 SCRIPT_ALVO = os.getenv("SCRIPT_PONTO")
+# Identifica este agente na reserva de tarefas (vários Ubuntus podem consultar a API)
+AGENTE_ID = os.getenv("AGENTE_ID") or socket.gethostname()
+# Modo --escutar: espera máxima entre reconexões do stream (segundos)
+STREAM_RECONEXAO_MAX = int(os.getenv("STREAM_RECONEXAO_MAX", "60"))
+# "interno" (agendador.py, disparado pelo `--escutar`) ou "at" (legado)
+AGENDADOR = os.getenv("AGENDADOR", "interno")
 
 # Logging básico (mantém configuração simples)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
 
 
-def post_json(session: requests.Session, path: str, payload: dict, timeout: int = 6) -> tuple[bool, Optional[object]]:
-    """Faz POST e retorna (sucesso, json_ou_text).
-    Retorna (False, error_text) em falha.
-    """
-    if not URL:
-        logger.error("URL_API não configurada")
-        return False, "URL_API not set"
-
-    url = f"{URL}{path}"
-    try:
-        resp = session.post(url, json=payload, timeout=timeout)
-        resp.raise_for_status()
-        try:
-            return True, resp.json()
-        except Exception:
-            return True, resp.text
-    except Exception as e:
-        logger.warning("Falha POST %s: %s", url, e)
-        return False, str(e)
-
-
 def fetch_agendamento(session: requests.Session) -> Optional[dict]:
+    """Reserva no servidor a próxima tarefa de hoje para este agente."""
     if not URL:
         logger.error("URL_API não configurada")
         return None
+    hoje = datetime.datetime.now().strftime("%Y-%m-%d")
     try:
-        resp = session.get(f"{URL}/api/consultar", timeout=6)
+        resp = session.post(
+            f"{URL}/api/reservar-tarefa",
+            json={"agente": AGENTE_ID, "data_execucao": hoje},
+            timeout=6,
+        )
         resp.raise_for_status()
         return resp.json()
     except Exception as e:
@@ -51,13 +49,19 @@ def fetch_agendamento(session: requests.Session) -> Optional[dict]:
         return None
 
 
-def validar_horario(data: str, hora: str, minuto: str) -> tuple[bool, str]:
-    """Retorna (ok, mensagem). ok=False quando horário é inválido ou passado."""
+def validar_horario(data: str, hora: str, minuto: str, executar_em: Optional[str] = None) -> tuple[bool, str]:
+    """Retorna (ok, mensagem). ok=False quando horário é inválido ou passado.
+    Usa `executar_em` (instante com fuso, calculado pelo servidor) quando disponível.
+    """
     try:
-        h = int(str(hora))
-        m = int(str(minuto))
-        agendamento_dt = datetime.datetime.strptime(f"{data} {h:02d}:{m:02d}", "%Y-%m-%d %H:%M")
-        agora = datetime.datetime.now()
+        if executar_em:
+            agendamento_dt = datetime.datetime.fromisoformat(executar_em)
+            agora = datetime.datetime.now(datetime.timezone.utc)
+        else:
+            h = int(str(hora))
+            m = int(str(minuto))
+            agendamento_dt = datetime.datetime.strptime(f"{data} {h:02d}:{m:02d}", "%Y-%m-%d %H:%M")
+            agora = datetime.datetime.now()
         if agendamento_dt <= agora:
             return False, f"horario passado ({agendamento_dt.isoformat()})"
         return True, ""
@@ -65,8 +69,10 @@ def validar_horario(data: str, hora: str, minuto: str) -> tuple[bool, str]:
         return False, f"dados de horário inválidos: {e}"
 
 
-def agendar_via_at(hora: str, minuto: str) -> bool:
-    """Agenda o `SCRIPT_ALVO` via `at`. Retorna True se agendado com sucesso."""
+def agendar_via_at(hora: str, minuto: str, tarefa_id: Optional[int] = None) -> bool:
+    """Agenda o `SCRIPT_ALVO` via `at` (modo legado, precisão de minutos). Retorna True se agendado com sucesso.
+    `tarefa_id` é repassado ao script como TAREFA_ID para que ele confirme por id.
+    """
     if not SCRIPT_ALVO:
         logger.error("Variável SCRIPT_PONTO não definida")
         return False
@@ -74,7 +80,8 @@ def agendar_via_at(hora: str, minuto: str) -> bool:
         logger.error("Hora ou minuto não informados")
         return False
 
-    comando = f'echo "{SCRIPT_ALVO}" | at {int(hora):02d}:{int(minuto):02d}'
+    alvo = f"TAREFA_ID={int(tarefa_id)} {SCRIPT_ALVO}" if tarefa_id is not None else SCRIPT_ALVO
+    comando = f'echo "{alvo}" | at {int(hora):02d}:{int(minuto):02d}'
     logger.info("Executando: %s", comando)
     try:
         proc = subprocess.run(comando, shell=True, capture_output=True, text=True)
@@ -89,58 +96,199 @@ def agendar_via_at(hora: str, minuto: str) -> bool:
         return False
 
 
-def reportar_servidor(session: requests.Session, status: str, msgsucesso: Optional[str] = None) -> bool:
-    """Envia status final para o endpoint /api/confirmar-execucao."""
-    payload = {"status": status}
-    if msgsucesso is not None:
-        payload["msgsucesso"] = msgsucesso
-    ok, _ = post_json(session, "/api/confirmar-execucao", payload)
-    return ok
+def executar_script(job: Job) -> None:
+    """Dispara `SCRIPT_ALVO` com TAREFA_ID no ambiente e acompanha seu término.
+
+    Roda por `bash -c`, como no `at`: SCRIPT_PONTO pode ter sintaxe de shell
+    (ex.: `cd /opt/descall && . venv/bin/activate && python login-ia.py`).
+    """
+    env = dict(os.environ)
+    if job.tarefa_id is not None:
+        env["TAREFA_ID"] = str(job.tarefa_id)
+    proc = subprocess.Popen(["bash", "-c", SCRIPT_ALVO], env=env)
+    logger.info("Script iniciado (pid %d) para %s", proc.pid, job.chave)
 
+    def aguardar_fim():
+        logger.info("Script de %s terminou com código %s", job.chave, proc.wait())
 
-def main() -> None:
-    if not URL:
-        logger.error("URL_API não definida. Ex: export URL_API=http://127.0.0.1:8000")
-        return
+    threading.Thread(target=aguardar_fim, name=f"script-{proc.pid}", daemon=True).start()
 
-    session = requests.Session()
 
+def job_perdido(job: Job) -> None:
+    reportar_servidor("falha", "horário perdido (agente fora do ar)", job.tarefa_id)
+
+
+agendador = Agendador(disparar=executar_script, ao_perder=job_perdido)
+
+
+def agendar_execucao(
+    data: str, hora: str, minuto: str, tarefa_id: Optional[int] = None, executar_em: Optional[str] = None
+) -> bool:
+    """Agenda a execução de `SCRIPT_ALVO` no agendador interno ou, com AGENDADOR=at
+    (ou sem um `cliente.py --escutar` ativo para disparar), via `at`.
+    """
+    if not SCRIPT_ALVO:
+        logger.error("Variável SCRIPT_PONTO não definida")
+        return False
+    if AGENDADOR == "at":
+        return agendar_via_at(hora, minuto, tarefa_id)
+    if not agendador.ativo():
+        logger.warning("Agendador interno inativo (cliente.py --escutar não está rodando); usando at")
+        return agendar_via_at(hora, minuto, tarefa_id)
+    job = Job.para(data, hora, minuto, tarefa_id=tarefa_id)
+    if executar_em:
+        job.quando = datetime.datetime.fromisoformat(executar_em).timestamp()
+    agendador.agendar(job)
+    return True
+
+
+def reportar_servidor(status: str, msgsucesso: Optional[str] = None, tarefa_id: Optional[int] = None) -> None:
+    """Enfileira o status para /api/confirmar-execucao (envio em segundo plano, ver relator.py)."""
+    obter_relator(URL, "cliente").reportar(status, msgsucesso, tarefa_id)
+
+
+def processar_tarefa(session: requests.Session) -> bool:
+    """Reserva a próxima tarefa de hoje e agenda sua execução.
+    Retorna True se havia uma tarefa para processar.
+    """
     dados = fetch_agendamento(session)
     if not dados:
         logger.info("Nenhuma configuração encontrada ou erro ao consultar")
-        return
+        return False
 
     hoje = datetime.datetime.now().strftime("%Y-%m-%d")
+    tarefa_id = dados.get("id")
     data_agendada = dados.get("data_para_execucao")
     ja_executou = dados.get("executou_sucesso")
-    logger.info("Agendado: %s | Hoje: %s | Já feito? %s", data_agendada, hoje, ja_executou)
+    logger.info("Tarefa %s | Agendado: %s | Hoje: %s | Já feito? %s", tarefa_id, data_agendada, hoje, ja_executou)
 
     if data_agendada != hoje or ja_executou:
         logger.info("Não é hora de executar ou já foi feito.")
-        return
+        return True
 
     hora = dados.get("hora")
     minuto = dados.get("minuto")
 
-    ok, msg = validar_horario(data_agendada, hora, minuto)
+    executar_em = dados.get("executar_em")
+    ok, msg = validar_horario(data_agendada, hora, minuto, executar_em)
     if not ok:
         logger.warning("Validação falhou: %s", msg)
-        post_json(session, "/api/agendar", {"status": "falha", "msgsucesso": msg})
-        reportar_servidor(session, "falha", msg)
+        reportar_servidor("falha", msg, tarefa_id)
+        return True
+
+    # A tarefa já está reservada para este agente (por id); não é preciso re-agendá-la na API
+    agendado_ok = agendar_execucao(data_agendada, hora, minuto, tarefa_id, executar_em)
+    if agendado_ok:
+        reportar_servidor("agendado", f"agendado para {data_agendada} {int(hora):02d}:{int(minuto):02d}", tarefa_id)
+    else:
+        reportar_servidor("falha", "erro ao agendar", tarefa_id)
+    return True
+
+
+def processar_pendentes(session: requests.Session) -> None:
+    """Processa todas as tarefas de hoje disponíveis para este agente.
+    Cada reserva tira a tarefa da fila, então o laço termina quando não há mais nenhuma.
+    """
+    while processar_tarefa(session):
+        pass
+
+
+def ler_eventos_sse(resp: requests.Response):
+    """Itera os eventos (id, tipo, dados) de uma resposta text/event-stream."""
+    evento_id, tipo, dados = None, "message", []
+    for linha in resp.iter_lines(decode_unicode=True):
+        if linha is None:
+            continue
+        if not linha:
+            if dados:
+                yield evento_id, tipo, "\n".join(dados)
+            tipo, dados = "message", []
+            continue
+        if linha.startswith(":"):
+            continue  # comentário (keep-alive)
+        campo, _, valor = linha.partition(":")
+        valor = valor[1:] if valor.startswith(" ") else valor
+        if campo == "id":
+            evento_id = valor
+        elif campo == "event":
+            tipo = valor
+        elif campo == "data":
+            dados.append(valor)
+
+
+def escutar(session: requests.Session) -> None:
+    """Mantém aberto o stream /api/tarefas/stream e processa cada tarefa nova na hora.
+
+    Reconecta com espera exponencial (até STREAM_RECONEXAO_MAX) retomando do último
+    evento recebido, e ao (re)conectar processa o que ficou pendente nesse intervalo.
+    Também mantém a thread do agendador interno, que dispara as tarefas agendadas.
+    """
+    if AGENDADOR != "at":
+        agendador.iniciar()
+    ultimo_id = None
+    espera = 1
+    while True:
+        headers = {"Accept": "text/event-stream"}
+        if ultimo_id:
+            headers["Last-Event-ID"] = ultimo_id
+        try:
+            # timeout=(conexão, leitura): a leitura precisa exceder o keep-alive do servidor
+            with session.get(
+                f"{URL}/api/tarefas/stream", params={"agente": AGENTE_ID}, headers=headers, stream=True, timeout=(6, 90)
+            ) as resp:
+                resp.raise_for_status()
+                logger.info("Conectado ao stream de tarefas (agente=%s)", AGENTE_ID)
+                espera = 1
+                processar_pendentes(session)
+                for evento_id, tipo, dados in ler_eventos_sse(resp):
+                    ultimo_id = evento_id or ultimo_id
+                    if tipo != "tarefa":
+                        continue
+                    tarefa = json.loads(dados)
+                    logger.info("Evento: tarefa %s status=%s", tarefa.get("id"), tarefa.get("status"))
+                    # Só tarefas novas/reagendadas; as demais mudanças são de tarefas já reservadas
+                    if tarefa.get("status") == "criado":
+                        processar_pendentes(session)
+        except Exception as e:
+            logger.warning("Stream de tarefas interrompido: %s (reconectando em %ds)", e, espera)
+        time.sleep(espera)
+        espera = min(espera * 2, STREAM_RECONEXAO_MAX)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Agente que consulta e agenda as tarefas de ponto.")
+    parser.add_argument(
+        "--escutar", action="store_true", help="mantém conexão com o stream da API em vez de uma consulta única (cron)"
+    )
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument("--listar-agendados", action="store_true", help="lista os jobs do agendador interno")
+    modo.add_argument("--cancelar", metavar="CHAVE", help='cancela o job "YYYY-MM-DD HH:MM" do agendador interno')
+    args = parser.parse_args()
+
+    if args.listar_agendados:
+        print(json.dumps([j.resumo() for j in agendador.listar()], ensure_ascii=False, indent=2))
+        return
+    if args.cancelar:
+        job = agendador.cancelar(args.cancelar)
+        if job is None:
+            logger.error("Nenhum job agendado para %s", args.cancelar)
+            return
+        if job.tarefa_id is not None and URL:
+            reportar_servidor("cancelado", "cancelado no agente", job.tarefa_id)
+            obter_relator(URL, "cliente").esvaziar()
         return
 
-    # cria/atualiza registro de agendamento usando o campo `data_execucao` esperado pela API
-    post_json(session, "/api/agendar", {"hora": hora, "minuto": minuto, "data_execucao": data_agendada, "status": "criado"})
+    if not URL:
+        logger.error("URL_API não definida. Ex: export URL_API=http://127.0.0.1:8000")
+        return
 
-    agendado_ok = agendar_via_at(hora, minuto)
-    if agendado_ok:
-        # Atualiza status para `agendado` no endpoint de confirmação (servidor aplica update)
-        post_json(session, "/api/confirmar-execucao", {"status": "agendado", "msgsucesso": "agendado no at"})
-        reportar_servidor(session, "agendado", "agendado no at")
+    session = requests.Session()
+    if args.escutar:
+        escutar(session)
     else:
-        post_json(session, "/api/confirmar-execucao", {"status": "falha", "msgsucesso": "erro ao agendar"})
-        reportar_servidor(session, "falha", "erro ao agendar")
+        processar_tarefa(session)
+        obter_relator(URL, "cliente").esvaziar()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
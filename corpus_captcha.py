@@ -0,0 +1,154 @@
+"""Corpus opcional de CAPTCHAs e screenshots do login-ia.py, para bancada offline.
+
+Ligado por CORPUS_DIR. Cada imagem é guardada por conteúdo (sha256) — CAPTCHAs
+em CORPUS_DIR/imagens, screenshots em CORPUS_DIR/capturas — e os fatos sobre
+ela (resposta do resolvedor, resultado do login, nome do screenshot) vão como
+linhas em CORPUS_DIR/indice.jsonl. Cada diretório tem seu limite
+(CORPUS_TAMANHO_MAX_MB e CORPUS_CAPTURAS_MAX_MB): quando passa dele, as imagens
+menos recentes daquele diretório são removidas e o índice é reescrito sem elas,
+então screenshots (maiores e mais frequentes) nunca expulsam CAPTCHAs rotulados.
+
+CAPTCHAs cujo login deu certo viram amostras rotuladas para
+`python resolvedores_captcha.py replay CORPUS_DIR`.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CORPUS_DIR = os.getenv("CORPUS_DIR")  # vazio = desligado
+CORPUS_TAMANHO_MAX_MB = float(os.getenv("CORPUS_TAMANHO_MAX_MB", "200"))  # CAPTCHAs
+CORPUS_CAPTURAS_MAX_MB = float(os.getenv("CORPUS_CAPTURAS_MAX_MB", "100"))  # screenshots
+
+
+class Corpus:
+    def __init__(
+        self,
+        diretorio,
+        tamanho_max_mb: float = CORPUS_TAMANHO_MAX_MB,
+        capturas_max_mb: float = CORPUS_CAPTURAS_MAX_MB,
+    ):
+        self.diretorio = Path(diretorio)
+        self.imagens = self.diretorio / "imagens"
+        self.capturas = self.diretorio / "capturas"
+        self.indice = self.diretorio / "indice.jsonl"
+        self.tamanho_max = int(tamanho_max_mb * 1024 * 1024)
+        self.capturas_max = int(capturas_max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.imagens.mkdir(parents=True, exist_ok=True)
+        self.capturas.mkdir(exist_ok=True)
+
+    def _anotar(self, **campos) -> None:
+        campos["quando"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with self.indice.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(campos, ensure_ascii=False) + "\n")
+
+    def _guardar(self, diretorio: Path, conteudo: bytes, extensao: str = ".png") -> str:
+        chave = hashlib.sha256(conteudo).hexdigest()
+        caminho = diretorio / f"{chave}{extensao}"
+        if caminho.exists():
+            caminho.touch()  # conta como recente para a rotação
+        else:
+            temporario = caminho.with_suffix(".tmp")
+            temporario.write_bytes(conteudo)
+            temporario.replace(caminho)
+        return chave
+
+    def registrar_captcha(self, imagem: bytes, resposta=None) -> str:
+        """Guarda a imagem e a resposta do resolvedor (`Resposta` ou None). Retorna a chave."""
+        with self._lock:
+            chave = self._guardar(self.imagens, imagem)
+            campos = {"chave": chave, "tipo": "captcha"}
+            if resposta is not None:
+                campos.update(
+                    resposta=resposta.texto,
+                    resolvedor=resposta.resolvedor,
+                    confianca=round(resposta.confianca, 4),
+                    duracao_ms=round(resposta.duracao * 1000, 1),
+                )
+            self._anotar(**campos)
+            self._rotacionar(self.imagens, self.tamanho_max)
+        return chave
+
+    def registrar_resultado(self, chave: str, resultado: str) -> None:
+        """Anota o resultado do login ("sucesso"/"falha") para o CAPTCHA `chave`."""
+        with self._lock:
+            self._anotar(chave=chave, resultado=resultado)
+
+    def registrar_captura(self, nome: str, png: bytes) -> str:
+        """Guarda um screenshot (ex.: "01_pre_login") sem sobrescrever os anteriores."""
+        with self._lock:
+            chave = self._guardar(self.capturas, png)
+            self._anotar(chave=chave, tipo="captura", nome=nome)
+            self._rotacionar(self.capturas, self.capturas_max)
+        return chave
+
+    def entradas(self) -> dict:
+        """Junta as linhas do índice por chave (o último valor de cada campo prevalece)."""
+        entradas = {}
+        if not self.indice.exists():
+            return entradas
+        with self.indice.open(encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    campos = json.loads(linha)
+                except ValueError:
+                    continue  # linha truncada por uma escrita interrompida
+                entradas.setdefault(campos["chave"], {}).update(campos)
+        return entradas
+
+    def amostras_rotuladas(self) -> list:
+        """(caminho, resposta) dos CAPTCHAs cujo login deu certo (ou com `rotulo` manual)."""
+        amostras = []
+        for chave, e in self.entradas().items():
+            if e.get("tipo") != "captcha":
+                continue
+            rotulo = e.get("rotulo") or (e.get("resposta") if e.get("resultado") == "sucesso" else None)
+            caminho = self.imagens / f"{chave}.png"
+            if rotulo and caminho.exists():
+                amostras.append((caminho, rotulo))
+        return amostras
+
+    def _rotacionar(self, diretorio: Path, tamanho_max: int) -> None:
+        arquivos = [(p.stat().st_mtime, p.stat().st_size, p) for p in diretorio.glob("*.png")]
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        if total <= tamanho_max:
+            return
+        removidas = set()
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= tamanho_max:
+                break
+            caminho.unlink(missing_ok=True)
+            removidas.add(caminho.stem)
+            total -= tamanho
+        linhas = self.indice.read_text(encoding="utf-8").splitlines(keepends=True) if self.indice.exists() else []
+        temporario = self.indice.with_suffix(".tmp")
+        with temporario.open("w", encoding="utf-8") as f:
+            for linha in linhas:
+                try:
+                    if json.loads(linha)["chave"] in removidas:
+                        continue
+                except (ValueError, KeyError):
+                    continue
+                f.write(linha)
+        temporario.replace(self.indice)
+        logger.info(
+            "Corpus: %d imagens antigas removidas de %s (limite %d MB)", len(removidas), diretorio.name, tamanho_max // 2**20
+        )
+
+
+_corpus: Optional[Corpus] = None
+
+
+def obter_corpus() -> Optional[Corpus]:
+    """Corpus configurado em CORPUS_DIR, ou None se a gravação está desligada."""
+    global _corpus
+    if _corpus is None and CORPUS_DIR:
+        _corpus = Corpus(CORPUS_DIR)
+    return _corpus
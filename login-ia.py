@@ -1,21 +1,26 @@
 import time
 import os
+import argparse
+import json
 import logging
+import socket
+import socketserver
+import sys
+import threading
 import requests
 import base64
+import random
+import shutil
 import urllib3
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.service import Service
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.firefox import GeckoDriverManager
-import google.generativeai as genai
 import re
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Optional
 import datetime
+from corpus_captcha import obter_corpus
+from motor_http import ClienteSite, SessaoExpirada, SiteIncompativel, api_padrao
+from relator import obter_relator
+from resolvedores_captcha import CAPTCHA_RESOLVEDORES, criar_resolvedor
 
 # Logging configuration
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
@@ -30,9 +35,55 @@ URL_SITE = os.getenv("URL_SITE")
 URL_API = os.getenv("URL_API")
 USUARIO = os.getenv("PONTO_USER")
 SENHA = os.getenv("PONTO_PASS")
-API_KEY = os.getenv("GOOGLE_API_KEY")
 FIREFOX_PROFILE_PATH = os.getenv("FIREFOX_PROFILE_PATH")
 HEADLESS = os.getenv("HEADLESS", "1")
+# Id da tarefa reservada pelo cliente.py (repassado via `at`); ausente = tarefa mais recente
+TAREFA_ID = os.getenv("TAREFA_ID")
+# Motor do registro: "selenium" (Firefox) ou "http" (chamadas diretas à API do site,
+# ver motor_http.py); se a API não responder como esperado, o http volta para o Selenium
+MOTOR_REGISTRO = os.getenv("MOTOR_REGISTRO", "selenium")
+MOTOR_FALLBACK_SELENIUM = os.getenv("MOTOR_FALLBACK_SELENIUM", "1") != "0"
+SITE_API_URL = os.getenv("SITE_API_URL") or api_padrao(URL_SITE)
+# Com RESULTADO_ARQUIVO, os relatórios vão para esse JSON em vez do servidor: quem
+# chamou (ex.: multicontas.py) junta os resultados de várias contas em um relatório só
+RESULTADO_ARQUIVO = os.getenv("RESULTADO_ARQUIVO")
+
+# Daemon (--daemon): Firefox mantido aberto e logado, recebendo jobs por socket Unix
+DAEMON_SOCKET = os.getenv("DAEMON_SOCKET", "/tmp/descall-navegador.sock")
+DAEMON_MAX_JOBS = int(os.getenv("DAEMON_MAX_JOBS", "20"))  # recicla o navegador após N jobs
+DAEMON_KEEPALIVE = int(os.getenv("DAEMON_KEEPALIVE", "600"))  # segundos entre checagens/recargas
+
+# GeckoDriver: caminho fixo (GECKODRIVER_PATH) ou resolvido pelo webdriver_manager e
+# guardado em cache por GECKODRIVER_CACHE_TTL segundos. GECKODRIVER_OFFLINE=1 nunca usa a rede.
+GECKODRIVER_PATH = os.getenv("GECKODRIVER_PATH")
+GECKODRIVER_OFFLINE = os.getenv("GECKODRIVER_OFFLINE", "0") == "1"
+GECKODRIVER_CACHE = Path(os.getenv("GECKODRIVER_CACHE", Path.home() / ".cache" / "descall" / "geckodriver.json"))
+GECKODRIVER_CACHE_TTL = int(os.getenv("GECKODRIVER_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Selenium e webdriver_manager só são importados ao abrir o navegador (carregar_selenium):
+# execuções pelo motor http, ou que terminam antes do navegador, não pagam a importação
+webdriver = By = Service = Options = WebDriverWait = TimeoutException = EC = GeckoDriverManager = None
+
+
+def carregar_selenium() -> None:
+    global webdriver, By, Service, Options, WebDriverWait, TimeoutException, EC, GeckoDriverManager
+    if webdriver is not None:
+        return
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.firefox.service import Service
+    from selenium.webdriver.firefox.options import Options
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.support import expected_conditions as EC
+    from webdriver_manager.firefox import GeckoDriverManager
+
+
+def eh_timeout_selenium(e: BaseException) -> bool:
+    """`e` é um TimeoutException do Selenium? (Sem importá-lo: se não foi carregado, não é.)"""
+    excecoes = sys.modules.get("selenium.common.exceptions")
+    return excecoes is not None and isinstance(e, excecoes.TimeoutException)
+
 
 # --- 2. SELETORES (XPATH) ---
 XPATHS = {
@@ -44,11 +95,186 @@ XPATHS = {
     "menu_frequencia": "//a[@href='#/frequencia-ponto']",
     "submenu_registrar": "//a[@href='#/frequencia-ponto/registrar-ponto']",
     # Botão final verde de registrar
-    "btn_final_registrar": "//button[contains(@class, 'btn-success') and contains(., 'Registrar Frequência')]" 
+    "btn_final_registrar": "//button[contains(@class, 'btn-success') and contains(., 'Registrar Frequência')]",
+    # Aviso (toast) de sucesso exibido após o registro
+    "toast_sucesso": "//*[contains(@class, 'toast-success') or contains(@class, 'alert-success')]",
+}
+# Linhas da tabela de registros de ponto
+CSS_LINHAS_TABELA = "table.table tbody tr"
+
+# --- 3. ESPERAS ---
+# Cada etapa espera uma condição de prontidão (nunca uma pausa fixa); o limite de cada
+# uma pode ser ajustado por TIMEOUT_<ETAPA> (segundos), ex.: TIMEOUT_LOGIN=45
+TIMEOUTS = {
+    etapa: float(os.getenv(f"TIMEOUT_{etapa.upper()}", padrao))
+    for etapa, padrao in {
+        "pagina": 20,  # site aberto: menu (já logado) ou formulário de login
+        "login": 30,  # menu após clicar em ACESSAR
+        "navegacao": 15,  # menus/submenus clicáveis
+        "registro": 15,  # botão final de registro
+        "confirmacao": 10,  # toast de sucesso (opcional: segue sem ele)
+        "tabela": 20,  # linhas da tabela de registros
+    }.items()
 }
+# Retentativas de `registrar`: espera exponencial com jitter entre RETRY_BASE e RETRY_MAX
+RETRY_BASE = float(os.getenv("RETRY_BASE", "5"))
+RETRY_MAX = float(os.getenv("RETRY_MAX", "60"))
+
+# Verdadeiro quando o Angular (2+ ou AngularJS) não tem requisições/renderização pendentes
+JS_ANGULAR_OCIOSO = """
+if (window.getAllAngularTestabilities) {
+    return window.getAllAngularTestabilities().every(function (t) { return t.isStable(); });
+}
+if (window.angular) {
+    var injetor = window.angular.element(document.body).injector();
+    return !injetor || injetor.get('$http').pendingRequests.length === 0;
+}
+return document.readyState === 'complete';
+"""
+
+
+def angular_ocioso(driver) -> bool:
+    try:
+        return bool(driver.execute_script(JS_ANGULAR_OCIOSO))
+    except Exception:
+        return False
+
+
+def aguardar(driver, etapa, *condicoes, obrigatorio=True):
+    """Espera até todas as `condicoes(driver)` serem verdadeiras (avaliadas em ordem).
+
+    O limite vem de TIMEOUTS[etapa]. Retorna o valor da última condição (ex.: o
+    elemento de `EC.element_to_be_clickable`). Com `obrigatorio=False`, um timeout
+    só gera aviso e retorna None.
+    """
+    def pronto(d):
+        resultado = True
+        for condicao in condicoes:
+            resultado = condicao(d)
+            if not resultado:
+                return False
+        return resultado
+
+    try:
+        return WebDriverWait(driver, TIMEOUTS[etapa], poll_frequency=0.2).until(pronto, f"etapa '{etapa}'")
+    except TimeoutException:
+        if obrigatorio:
+            raise
+        logger.warning("Etapa '%s' não confirmada em %.1fs; seguindo", etapa, TIMEOUTS[etapa])
+        return None
+
+
+def espera_retentativa(tentativa: int) -> float:
+    """Segundos até a próxima tentativa: RETRY_BASE * 2^(n-1), limitado a RETRY_MAX,
+    com jitter na metade superior (tentativas de vários agentes não coincidem)."""
+    teto = min(RETRY_MAX, RETRY_BASE * 2 ** (tentativa - 1))
+    return teto / 2 + random.uniform(0, teto / 2)
+
+
+# --- 4. RASTREIO DE ETAPAS ---
+# Cada etapa do fluxo vira uma linha JSON em ETAPAS_ARQUIVO e segue no relatório
+# final ao servidor, que agrega p50/p95 por etapa (/api/etapas/resumo)
+ETAPAS_ARQUIVO = Path(os.getenv("ETAPAS_ARQUIVO", "log/etapas.jsonl"))
+
+
+class Rastreio:
+    """Etapas cronometradas de uma chamada a `registrar` (todas as tentativas)."""
+
+    def __init__(self):
+        self.reiniciar()
+
+    def reiniciar(self, tarefa_id=None) -> None:
+        self.etapas = []
+        self.tentativa = 1
+        self.tarefa_id = tarefa_id
+
+    @contextmanager
+    def etapa(self, nome: str):
+        """Cronometra o bloco. O resultado é "ok", "timeout" ou "erro" (exceção), ou o
+        que o bloco definir em `registro["resultado"]` (ex.: "falha").
+        """
+        inicio = datetime.datetime.now(datetime.timezone.utc)
+        t0 = time.perf_counter()
+        registro = {"etapa": nome, "tentativa": self.tentativa, "inicio": inicio.isoformat(), "resultado": "ok"}
+        try:
+            yield registro
+        except Exception as e:
+            if eh_timeout_selenium(e):
+                registro["resultado"] = "timeout"
+            else:
+                registro["resultado"] = "erro"
+                registro["detalhe"] = f"{type(e).__name__}: {e}"[:200]
+            raise
+        finally:
+            registro["duracao_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            self.etapas.append(registro)
+            logger.info("Etapa %s: %s em %.0f ms", nome, registro["resultado"], registro["duracao_ms"])
+            try:
+                ETAPAS_ARQUIVO.parent.mkdir(parents=True, exist_ok=True)
+                with ETAPAS_ARQUIVO.open("a", encoding="utf-8") as f:
+                    f.write(json.dumps({**registro, "tarefa_id": self.tarefa_id}, ensure_ascii=False) + "\n")
+            except OSError:
+                logger.debug("Falha ao gravar %s", ETAPAS_ARQUIVO)
+
+
+rastreio = Rastreio()
+
+
+def _ler_cache_geckodriver() -> Optional[dict]:
+    try:
+        dados = json.loads(GECKODRIVER_CACHE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not dados.get("path") or not os.access(dados["path"], os.X_OK):
+        return None
+    return dados
+
+
+def _gravar_cache_geckodriver(caminho: str) -> None:
+    versao = re.search(r"v?(\d+\.\d+\.\d+)", caminho)
+    dados = {"path": caminho, "versao": versao.group(1) if versao else None, "resolvido_em": time.time()}
+    try:
+        GECKODRIVER_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        GECKODRIVER_CACHE.write_text(json.dumps(dados), encoding="utf-8")
+    except OSError:
+        logger.warning("Não foi possível gravar o cache do geckodriver em %s", GECKODRIVER_CACHE)
+
+
+def resolver_geckodriver() -> str:
+    """Caminho do geckodriver, consultando a rede (GitHub) só quando necessário.
+
+    Ordem: GECKODRIVER_PATH; cache ainda válido; webdriver_manager (online), que
+    renova o cache. Se a rede falhar, ou em modo offline, usa o cache mesmo
+    expirado ou um `geckodriver` do PATH.
+    """
+    if GECKODRIVER_PATH:
+        return GECKODRIVER_PATH
+
+    cache = _ler_cache_geckodriver()
+    if cache and (GECKODRIVER_OFFLINE or time.time() - cache.get("resolvido_em", 0) < GECKODRIVER_CACHE_TTL):
+        logger.debug("geckodriver em cache: %s (versão %s)", cache["path"], cache.get("versao"))
+        return cache["path"]
+
+    if not GECKODRIVER_OFFLINE:
+        try:
+            caminho = GeckoDriverManager().install()
+            _gravar_cache_geckodriver(caminho)
+            return caminho
+        except Exception as e:
+            logger.warning("Falha ao resolver geckodriver pela rede: %s", e)
+
+    if cache:
+        logger.info("Usando geckodriver do cache expirado: %s", cache["path"])
+        return cache["path"]
+    no_path = shutil.which("geckodriver")
+    if no_path:
+        return no_path
+    raise RuntimeError("geckodriver não encontrado (defina GECKODRIVER_PATH ou rode uma vez com rede)")
+
 
 def setup_driver():
     """Configura o Firefox (GeckoDriver)."""
+    carregar_selenium()
     firefox_options = Options()        
     # Adiciona o argumento para usar esse perfil específico, se informado
     if FIREFOX_PROFILE_PATH:
@@ -83,51 +309,77 @@ def setup_driver():
         firefox_options.add_argument("--headless")
 
     # --- 4. Inicialização do Driver ---
-    service = Service(GeckoDriverManager().install())
+    service = Service(resolver_geckodriver())
 
     return webdriver.Firefox(service=service, options=firefox_options)
 
+_resolvedor = None
+
+
+def obter_resolvedor():
+    """Cascata de resolvedores (CAPTCHA_RESOLVEDORES), criada uma vez por processo."""
+    global _resolvedor
+    if _resolvedor is None:
+        _resolvedor = criar_resolvedor()
+    return _resolvedor
+
+
+def obter_imagem_captcha(wait) -> Optional[bytes]:
+    """Localiza a imagem do CAPTCHA e devolve seus bytes (data URI ou download)."""
+    img_element = wait.until(EC.visibility_of_element_located((By.XPATH, XPATHS["captcha_img"])))
+    src_data = img_element.get_attribute('src')
+
+    if "data:image" in src_data:
+        return base64.b64decode(src_data.split(',')[1])
+    resp = requests.get(src_data, verify=False)
+    if resp.status_code == 200:
+        return resp.content
+    return None
+
+
+def captcha_resolvivel() -> bool:
+    """Há resolvedor disponível ou corpus para guardar a imagem?"""
+    if obter_resolvedor().disponivel() or obter_corpus() is not None:
+        return True
+    logger.warning("Nenhum resolvedor de CAPTCHA disponível (%s); pulando", CAPTCHA_RESOLVEDORES)
+    return False
+
+
+def resolver_imagem_captcha(image_bytes: bytes):
+    """Resolve a imagem do CAPTCHA (OCR local, com Gemini como fallback) e a guarda
+    no corpus. Retorna (texto_ou_None, chave_no_corpus_ou_None); a chave serve para
+    anotar depois o resultado do login quando CORPUS_DIR está ligado.
+    """
+    resolvedor = obter_resolvedor()
+    corpus = obter_corpus()
+    with rastreio.etapa("captcha") as etapa:
+        resposta = resolvedor.resolver(image_bytes) if resolvedor.disponivel() else None
+        if resposta is None:
+            etapa["resultado"] = "falha"
+    chave = corpus.registrar_captcha(image_bytes, resposta) if corpus else None
+    if resposta is None:
+        logger.warning("CAPTCHA não reconhecido por nenhum resolvedor")
+        return None, chave
+    logger.info("CAPTCHA identificado por %s: %s", resposta.resolvedor, resposta.texto)
+    return resposta.texto, chave
+
+
 def resolver_captcha(driver, wait):
-    """Localiza, baixa e resolve o CAPTCHA usando Gemini."""
+    """Localiza, baixa e resolve o CAPTCHA da página; ver `resolver_imagem_captcha`."""
     logger.info("Iniciando resolução de CAPTCHA")
     try:
-        if not API_KEY:
-            logger.warning("GOOGLE_API_KEY não configurada; pulando resolução por Gemini")
-            return None
-
-        genai.configure(api_key=API_KEY)
-        model = genai.GenerativeModel("models/gemini-flash-latest")
-
-        # Localizar imagem
-        img_element = wait.until(EC.visibility_of_element_located((By.XPATH, XPATHS["captcha_img"])))
-        src_data = img_element.get_attribute('src')
-        
-        image_bytes = None
-        if "data:image" in src_data:
-            base64_str = src_data.split(',')[1]
-            image_bytes = base64.b64decode(base64_str)
-        else:
-            resp = requests.get(src_data, verify=False)
-            if resp.status_code == 200:
-                image_bytes = resp.content
+        if not captcha_resolvivel():
+            return None, None
 
+        image_bytes = obter_imagem_captcha(wait)
         if not image_bytes:
             logger.error("Não foi possível obter bytes da imagem do CAPTCHA")
-            return None
-
-        # Enviar para Gemini
-        response = model.generate_content([
-            {"mime_type": "image/png", "data": image_bytes},
-            "Retorne APENAS os caracteres alfanuméricos desta imagem. Sem espaços, sem texto extra."
-        ])
-
-        texto_captcha = getattr(response, "text", "").strip()
-        logger.info("Gemini identificou captcha: %s", texto_captcha)
-        return texto_captcha
+            return None, None
+        return resolver_imagem_captcha(image_bytes)
 
     except Exception as e:
         logger.exception("Erro no módulo de Captcha: %s", e)
-        return None
+        return None, None
 
 def tirar_print(driver, nome_arquivo):
     """Salva um screenshot para auditoria (Essencial em Headless)."""
@@ -135,43 +387,70 @@ def tirar_print(driver, nome_arquivo):
     log_dir.mkdir(parents=True, exist_ok=True)
     nome = log_dir / f"debug_{nome_arquivo}.png"
     try:
-        driver.save_screenshot(str(nome))
+        png = driver.get_screenshot_as_png()
+        nome.write_bytes(png)
         logger.debug("Screenshot salvo: %s", nome)
+        corpus = obter_corpus()
+        if corpus:
+            corpus.registrar_captura(nome_arquivo, png)
     except Exception:
         logger.exception("Falha ao salvar screenshot %s", nome)
 
 
+# Uma única chamada ao navegador devolve a tabela inteira: [[data, dia, texto das marcas], ...]
+JS_TABELA_REGISTROS = """
+return Array.from(document.querySelectorAll(arguments[0]), function (tr) {
+    var tds = tr.querySelectorAll('td');
+    if (tds.length < 3) return null;
+    return [tds[0].innerText.trim(), tds[1].innerText.trim(), tds[2].innerText || tds[2].textContent || ''];
+}).filter(function (linha) { return linha !== null; });
+"""
+RE_HORARIO = re.compile(r"\b\d{2}:\d{2}\b")
+
+
+def ler_tabela_registros(driver) -> list:
+    """Lê a tabela de registros de ponto em um único `execute_script`.
+    Retorna uma lista de dicts {"data": "DD/MM/YYYY", "dia": str, "marcas": ["HH:MM", ...]}.
+    """
+    linhas = driver.execute_script(JS_TABELA_REGISTROS, CSS_LINHAS_TABELA) or []
+    logger.debug("Total de linhas encontradas na tabela: %d", len(linhas))
+    return [{"data": data, "dia": dia, "marcas": RE_HORARIO.findall(marcas)} for data, dia, marcas in linhas]
+
+
+def formatar_registro(registro: dict) -> str:
+    """Formata um registro como: DD/MM/YYYY DIA HH:MM [HH:MM ...]"""
+    return " ".join([registro["data"], registro["dia"], *registro["marcas"]])
+
+
 def extrair_linhas_tabela(driver):
     """Extrai todas as linhas da tabela de registros de ponto no formato:
     DD/MM/YYYY DIA HH:MM [HH:MM ...]
     Recebe o `driver` (Selenium) já posicionado na página com a tabela.
     Retorna uma lista de strings formatadas.
     """
-    resultados = []
     try:
-        rows = driver.find_elements(By.CSS_SELECTOR, "table.table tbody tr")
-        logger.debug("Total de linhas encontradas na tabela: %d", len(rows))
-        for i, row in enumerate(rows):
-            try:
-                tds = row.find_elements(By.TAG_NAME, "td")
-                if len(tds) < 3:
-                    continue
-                data = tds[0].text.strip()
-                dia = tds[1].text.strip()
-                # Extrai todos os horários no formato HH:MM do conteúdo da célula
-                marcas_text = tds[2].get_attribute('innerText') or tds[2].text                
-                horarios = re.findall(r"\b\d{2}:\d{2}\b", marcas_text)
-                if horarios:
-                    linha = f"{data} {dia} " + " ".join(horarios)
-                else:
-                    linha = f"{data} {dia}"
-                resultados.append(linha)
-            except Exception:
-                logger.debug("Erro ao processar linha %d", i)
-                continue
+        return [formatar_registro(r) for r in ler_tabela_registros(driver)]
     except Exception as e:
         logger.exception("Erro ao extrair linhas da tabela: %s", e)
-    return resultados
+    return []
+
+
+def linha_de_hoje(registros: list) -> Optional[str]:
+    """Linha formatada do registro de hoje (DD/MM/YYYY) ou None."""
+    hoje = datetime.date.today().strftime("%d/%m/%Y")
+    for registro in registros:
+        if registro["data"] == hoje:
+            linha = formatar_registro(registro)
+            logger.debug("Linha de hoje encontrada: %s", linha)
+            return linha
+    logger.debug("Linha de hoje (%s) não encontrada na tabela", hoje)
+    return None
+
+
+def marcas_de_hoje(registros: list) -> list:
+    """Marcas (HH:MM) do registro de hoje; lista vazia se ainda não há linha."""
+    hoje = datetime.date.today().strftime("%d/%m/%Y")
+    return next((r["marcas"] for r in registros if r["data"] == hoje), [])
 
 
 def extrair_linha_hoje(driver):
@@ -179,170 +458,203 @@ def extrair_linha_hoje(driver):
     no formato: DD/MM/YYYY DIA HH:MM [HH:MM ...] ou None se não encontrada.
     """
     try:
-        hoje = datetime.date.today().strftime("%d/%m/%Y")
-        rows = driver.find_elements(By.CSS_SELECTOR, "table.table tbody tr")
-        logger.debug("Procurando linha de hoje: %s entre %d linhas", hoje, len(rows))
-        for i, row in enumerate(rows):
-            try:
-                tds = row.find_elements(By.TAG_NAME, "td")
-                if len(tds) < 3:
-                    continue
-                data = tds[0].text.strip()
-                if data != hoje:
-                    continue
-                dia = tds[1].text.strip()
-                marcas_text = tds[2].get_attribute('innerText') or tds[2].text
-                horarios = re.findall(r"\b\d{2}:\d{2}\b", marcas_text)
-                if horarios:
-                    linha = f"{data} {dia} " + " ".join(horarios)
-                else:
-                    linha = f"{data} {dia}"
-                logger.debug("Linha de hoje encontrada (idx %d): %s", i, linha)
-                return linha
-            except Exception:
-                continue
+        return linha_de_hoje(ler_tabela_registros(driver))
     except Exception as e:
         logger.exception("Erro ao buscar linha de hoje: %s", e)
     return None
 
-def reportar_servidor(status, msgsucesso=None, sucesso: bool = None):
-    """Reporta o status para o servidor.
+
+def nova_marcacao(antes: list):
+    """Condição de espera: a tabela mostra uma marcação de hoje que não estava em
+    `antes` (mais marcas, ou um HH:MM novo). Só a presença da tabela não basta:
+    ela já estava na tela antes do clique.
+    """
+    def condicao(driver) -> bool:
+        try:
+            marcas = marcas_de_hoje(ler_tabela_registros(driver))
+        except Exception:
+            return False
+        return len(marcas) > len(antes) or bool(set(marcas) - set(antes))
+
+    return condicao
+
+
+def gravar_linha_hoje(linha_hoje: Optional[str]) -> None:
+    """Grava a linha de hoje em log/linha_hoje_ponto.txt para revisão posterior."""
+    log_dir = Path("log")
+    log_dir.mkdir(parents=True, exist_ok=True)
+    out_file = log_dir / "linha_hoje_ponto.txt"
+    try:
+        with out_file.open("w", encoding="utf-8") as f:
+            f.write((linha_hoje or "") + "\n")
+        logger.debug("Linha de hoje gravada em: %s", out_file)
+    except Exception as e_file:
+        logger.exception("Erro ao gravar arquivo da linha de hoje: %s", e_file)
+
+def reportar_servidor(status, msgsucesso=None, sucesso: bool = None, etapas: Optional[list] = None, *, tarefa_id):
+    """Reporta o status para o servidor (enfileira; o envio é em segundo plano, ver relator.py).
     status: criado, consultado, agendado, executando, falha, sucesso
     msgsucesso: mensagem livre (ex.: linha extraída)
     sucesso: booleano opcional indicando sucesso final
+    etapas: etapas cronometradas da execução (enviadas no relatório final)
+    tarefa_id: tarefa do relatório (None: a mais recente no servidor); sempre
+    explícito, pois no daemon cada pedido traz a sua
+    """
+    if RESULTADO_ARQUIVO:
+        # Guarda só o último relatório (o final sobrescreve o `executando`)
+        dados = {"status": status, "msgsucesso": msgsucesso, "sucesso": sucesso, "etapas": etapas or []}
+        Path(RESULTADO_ARQUIVO).write_text(json.dumps(dados, ensure_ascii=False), encoding="utf-8")
+        return
+    obter_relator(URL_API, "login-ia").reportar(status, msgsucesso, tarefa_id, sucesso, etapas)
+
+
+def anotar_resultado_captcha(chave: Optional[str], resultado: str) -> None:
+    """Anota no corpus se o login com o CAPTCHA `chave` deu certo."""
+    corpus = obter_corpus()
+    if corpus and chave:
+        corpus.registrar_resultado(chave, resultado)
+
+
+def garantir_login(driver) -> bool:
+    """Garante uma sessão autenticada na página já carregada em `driver`.
+    Reaproveita a sessão salva no perfil quando o menu já aparece; senão faz o login
+    (com CAPTCHA). Retorna False se o login falhou.
     """
-    payload = {"status": status}
-    if msgsucesso is not None:
-        payload["msgsucesso"] = msgsucesso
-    if sucesso is not None:
-        payload["sucesso"] = bool(sucesso)
+    wait = WebDriverWait(driver, TIMEOUTS["login"])
+    chave_captcha = None
     try:
-        resp = requests.post(f"{URL_API}/api/confirmar-execucao", json=payload, timeout=5)
-        try:
-            resp.raise_for_status()
-            logger.info("Status atualizado no servidor: %s", status)
-        except Exception:
-            logger.warning("Servidor respondeu com erro: %s %s", resp.status_code, resp.text)
-    except Exception as e:
-        logger.exception("Falha ao avisar o servidor: %s", e)
+        # Espera o que aparecer primeiro: o menu (sessão salva no perfil) ou o formulário de login
+        aguardar(driver, "pagina", EC.any_of(
+            EC.presence_of_element_located((By.XPATH, XPATHS["menu_frequencia"])),
+            EC.visibility_of_element_located((By.XPATH, XPATHS["input_user"])),
+        ))
+        if driver.find_elements(By.XPATH, XPATHS["menu_frequencia"]):
+            print("✅ Já está logado! Pulando etapa de autenticação.")
+            return True
+
+        print("ℹ️ Não está logado. Iniciando processo de login...")
+        # 1. Resolver Captcha
+        codigo_captcha, chave_captcha = resolver_captcha(driver, wait)
+
+        logger.info("Preenchendo credenciais...")
+        wait.until(EC.visibility_of_element_located((By.XPATH, XPATHS["input_user"]))).send_keys(USUARIO)
+        wait.until(EC.visibility_of_element_located((By.XPATH, XPATHS["input_pass"]))).send_keys(SENHA)
+
+        if codigo_captcha:
+            wait.until(EC.visibility_of_element_located((By.XPATH, XPATHS["input_captcha"]))).send_keys(codigo_captcha)
+        else:
+            logger.warning("Tentando login sem captcha (ou falha no OCR)")
+
+        # 3. Clicar em Acessar
+        tirar_print(driver, "01_pre_login")
+        btn_login = wait.until(EC.element_to_be_clickable((By.XPATH, XPATHS["btn_login"])))
+        driver.execute_script("arguments[0].click();", btn_login)
+        logger.info("Botão Acessar clicado.")
+
+        # 4. Validar se entrou: Angular ocioso e menu presente
+        logger.info("Aguardando carregamento do sistema...")
+        aguardar(driver, "login", angular_ocioso, EC.presence_of_element_located((By.XPATH, XPATHS["menu_frequencia"])))
+        tirar_print(driver, "02_pos_login")
+        logger.info("Login confirmado! Menu encontrado.")
+        anotar_resultado_captcha(chave_captcha, "sucesso")
+        return True
+
+    except TimeoutException:
+        logger.error("ERRO CRÍTICO: O login falhou ou o site demorou demais.")
+        logger.error("Verifique se a senha está correta ou se houve captcha.")
+        tirar_print(driver, "xx_erro_login")
+        anotar_resultado_captcha(chave_captcha, "falha")
+        return False
+
 
-def run_once() -> bool:
+def run_once(driver=None, tarefa_id=None) -> bool:
     """Executa todo o fluxo de registrar ponto uma vez.
     Retorna True se o processo completou (mesmo que não tenha encontrado linha hoje),
     False em caso de erro fatal que deva disparar um retry.
+    Com `driver` (ex.: o navegador aquecido do daemon), usa-o e não o encerra no fim.
     """
-    driver = None
-    try:
-        driver = setup_driver()
-    except Exception as e:
-        logger.exception("Erro iniciando o WebDriver: %s", e)
-        reportar_servidor("falha", "erro iniciando webdriver", sucesso=False)
-        return False
-
-    wait = WebDriverWait(driver, 60)
-    wait_check = WebDriverWait(driver, 10)
+    proprio = driver is None
+    if proprio:
+        try:
+            with rastreio.etapa("driver"):
+                driver = setup_driver()
+        except Exception as e:
+            logger.exception("Erro iniciando o WebDriver: %s", e)
+            reportar_servidor("falha", "erro iniciando webdriver", sucesso=False, tarefa_id=tarefa_id)
+            return False
 
     try:
         logger.info("Acessando: %s", URL_SITE)
-        driver.get(URL_SITE)
-
-        try:
-            # TENTATIVA 1: Verifica se o menu JÁ está na tela (sessão salva no perfil)
-            wait_check.until(EC.presence_of_element_located((By.XPATH, XPATHS["menu_frequencia"])))
-            print("✅ Já está logado! Pulando etapa de autenticação.")
+        with rastreio.etapa("pagina"):
+            driver.get(URL_SITE)
 
-        except TimeoutException:
-            # Se cair aqui, é porque o menu NÃO apareceu em 5 segundos.
-            print("ℹ️ Não está logado. Iniciando processo de login...")
+        with rastreio.etapa("login") as etapa:
+            logado = garantir_login(driver)
+            if not logado:
+                etapa["resultado"] = "falha"
+        if not logado:
             try:
-                # 1. Resolver Captcha
-                codigo_captcha = resolver_captcha(driver, wait)
-
-                logger.info("Preenchendo credenciais...")
-                wait.until(EC.visibility_of_element_located((By.XPATH, XPATHS["input_user"]))).send_keys(USUARIO)
-                wait.until(EC.visibility_of_element_located((By.XPATH, XPATHS["input_pass"]))).send_keys(SENHA)
-
-                if codigo_captcha:
-                    wait.until(EC.visibility_of_element_located((By.XPATH, XPATHS["input_captcha"]))).send_keys(codigo_captcha)
-                else:
-                    logger.warning("Tentando login sem captcha (ou falha no OCR)")
-
-                # 3. Clicar em Acessar
-                tirar_print(driver, "01_pre_login")
-                btn_login = wait.until(EC.element_to_be_clickable((By.XPATH, XPATHS["btn_login"])))
-                driver.execute_script("arguments[0].click();", btn_login)
-                logger.info("Botão Acessar clicado.")
-
-                # 4. Validar se entrou (Esperar o menu aparecer)
-                logger.info("Aguardando carregamento do sistema...")
-                time.sleep(5)  # Pausa técnica para carregamento do Angular
-                tirar_print(driver, "02_pos_login")
-
-                # Tenta achar o menu para garantir que logou
-                wait.until(EC.presence_of_element_located((By.XPATH, XPATHS["menu_frequencia"])))
-                logger.info("Login confirmado! Menu encontrado.")
-
-            except TimeoutException:
-                logger.error("ERRO CRÍTICO: O login falhou ou o site demorou demais.")
-                logger.error("Verifique se a senha está correta ou se houve captcha.")
-                tirar_print(driver, "xx_erro_login")
-                try:
-                    reportar_servidor("falha", "login falhou ou captcha", sucesso=False)
-                except Exception as e_rep:
-                    logger.warning("Falha ao reportar falha de login: %s", e_rep)
-                return False
+                reportar_servidor("falha", "login falhou ou captcha", sucesso=False, tarefa_id=tarefa_id)
+            except Exception as e_rep:
+                logger.warning("Falha ao reportar falha de login: %s", e_rep)
+            return False
 
-        # 5. Navegação: Controle de Frequência
-        menu = wait.until(EC.element_to_be_clickable((By.XPATH, XPATHS["menu_frequencia"])))
-        driver.execute_script("arguments[0].click();", menu)
-        logger.info("Menu 'Controle de Frequência' acessado.")
-        time.sleep(2)
+        with rastreio.etapa("navegacao"):
+            # 5. Navegação: Controle de Frequência
+            menu = aguardar(driver, "navegacao", angular_ocioso, EC.element_to_be_clickable((By.XPATH, XPATHS["menu_frequencia"])))
+            driver.execute_script("arguments[0].click();", menu)
+            logger.info("Menu 'Controle de Frequência' acessado.")
+            # Marcas de hoje antes do clique, para reconhecer a nova na extração
+            # (sem linhas na tabela, ex.: usuário sem registros, parte de nenhuma)
+            aguardar(driver, "tabela", angular_ocioso, EC.presence_of_element_located((By.CSS_SELECTOR, CSS_LINHAS_TABELA)), obrigatorio=False)
+            marcas_antes = marcas_de_hoje(ler_tabela_registros(driver))
 
-        # 6. Navegação: Registrar Ponto
-        submenu = wait.until(EC.element_to_be_clickable((By.XPATH, XPATHS["submenu_registrar"])))
-        driver.execute_script("arguments[0].click();", submenu)
-        logger.info("Submenu 'Registrar' acessado.")
-        time.sleep(3)
-        tirar_print(driver, "03_tela_registro")
+            # 6. Navegação: Registrar Ponto
+            submenu = aguardar(driver, "navegacao", angular_ocioso, EC.element_to_be_clickable((By.XPATH, XPATHS["submenu_registrar"])))
+            driver.execute_script("arguments[0].click();", submenu)
+            logger.info("Submenu 'Registrar' acessado.")
 
-        # 7. AÇÃO FINAL: Registrar
-        logger.info("Procurando botão final de registro...")
-        btn_final = wait.until(EC.element_to_be_clickable((By.XPATH, XPATHS["btn_final_registrar"])))
+        with rastreio.etapa("registro") as etapa:
+            # 7. AÇÃO FINAL: Registrar
+            logger.info("Procurando botão final de registro...")
+            btn_final = aguardar(driver, "registro", angular_ocioso, EC.element_to_be_clickable((By.XPATH, XPATHS["btn_final_registrar"])))
+            tirar_print(driver, "03_tela_registro")
 
-        # --- ATENÇÃO: LINHA DE CLIQUE REAL ---
-        btn_final.click()
-        # logger.info(">>> btn_final.click() <<<")
-        logger.info(">>> Botão de Ponto clicado (execução iniciada) <<<")
+            # --- ATENÇÃO: LINHA DE CLIQUE REAL ---
+            btn_final.click()
+            # logger.info(">>> btn_final.click() <<<")
+            logger.info(">>> Botão de Ponto clicado (execução iniciada) <<<")
 
-        time.sleep(5)
-        tirar_print(driver, "04_final_resultado")
+            if aguardar(driver, "confirmacao", EC.visibility_of_element_located((By.XPATH, XPATHS["toast_sucesso"])), obrigatorio=False) is None:
+                etapa["resultado"] = "sem_confirmacao"
+            tirar_print(driver, "04_final_resultado")
 
         # 2. Reportar status final — extrair apenas a linha do dia de hoje
         status = "sucesso"
         linha_hoje = None
         try:
-            # Garantir que a tela de frequência esteja visível
-            menu = wait.until(EC.element_to_be_clickable((By.XPATH, XPATHS["menu_frequencia"])))
-            driver.execute_script("arguments[0].click();", menu)
-            logger.info("Menu 'Controle de Frequência' acessado.")
-            time.sleep(10)
+            with rastreio.etapa("extracao") as etapa:
+                # Garantir que a tela de frequência esteja visível
+                menu = aguardar(driver, "navegacao", angular_ocioso, EC.element_to_be_clickable((By.XPATH, XPATHS["menu_frequencia"])))
+                driver.execute_script("arguments[0].click();", menu)
+                logger.info("Menu 'Controle de Frequência' acessado.")
+                # Sem a nova marcação na tabela, o clique não tem comprovação: reporta
+                # falha, mas não repete (o ponto pode ter sido registrado)
+                if aguardar(driver, "tabela", angular_ocioso, nova_marcacao(marcas_antes), obrigatorio=False) is None:
+                    etapa["resultado"] = "sem_marcacao"
+                    status = "falha"
 
-            linha_hoje = extrair_linha_hoje(driver)
+                linha_hoje = extrair_linha_hoje(driver)
             if linha_hoje:
                 logger.info("Linha de hoje: %s", linha_hoje)
             else:
                 logger.debug("Nenhuma marcação encontrada para hoje.")
 
             # Grava também em arquivo para revisão posterior (opcional)
-            log_dir = Path("log")
-            log_dir.mkdir(parents=True, exist_ok=True)
-            out_file = log_dir / "linha_hoje_ponto.txt"
-            try:
-                with out_file.open("w", encoding="utf-8") as f:
-                    f.write((linha_hoje or "") + "\n")
-                logger.debug("Linha de hoje gravada em: %s", out_file)
-            except Exception as e_file:
-                logger.exception("Erro ao gravar arquivo da linha de hoje: %s", e_file)
+            gravar_linha_hoje(linha_hoje)
+            if status == "falha":
+                logger.error("Nova marcação não apareceu na tabela em %.1fs", TIMEOUTS["tabela"])
+                linha_hoje = f"nova marcação não apareceu na tabela ({linha_hoje or 'sem linha de hoje'})"
 
         except Exception as e:
             status = "falha"
@@ -351,7 +663,7 @@ def run_once() -> bool:
 
         # Reporta ao servidor incluindo a linha do dia (ou mensagem de erro)
         try:
-            reportar_servidor(status, linha_hoje, sucesso=(status == "sucesso"))
+            reportar_servidor(status, linha_hoje, sucesso=(status == "sucesso"), etapas=rastreio.etapas, tarefa_id=tarefa_id)
         except Exception as e:
             logger.warning("Falha ao reportar status final: %s", e)
 
@@ -364,44 +676,373 @@ def run_once() -> bool:
         except Exception:
             logger.debug("Falha ao salvar screenshot de erro fatal")
         try:
-            reportar_servidor("falha", str(e), sucesso=False)
+            reportar_servidor("falha", str(e), sucesso=False, tarefa_id=tarefa_id)
         except Exception as e_rep:
             logger.warning("Falha ao reportar erro fatal: %s", e_rep)
         return False
 
     finally:
-        logger.info("Encerrando driver e limpando memória...")
+        if proprio:
+            logger.info("Encerrando driver e limpando memória...")
+            try:
+                if driver:
+                    driver.quit()
+            except Exception:
+                logger.debug("Driver já encerrado ou erro ao fechar")
+
+
+_cliente_site = None
+
+
+def obter_cliente_site() -> ClienteSite:
+    """Sessão HTTP com a API do site (motor http), criada uma vez por processo."""
+    global _cliente_site
+    if _cliente_site is None:
+        if not SITE_API_URL:
+            raise SiteIncompativel("URL_SITE/SITE_API_URL não configurada")
+        _cliente_site = ClienteSite(SITE_API_URL)
+    return _cliente_site
+
+
+def login_http(cliente: ClienteSite) -> bool:
+    """Login pela API, com o CAPTCHA buscado direto; False se o site recusou."""
+    captcha_id, imagem = cliente.obter_captcha()
+    codigo, chave = resolver_imagem_captcha(imagem) if captcha_resolvivel() else (None, None)
+    if not codigo:
+        logger.warning("Tentando login sem captcha (ou falha no OCR)")
+    ok = cliente.login(USUARIO, SENHA, codigo, captcha_id)
+    anotar_resultado_captcha(chave, "sucesso" if ok else "falha")
+    return ok
+
+
+def chamar_autenticado(cliente: ClienteSite, chamada):
+    """`chamada()` com o token atual; se o site o recusar (401/403, nada foi feito),
+    refaz o login e repete uma vez.
+    """
+    try:
+        return chamada()
+    except SessaoExpirada:
+        logger.info("Token recusado pelo site; refazendo login")
+        cliente.descartar_token()
+        if not login_http(cliente):
+            raise
+        return chamada()
+
+
+def run_once_http(tarefa_id=None) -> bool:
+    """`run_once` sem navegador (MOTOR_REGISTRO=http), com o mesmo retorno e relatórios.
+    Levanta SiteIncompativel se a API não é a esperada antes de qualquer registro,
+    para o chamador voltar ao Selenium.
+    """
+    cliente = obter_cliente_site()
+    try:
+        with rastreio.etapa("login") as etapa:
+            if cliente.token_valido():
+                logger.info("Token salvo ainda válido; pulando autenticação.")
+                logado = True
+            else:
+                logado = login_http(cliente)
+            if not logado:
+                etapa["resultado"] = "falha"
+        if not logado:
+            reportar_servidor("falha", "login falhou ou captcha", sucesso=False, tarefa_id=tarefa_id)
+            return False
+        # Marcas de hoje antes do registro: se o POST ficar sem resposta, a tabela diz se ele entrou
+        marcas_antes = len(marcas_de_hoje(chamar_autenticado(cliente, cliente.ler_registros)))
+    except SiteIncompativel:
+        raise
+    except Exception as e:
+        logger.exception("ERRO FATAL NA EXECUÇÃO: %s", e)
+        reportar_servidor("falha", str(e), sucesso=False, tarefa_id=tarefa_id)
+        return False
+
+    try:
+        with rastreio.etapa("registro"):
+            resposta = chamar_autenticado(cliente, cliente.registrar_ponto)
+            logger.info(">>> Frequência registrada via API: %s <<<", resposta)
+    except SiteIncompativel:
+        # Só a rota de registro inexistente (404/405) chega aqui: nada foi registrado
+        raise
+    except requests.RequestException as e:
+        recusado = isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code < 500
+        if recusado:
+            logger.error("Registro recusado pelo site: %s", e)
+            reportar_servidor("falha", str(e), sucesso=False, tarefa_id=tarefa_id)
+            return False
+        # Timeout, conexão caída ou 5xx: o site pode ter registrado mesmo assim
+        logger.warning("Registro sem resposta (%s); conferindo a tabela antes de repetir", e)
         try:
-            if driver:
-                driver.quit()
-        except Exception:
-            logger.debug("Driver já encerrado ou erro ao fechar")
+            marcas_depois = len(marcas_de_hoje(cliente.ler_registros()))
+        except Exception as e_tabela:
+            logger.error("Não foi possível conferir o registro: %s", e_tabela)
+            # Sem repetir: um segundo POST poderia registrar o ponto duas vezes
+            reportar_servidor("falha", f"registro incerto: {e}", sucesso=False, etapas=rastreio.etapas, tarefa_id=tarefa_id)
+            return True
+        if marcas_depois <= marcas_antes:
+            reportar_servidor("falha", str(e), sucesso=False, tarefa_id=tarefa_id)
+            return False
+        logger.info(">>> Marca nova na tabela: o registro entrou apesar do erro <<<")
+    except Exception as e:
+        logger.exception("ERRO FATAL NA EXECUÇÃO: %s", e)
+        reportar_servidor("falha", str(e), sucesso=False, tarefa_id=tarefa_id)
+        return False
 
+    # Daqui em diante o ponto já foi registrado: nenhum erro volta para o Selenium
+    status = "sucesso"
+    linha_hoje = None
+    try:
+        with rastreio.etapa("extracao"):
+            linha_hoje = linha_de_hoje(cliente.ler_registros())
+        if linha_hoje:
+            logger.info("Linha de hoje: %s", linha_hoje)
+        gravar_linha_hoje(linha_hoje)
+    except Exception as e:
+        status = "falha"
+        linha_hoje = str(e)
+        logger.exception("Erro ao extrair/imprimir linha de hoje: %s", e)
 
-def main():
+    reportar_servidor(status, linha_hoje, sucesso=(status == "sucesso"), etapas=rastreio.etapas, tarefa_id=tarefa_id)
+    return True
+
+
+def executar_motor(tarefa_id=None) -> bool:
+    """Uma tentativa com o motor de MOTOR_REGISTRO (usada por `registrar`)."""
+    if MOTOR_REGISTRO == "http":
+        try:
+            return run_once_http(tarefa_id)
+        except SiteIncompativel as e:
+            if not MOTOR_FALLBACK_SELENIUM:
+                logger.error("API do site incompatível com o motor http: %s", e)
+                reportar_servidor("falha", f"motor http: {e}", sucesso=False, tarefa_id=tarefa_id)
+                return False
+            logger.warning("API do site incompatível com o motor http (%s); usando o Selenium", e)
+    return run_once(tarefa_id=tarefa_id)
+
+
+def registrar(executar=executar_motor, tarefa_id=None) -> bool:
+    """Reporta `executando` e roda `executar(tarefa_id)` até REGISTER_ATTEMPTS vezes.
+    Retorna True se alguma tentativa completou; senão reporta a falha definitiva.
+    """
+    rastreio.reiniciar(tarefa_id)
     # Reporta que a execução está iniciando
     try:
-        reportar_servidor("executando", None)
+        reportar_servidor("executando", None, tarefa_id=tarefa_id)
     except Exception as e:
         logger.warning("Falha ao reportar status executando: %s", e)
 
     attempts = int(os.getenv("REGISTER_ATTEMPTS", "2"))
     for attempt in range(1, attempts + 1):
         logger.info("Iniciando tentativa %d/%d", attempt, attempts)
-        ok = run_once()
+        rastreio.tentativa = attempt
+        ok = executar(tarefa_id)
         if ok:
             logger.info("Fluxo completado com sucesso na tentativa %d", attempt)
-            return
+            return True
         if attempt < attempts:
-            logger.warning("Tentativa %d falhou — aguardando e tentando novamente...", attempt)
-            time.sleep(60)
+            espera = espera_retentativa(attempt)
+            logger.warning("Tentativa %d falhou — aguardando %.1fs e tentando novamente...", attempt, espera)
+            time.sleep(espera)
 
     logger.error("Todas as tentativas (%d) falharam. Marcando como falha definitiva.", attempts)
     try:
-        reportar_servidor("falha", "todas as tentativas falharam", sucesso=False)
+        reportar_servidor("falha", "todas as tentativas falharam", sucesso=False, etapas=rastreio.etapas, tarefa_id=tarefa_id)
     except Exception:
         logger.debug("Falha ao reportar falha definitiva")
+    return False
+
+
+class NavegadorAquecido:
+    """Firefox mantido aberto (e logado, via FIREFOX_PROFILE_PATH) entre jobs do daemon.
+
+    É recriado quando deixa de responder, após uma tentativa com falha (estado da
+    página desconhecido) e a cada `max_jobs` jobs, para não acumular memória.
+    """
+
+    def __init__(self, max_jobs: int = DAEMON_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self.driver = None
+        self.jobs = 0
+        self.iniciado_em = None
+        # Selenium não é thread-safe: jobs, keep-alive e health check se revezam aqui
+        self.lock = threading.RLock()
+
+    def _saudavel(self) -> bool:
+        if self.driver is None:
+            return False
+        try:
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def encerrar(self) -> None:
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                logger.debug("Driver já encerrado ou erro ao fechar")
+        self.driver = None
+        self.jobs = 0
+
+    def obter(self):
+        with self.lock:
+            if self.jobs >= self.max_jobs:
+                logger.info("Reciclando navegador após %d jobs", self.jobs)
+                self.encerrar()
+            if not self._saudavel():
+                self.encerrar()
+                logger.info("Iniciando navegador do daemon...")
+                self.driver = setup_driver()
+                self.iniciado_em = time.time()
+                self.aquecer()
+            return self.driver
+
+    def aquecer(self) -> None:
+        """Abre o site e garante o login, para o próximo job já encontrar a sessão pronta."""
+        self.driver.get(URL_SITE)
+        if not garantir_login(self.driver):
+            logger.warning("Aquecimento: login não confirmado; o próximo job tentará de novo")
+
+    def executar(self, tarefa_id=None) -> bool:
+        """Uma tentativa de `run_once` no navegador aquecido (usada por `registrar`)."""
+        with self.lock:
+            try:
+                with rastreio.etapa("driver"):
+                    driver = self.obter()
+            except Exception as e:
+                logger.exception("Erro iniciando o WebDriver: %s", e)
+                self.encerrar()
+                reportar_servidor("falha", "erro iniciando webdriver", sucesso=False, tarefa_id=tarefa_id)
+                return False
+            self.jobs += 1
+            ok = run_once(driver, tarefa_id)
+            if not ok:
+                self.encerrar()
+            return ok
+
+    def manter_vivo(self) -> None:
+        """Recria o navegador se caiu; senão recarrega a página para manter a sessão."""
+        with self.lock:
+            if self.driver is None:
+                return
+            try:
+                if self._saudavel():
+                    self.driver.refresh()
+                    return
+                logger.warning("Navegador do daemon não responde; recriando")
+                self.obter()
+            except Exception:
+                logger.exception("Falha no keep-alive do navegador")
+                self.encerrar()
+
+    def saude(self) -> dict:
+        if not self.lock.acquire(blocking=False):
+            return {"ok": True, "ocupado": True, "jobs": self.jobs}
+        try:
+            return {
+                "ok": True,
+                "ocupado": False,
+                "navegador_ativo": self._saudavel(),
+                "jobs": self.jobs,
+                "max_jobs": self.max_jobs,
+                "iniciado_em": self.iniciado_em,
+            }
+        finally:
+            self.lock.release()
+
+
+class _TratadorDaemon(socketserver.StreamRequestHandler):
+    """Protocolo: uma linha JSON por pedido ({"acao": "registrar"|"saude"}) e uma de resposta."""
+
+    def handle(self):
+        navegador = self.server.navegador
+        try:
+            pedido = json.loads(self.rfile.readline() or b"{}")
+            acao = pedido.get("acao")
+            if acao == "saude":
+                resposta = navegador.saude()
+            elif acao == "registrar":
+                # O lock também serializa o `rastreio` entre pedidos simultâneos
+                with navegador.lock:
+                    resposta = {"ok": registrar(navegador.executar, pedido.get("tarefa_id") or None)}
+            else:
+                resposta = {"ok": False, "erro": f"ação desconhecida: {acao}"}
+        except Exception as e:
+            logger.exception("Erro tratando pedido do daemon: %s", e)
+            resposta = {"ok": False, "erro": str(e)}
+        self.wfile.write(json.dumps(resposta).encode("utf-8") + b"\n")
+
+
+def executar_daemon() -> None:
+    """Sobe o daemon: aquece o navegador e atende pedidos em DAEMON_SOCKET."""
+    navegador = NavegadorAquecido()
+    try:
+        navegador.obter()
+    except Exception:
+        logger.exception("Falha ao aquecer o navegador; será tentado no primeiro job")
+        navegador.encerrar()
+
+    def keep_alive():
+        while True:
+            time.sleep(DAEMON_KEEPALIVE)
+            navegador.manter_vivo()
+
+    threading.Thread(target=keep_alive, name="keep-alive", daemon=True).start()
+
+    if os.path.exists(DAEMON_SOCKET):
+        os.unlink(DAEMON_SOCKET)
+    with socketserver.ThreadingUnixStreamServer(DAEMON_SOCKET, _TratadorDaemon) as servidor:
+        os.chmod(DAEMON_SOCKET, 0o600)
+        servidor.navegador = navegador
+        logger.info("Daemon ouvindo em %s", DAEMON_SOCKET)
+        try:
+            servidor.serve_forever()
+        finally:
+            navegador.encerrar()
+            os.unlink(DAEMON_SOCKET)
+
+
+def enviar_ao_daemon(pedido: dict) -> Optional[dict]:
+    """Envia `pedido` ao daemon e aguarda a resposta; None se ele não estiver rodando."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conexao:
+            conexao.connect(DAEMON_SOCKET)
+            conexao.sendall(json.dumps(pedido).encode("utf-8") + b"\n")
+            resposta = conexao.makefile("rb").readline()
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+    return json.loads(resposta) if resposta else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registra o ponto no site via Firefox ou pela API do site.")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument("--daemon", action="store_true", help="mantém um Firefox aquecido atendendo jobs em DAEMON_SOCKET")
+    modo.add_argument("--via-daemon", action="store_true", help="pede o registro ao daemon (fallback: execução local)")
+    modo.add_argument("--saude-daemon", action="store_true", help="mostra o estado do daemon")
+    args = parser.parse_args()
+    if MOTOR_REGISTRO not in ("selenium", "http"):
+        parser.error(f"MOTOR_REGISTRO inválido: {MOTOR_REGISTRO} (opções: selenium, http)")
+
+    if args.daemon:
+        executar_daemon()
+        return
+    if args.saude_daemon:
+        print(json.dumps(enviar_ao_daemon({"acao": "saude"})))
+        return
+    if args.via_daemon:
+        resposta = enviar_ao_daemon({"acao": "registrar", "tarefa_id": TAREFA_ID or None})
+        if resposta is not None:
+            logger.info("Daemon respondeu: %s", resposta)
+            sys.exit(0 if resposta.get("ok") else 1)
+        logger.warning("Daemon indisponível em %s; executando localmente", DAEMON_SOCKET)
+
+    ok = registrar(tarefa_id=TAREFA_ID or None)
+    if not RESULTADO_ARQUIVO:
+        obter_relator(URL_API, "login-ia").esvaziar()
+    # Código de saída para quem chama (registrar.sh, multicontas.py)
+    sys.exit(0 if ok else 1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,14 +1,37 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlmodel import SQLModel, Field, Session, select, create_engine
+from sqlmodel import SQLModel, Field, select
+from sqlalchemy import (
+    Column, DateTime, Index, Integer, Select, Table, UniqueConstraint, and_, bindparam, delete, event, func, inspect,
+    or_, text, tuple_, update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
+from contextlib import asynccontextmanager, nullcontext
+from pathlib import Path
 from typing import Optional
+from zoneinfo import ZoneInfo
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
 import os
+import sqlite3
+import threading
+import time
 from dotenv import load_dotenv
 import logging
 
+from cache import EntradaCache, criar_cache
+from metricas import Registro, percentil
+
 load_dotenv(override=True)
 
 # --- BANCO DE DADOS ---
@@ -16,17 +39,216 @@ DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./banco_local.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(DATABASE_URL)
+# Driver assíncrono usado para cada banco (a URL continua no formato síncrono)
+DRIVERS_ASYNC = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def url_assincrona(url: str):
+    """Converte `DATABASE_URL` para o driver assíncrono (asyncpg/aiosqlite)."""
+    u = make_url(url)
+    driver = DRIVERS_ASYNC.get(u.get_backend_name())
+    if driver is None or u.get_driver_name() == driver:
+        return u
+    u = u.set(drivername=f"{u.get_backend_name()}+{driver}")
+    # asyncpg não entende `sslmode` (comum em URLs de Postgres gerenciado): vira `ssl`
+    if driver == "asyncpg" and "sslmode" in u.query:
+        u = u.update_query_dict({"ssl": u.query["sslmode"]}).difference_update_query(["sslmode"])
+    return u
+
+
+# --- POOL DE CONEXÕES / SQLITE ---
+# Padrões pensados para produção (Postgres gerenciado que "dorme" entre acessos):
+# pre-ping descarta conexões mortas antes do uso e recycle renova as antigas.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") != "0"
+# SQLite: WAL permite leituras durante escritas; busy_timeout espera o lock em vez
+# de falhar com "database is locked" quando agendar/confirmar escrevem juntos
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# O lock de escrita do SQLite não é justo: com vários escritores, alguns passam do
+# busy_timeout e falham com "database is locked". SQLITE_FILA_ESCRITA=1 põe as
+# transações de escrita do processo numa fila (FIFO) antes do banco; 0 volta a
+# disputar só pelo busy_timeout
+SQLITE_FILA_ESCRITA = os.environ.get("SQLITE_FILA_ESCRITA", "1") != "0"
+
+
+# --- MÉTRICAS (/metrics) ---
+metricas = Registro()
+latencia_http = metricas.histograma(
+    "http_requisicao_segundos", "Latência das requisições por rota", ("metodo", "rota", "status")
+)
+latencia_db = metricas.histograma("db_consulta_segundos", "Duração das consultas ao banco", ("operacao",))
+erros_db = metricas.contador("db_consulta_erros_total", "Consultas ao banco que falharam", ("operacao",))
+espera_pool = metricas.histograma("db_pool_espera_segundos", "Espera para obter uma conexão do pool")
+eventos_cache = metricas.contador("cache_eventos_total", "Consultas e invalidações do cache de leituras", ("evento",))
+tamanho_cache = metricas.medidor("cache_itens", "Itens no cache de leituras")
+tarefas_por_status = metricas.medidor("tarefas", "Tarefas no banco por status", ("status",))
+relatorios_recebidos = metricas.contador(
+    "relatorios_recebidos_total", "Relatórios de execução recebidos por status", ("status",)
+)
+transicoes_trabalhador = metricas.contador(
+    "trabalhador_transicoes_total", "Tarefas movidas pelo trabalhador por status de destino", ("status",)
+)
+
+
+class PoolMedido(AsyncAdaptedQueuePool):
+    """Pool padrão do engine assíncrono, medindo a espera por uma conexão (checkout)."""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            espera_pool.observar(time.perf_counter() - inicio)
+
+
+def _operacao(sql: str) -> str:
+    return sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "?"
+
+
+def _antes_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("inicio_consultas", []).append(time.perf_counter())
+
+
+def _depois_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicios = conn.info.get("inicio_consultas")
+    if inicios:
+        latencia_db.observar(time.perf_counter() - inicios.pop(), operacao=_operacao(statement))
+
+
+def _erro_consulta(contexto):
+    conn = contexto.connection
+    if conn is not None and conn.info.get("inicio_consultas"):
+        conn.info["inicio_consultas"].pop()
+    erros_db.inc(operacao=_operacao(contexto.statement or ""))
+
+
+def opcoes_engine(url) -> dict:
+    """Argumentos de `create_async_engine` para `url`, conforme as variáveis DB_*."""
+    url = make_url(url)
+    opcoes = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if url.get_backend_name() == "sqlite":
+        # A conexão pode ser usada por outra thread que não a que a abriu (pool/driver async)
+        opcoes["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            return opcoes  # banco em memória: pool estático, sem dimensionamento
+    opcoes.update(
+        poolclass=PoolMedido, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT
+    )
+    return opcoes
+
+
+def _configurar_sqlite(dbapi_conn, _registro):
+    cursor = dbapi_conn.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    finally:
+        cursor.close()
+
+
+# Versão mínima do SQLite: 3.35, a primeira com UPDATE/INSERT ... RETURNING, que todas
+# as escritas usam (a de ON CONFLICT DO UPDATE, 3.24, já fica coberta)
+SQLITE_VERSAO_MINIMA = (3, 35)
+
+engine = create_async_engine(url_assincrona(DATABASE_URL), **opcoes_engine(DATABASE_URL))
+if engine.dialect.name == "sqlite":
+    if sqlite3.sqlite_version_info < SQLITE_VERSAO_MINIMA:
+        raise RuntimeError(
+            f"SQLite {sqlite3.sqlite_version} sem RETURNING; é preciso >= {'.'.join(map(str, SQLITE_VERSAO_MINIMA))}"
+        )
+    event.listen(engine.sync_engine, "connect", _configurar_sqlite)
+event.listen(engine.sync_engine, "before_cursor_execute", _antes_consulta)
+event.listen(engine.sync_engine, "after_cursor_execute", _depois_consulta)
+event.listen(engine.sync_engine, "handle_error", _erro_consulta)
+
+# Fila de escrita do SQLite (SQLITE_FILA_ESCRITA): um asyncio.Lock é FIFO, então as
+# transações de escrita deste processo chegam ao banco uma de cada vez, na ordem de
+# chegada. Leituras não passam por ela (o WAL as deixa correr junto com a escrita).
+_lock_escrita = asyncio.Lock() if engine.dialect.name == "sqlite" and SQLITE_FILA_ESCRITA else None
+
+
+@asynccontextmanager
+async def transacao_escrita():
+    """`engine.begin()` para transações que escrevem (na fila, no SQLite).
+
+    No Postgres, começa pela trava de transação de `gravar_eventos`: as escritas
+    ficam em série, e o `atualizado_em` calculado dentro dela cresce na ordem de
+    confirmação. Sem isso, uma escrita confirmada depois de outra com horário
+    maior ficaria para trás do cursor do stream (/api/tarefas/stream) e nunca
+    seria enviada.
+    """
+    if _lock_escrita is None:
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                await conn.execute(select(func.pg_advisory_xact_lock(TRAVA_EVENTOS)))
+            yield conn
+        return
+    async with _lock_escrita, engine.begin() as conn:
+        yield conn
+
+# --- STREAM DE TAREFAS (SSE) ---
+# Sem novidades, o stream relê o banco a cada STREAM_INTERVALO segundos (pega
+# alterações feitas por outros workers) e envia um comentário de keep-alive
+STREAM_INTERVALO = float(os.environ.get("STREAM_INTERVALO", "15"))
+
+# --- AGENDAMENTO NO SERVIDOR ---
+# FUSO_HORARIO (nome IANA, ex.: America/Sao_Paulo) é o fuso em que os agentes leem
+# data/hora/minuto das tarefas. Com ele, o servidor grava `executar_em` (instante em
+# UTC) e o trabalhador pode avançar os status; sem ele, `executar_em` fica vazio e
+# cada agente interpreta data/hora/minuto no próprio fuso, como antes. Não há
+# padrão: o fuso do servidor (em geral UTC na hospedagem) não é o dos agentes.
+FUSO_HORARIO = ZoneInfo(os.environ["FUSO_HORARIO"]) if os.environ.get("FUSO_HORARIO") else None
+# O trabalhador em segundo plano avança os status a cada TRABALHADOR_INTERVALO segundos (0 desliga;
+# padrão 30 com FUSO_HORARIO, 0 sem ele): marca `agendado` o que vence em até
+# TRABALHADOR_ANTECEDENCIA segundos e `falha` o que passou TRABALHADOR_PRAZO segundos do
+# horário sem confirmação do agente. Só mexe em tarefas com horário depois da sua partida
+TRABALHADOR_INTERVALO = float(os.environ.get("TRABALHADOR_INTERVALO", "30" if FUSO_HORARIO else "0"))
+TRABALHADOR_ANTECEDENCIA = int(os.environ.get("TRABALHADOR_ANTECEDENCIA", "900"))
+TRABALHADOR_PRAZO = int(os.environ.get("TRABALHADOR_PRAZO", "1800"))
+if TRABALHADOR_INTERVALO > 0 and FUSO_HORARIO is None:
+    raise RuntimeError("TRABALHADOR_INTERVALO > 0 exige FUSO_HORARIO (fuso dos agentes, ex.: America/Sao_Paulo)")
+# Retenção: tarefas com horário há mais de RETENCAO_DIAS dias saem de `configuracao` para
+# `configuracao_arquivo` (RETENCAO_DESTINO=tabela) ou para NDJSON gzip por mês em RETENCAO_DIR
+# (ndjson), deixando as contagens em `resumo_mensal`; eventos e etapas cronometradas mais
+# antigos que a janela são apagados. Roda com `python main.py retencao` ou,
+# com RETENCAO_INTERVALO > 0 (segundos), em segundo plano no app
+RETENCAO_DIAS = int(os.environ.get("RETENCAO_DIAS", "180"))
+RETENCAO_DESTINO = os.environ.get("RETENCAO_DESTINO", "tabela")
+RETENCAO_DIR = Path(os.environ.get("RETENCAO_DIR", "arquivo"))
+RETENCAO_INTERVALO = float(os.environ.get("RETENCAO_INTERVALO", "0"))
+RETENCAO_LOTE = int(os.environ.get("RETENCAO_LOTE", "1000"))
+DESTINOS_RETENCAO = ("tabela", "ndjson")
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
 
 
 # --- MODELO DA TABELA (Atualizado para suportar status/msgsucesso) ---
 class Configuracao(SQLModel, table=True):
-    # Chave primária composta por data, hora e minuto
-    data_para_execucao: str = Field(primary_key=True)
-    hora: str = Field(primary_key=True)
-    minuto: str = Field(primary_key=True)
+    # Data, hora e minuto continuam identificando o horário (único), mas cada
+    # tarefa tem um id próprio para ser reservada/confirmada individualmente
+    __table_args__ = (
+        UniqueConstraint("data_para_execucao", "hora", "minuto", name="uq_configuracao_horario"),
+        # Leituras "mais recente" e a paginação do histórico ordenam por (data_solicitacao, id)
+        Index("ix_configuracao_solicitacao_id", "data_solicitacao", "id"),
+        # Transições do trabalhador: WHERE status = ... AND executar_em <= ...
+        Index("ix_configuracao_status_executar_em", "status", "executar_em"),
+        # Stream de alterações: WHERE (atualizado_em, id) > cursor ORDER BY atualizado_em, id
+        Index("ix_configuracao_atualizado_id", "atualizado_em", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    data_para_execucao: str
+    hora: str
+    minuto: str
+    # Mesmo horário como instante (UTC), calculado de data/hora/minuto em FUSO_HORARIO
+    executar_em: Optional[datetime] = Field(default=None, sa_column=Column(DateTime(timezone=True), index=True))
 
     # Metadados de Controle
     origem: str
@@ -37,6 +259,121 @@ class Configuracao(SQLModel, table=True):
     status: str = Field(default="criado")
     msgsucesso: Optional[str] = None
 
+    # Multi-agente: `agente` restringe quem pode executar (None = qualquer um);
+    # `reservado_por`/`reservado_ate` registram a reserva (lease) corrente
+    agente: Optional[str] = Field(default=None, index=True)
+    reservado_por: Optional[str] = None
+    reservado_ate: Optional[datetime] = None
+
+    # Última alteração (insert ou update); com o id, cursor do stream /api/tarefas/stream
+    atualizado_em: Optional[datetime] = Field(default_factory=datetime.now, sa_column_kwargs={"onupdate": datetime.now})
+
+
+class EtapaExecucao(SQLModel, table=True):
+    """Etapa cronometrada de uma execução do login-ia.py (driver, pagina, captcha,
+    login, navegacao, registro, extracao), recebida no relatório final.
+    """
+
+    __tablename__ = "etapa_execucao"
+    # Resumo por etapa num período: WHERE inicio >= ... agrupado por etapa
+    __table_args__ = (Index("ix_etapa_execucao_etapa_inicio", "etapa", "inicio"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    tarefa_id: Optional[int] = Field(default=None, index=True)
+    etapa: str
+    tentativa: int = 1
+    inicio: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+    duracao_ms: float
+    resultado: str = "ok"  # ok, falha, timeout, erro, ...
+    detalhe: Optional[str] = None
+
+
+class EventoTarefa(SQLModel, table=True):
+    """Log só de inserção das mudanças de status das tarefas (criado → consultado →
+    agendado → executando → sucesso/falha). O `id` é o cursor de /api/eventos.
+    """
+
+    __tablename__ = "evento_tarefa"
+    # Histórico de uma tarefa em ordem: WHERE tarefa_id = ... ORDER BY id. No SQLite,
+    # AUTOINCREMENT impede que os ids recomecem depois que a retenção apaga todos os
+    # eventos (o cursor dos clientes pararia de andar)
+    __table_args__ = (Index("ix_evento_tarefa_tarefa_id", "tarefa_id", "id"), {"sqlite_autoincrement": True})
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    tarefa_id: int
+    status: Optional[str] = None
+    msgsucesso: Optional[str] = None
+    executou_sucesso: Optional[bool] = None
+    agente: Optional[str] = None  # da tarefa, para filtrar por agente
+    origem: str  # agendar, consultar, reservar, confirmar, trabalhador
+    criado_em: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+
+
+# Tarefas antigas movidas pela retenção (RETENCAO_DESTINO=tabela): as mesmas colunas
+# de `configuracao`, todas anuláveis e sem a unicidade do horário (um horário pode
+# ser reagendado e arquivado de novo), mais o momento do arquivamento
+configuracao_arquivo = Table(
+    "configuracao_arquivo",
+    SQLModel.metadata,
+    Column("arquivo_id", Integer, primary_key=True),
+    *[Column(c.name, c.type, index=c.name == "id") for c in Configuracao.__table__.columns],
+    Column("arquivado_em", DateTime(timezone=True), nullable=False),
+)
+
+
+class ResumoMensal(SQLModel, table=True):
+    """Contagens por mês (de `data_para_execucao`) das tarefas já arquivadas."""
+
+    __tablename__ = "resumo_mensal"
+
+    mes: str = Field(primary_key=True)  # "YYYY-MM"
+    total: int = 0
+    sucessos: int = 0
+    falhas: int = 0
+
+
+# Colunas cuja alteração gera um evento
+CAMPOS_EVENTO = ("status", "msgsucesso", "executou_sucesso")
+
+# Status em que uma tarefa ainda pode ser reservada por um agente
+STATUS_RESERVAVEIS = ("criado", "consultado")
+# Status em que a tarefa já terminou (o trabalhador não mexe mais nela)
+STATUS_FINAIS = ("sucesso", "falha", "cancelado")
+
+
+def agora_utc() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def como_utc(momento: Optional[datetime]) -> Optional[datetime]:
+    """SQLite devolve `executar_em` sem fuso; o valor gravado é sempre UTC."""
+    if momento is None or momento.tzinfo is not None:
+        return momento
+    return momento.replace(tzinfo=timezone.utc)
+
+
+def calcular_executar_em(data: str, hora: str, minuto: str) -> Optional[datetime]:
+    """Instante (UTC) de data/hora/minuto em FUSO_HORARIO; None se não forem válidos
+    ou sem FUSO_HORARIO.
+    """
+    if FUSO_HORARIO is None:
+        return None
+    try:
+        local = datetime.strptime(f"{data} {int(hora):02d}:{int(minuto):02d}", "%Y-%m-%d %H:%M")
+    except (TypeError, ValueError):
+        return None
+    return local.replace(tzinfo=FUSO_HORARIO).astimezone(timezone.utc)
+
+# Chave da trava (pg_advisory_xact_lock) que põe em série as escritas no Postgres
+# (ver `transacao_escrita`) e ordena as inserções em evento_tarefa
+TRAVA_EVENTOS = 7_310_023
+
+# Máximo de horários aceitos por /api/agendar-lote (um mês útil tem ~90)
+LOTE_MAXIMO = int(os.environ.get("LOTE_MAXIMO", "1000"))
+
+# Tamanho máximo de página do histórico; a exportação lê em lotes deste tamanho
+HISTORICO_LIMITE_MAX = int(os.environ.get("HISTORICO_LIMITE_MAX", "200"))
+
 
 # --- MODELOS PARA A API (INPUT) ---
 class DadosAgendamento(BaseModel):
@@ -45,12 +382,57 @@ class DadosAgendamento(BaseModel):
     data_execucao: str  # Vem do HTML
     status: Optional[str] = None
     msgsucesso: Optional[str] = None
+    agente: Optional[str] = None
+
+
+class RecorrenciaAgendamento(BaseModel):
+    data_inicio: date
+    data_fim: date
+    horarios: list[str]  # ["12:01", "18:30"]
+    dias_semana: list[int] = [0, 1, 2, 3, 4]  # 0 = segunda ... 6 = domingo
+
+
+class AgendamentoLote(BaseModel):
+    agendamentos: list[DadosAgendamento] = []
+    recorrencia: Optional[RecorrenciaAgendamento] = None  # Somado aos `agendamentos`
+    agente: Optional[str] = None  # Padrão para os itens sem agente
+
+
+class DadosEtapa(BaseModel):
+    etapa: str
+    inicio: datetime
+    duracao_ms: float
+    tentativa: int = 1
+    resultado: str = "ok"
+    detalhe: Optional[str] = None
 
 
 class ConfirmacaoExecucao(BaseModel):
+    id: Optional[int] = None  # Sem id, atualiza a tarefa mais recente (legado)
     status: Optional[str] = None
     msgsucesso: Optional[str] = None
     sucesso: Optional[bool] = None
+    etapas: list[DadosEtapa] = []  # Tempos por etapa, enviados no relatório final
+    # Sem id: quando o relatório foi feito; um reenvio tardio (outbox) vai para a
+    # tarefa que era a mais recente nesse momento, não para uma criada depois
+    reportado_em: Optional[datetime] = None
+
+
+class LoteConfirmacoes(BaseModel):
+    confirmacoes: list[ConfirmacaoExecucao]  # Aplicadas em ordem
+
+
+class ReservaTarefa(BaseModel):
+    agente: str
+    lease_segundos: int = 300
+    data_execucao: Optional[str] = None  # Restringe a uma data (YYYY-MM-DD)
+
+
+class FiltroHistorico(BaseModel):
+    status: list[str] = []
+    origem: Optional[str] = None
+    data_de: Optional[date] = None  # data_para_execucao >= data_de
+    data_ate: Optional[date] = None  # data_para_execucao <= data_ate
 
 
 class DadosRelatorio(BaseModel):
@@ -58,15 +440,631 @@ class DadosRelatorio(BaseModel):
     mensagem: str
 
 
+# --- MIGRAÇÕES ---
+# `create_all` só cria tabelas ausentes; índices/colunas novos em tabelas já
+# existentes (SQLite ou Postgres) são aplicados aqui, de forma idempotente.
+def _migrar_chave_id(conn):
+    """Bancos antigos usam (data, hora, minuto) como PK; passa a usar `id` + UNIQUE."""
+    nome = Configuracao.__tablename__
+    insp = inspect(conn)
+    colunas = [c["name"] for c in insp.get_columns(nome)]
+    if "id" in colunas:
+        return
+    logger.info("Migração: adicionando chave `id` em %s", nome)
+    if conn.dialect.name == "postgresql":
+        pk = insp.get_pk_constraint(nome)["name"]
+        conn.execute(text(f'ALTER TABLE {nome} DROP CONSTRAINT "{pk}"'))
+        conn.execute(text(f"ALTER TABLE {nome} ADD COLUMN id SERIAL PRIMARY KEY"))
+        conn.execute(text(
+            f"ALTER TABLE {nome} ADD CONSTRAINT uq_configuracao_horario UNIQUE (data_para_execucao, hora, minuto)"
+        ))
+        return
+    # SQLite não altera PK: reconstrói a tabela preservando os dados
+    for ix in insp.get_indexes(nome):
+        conn.execute(text(f'DROP INDEX "{ix["name"]}"'))
+    conn.execute(text(f"ALTER TABLE {nome} RENAME TO _{nome}_antiga"))
+    Configuracao.__table__.create(conn)
+    lista = ", ".join(colunas)
+    conn.execute(text(f"INSERT INTO {nome} ({lista}) SELECT {lista} FROM _{nome}_antiga ORDER BY data_solicitacao"))
+    conn.execute(text(f"DROP TABLE _{nome}_antiga"))
+
+
+def _migrar_colunas(conn):
+    """Adiciona (como anuláveis) as colunas do modelo que ainda não existem no banco;
+    o arquivo acompanha as colunas novas de `configuracao`.
+    """
+    for tabela in (Configuracao.__table__, configuracao_arquivo):
+        nome = tabela.name
+        existentes = {c["name"] for c in inspect(conn).get_columns(nome)}
+        for coluna in tabela.columns:
+            if coluna.name not in existentes:
+                logger.info("Migração: adicionando coluna %s.%s", nome, coluna.name)
+                tipo = coluna.type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {nome} ADD COLUMN {coluna.name} {tipo}"))
+
+
+def _preencher_executar_em(conn):
+    """Calcula `executar_em` das tarefas em aberto gravadas sem ele (antes da coluna
+    existir ou de FUSO_HORARIO ser definido). Só preenche horários ainda por vir:
+    os passados ficam sem `executar_em`, fora do alcance do trabalhador.
+    """
+    if FUSO_HORARIO is None:
+        return
+    tabela = Configuracao.__table__
+    pendentes = conn.execute(
+        select(tabela.c.id, tabela.c.data_para_execucao, tabela.c.hora, tabela.c.minuto).where(
+            tabela.c.executar_em.is_(None),
+            tabela.c.status.not_in(STATUS_FINAIS),
+            tabela.c.executou_sucesso.is_(False),
+        )
+    ).all()
+    agora = agora_utc()
+    valores = [(t.id, calcular_executar_em(t.data_para_execucao, t.hora, t.minuto)) for t in pendentes]
+    valores = [{"alvo": i, "executar_em": v} for i, v in valores if v is not None and v > agora]
+    if valores:
+        logger.info("Migração: preenchendo executar_em de %d tarefas", len(valores))
+        conn.execute(
+            update(tabela).where(tabela.c.id == bindparam("alvo")).values(executar_em=bindparam("executar_em")), valores
+        )
+
+
+# Índices de versões anteriores, cobertos por índices compostos atuais
+INDICES_OBSOLETOS = {"ix_configuracao_data_solicitacao", "ix_configuracao_atualizado_em"}
+
+
+def _migrar_indices(conn):
+    """Cria os índices declarados no modelo que ainda não existem no banco."""
+    existentes = {ix["name"] for ix in inspect(conn).get_indexes(Configuracao.__tablename__)}
+    for nome in INDICES_OBSOLETOS & existentes:
+        logger.info("Migração: removendo índice obsoleto %s", nome)
+        conn.execute(text(f'DROP INDEX "{nome}"'))
+    for index in Configuracao.__table__.indexes:
+        if index.name not in existentes:
+            logger.info("Migração: criando índice %s", index.name)
+            index.create(conn)
+
+
+def _migrar_autoincremento_eventos(conn):
+    """`evento_tarefa` criada sem AUTOINCREMENT (SQLite) é reconstruída com ele."""
+    if conn.dialect.name != "sqlite":
+        return
+    nome = EventoTarefa.__tablename__
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :nome"), {"nome": nome}).scalar()
+    if not sql or "AUTOINCREMENT" in sql.upper():
+        return
+    logger.info("Migração: recriando %s com AUTOINCREMENT", nome)
+    for ix in inspect(conn).get_indexes(nome):
+        conn.execute(text(f'DROP INDEX "{ix["name"]}"'))
+    conn.execute(text(f"ALTER TABLE {nome} RENAME TO _{nome}_antiga"))
+    EventoTarefa.__table__.create(conn)
+    # Copiar com os mesmos ids já registra o maior deles em sqlite_sequence
+    lista = ", ".join(c.name for c in EventoTarefa.__table__.columns)
+    conn.execute(text(f"INSERT INTO {nome} ({lista}) SELECT {lista} FROM _{nome}_antiga ORDER BY id"))
+    conn.execute(text(f"DROP TABLE _{nome}_antiga"))
+
+
+MIGRACOES = [
+    _migrar_chave_id, _migrar_colunas, _preencher_executar_em, _migrar_indices, _migrar_autoincremento_eventos,
+]
+
+
+async def migrar_banco():
+    # As migrações usam a API síncrona de inspeção; `run_sync` as executa na conexão async
+    async with engine.begin() as conn:
+        for migracao in MIGRACOES:
+            await conn.run_sync(migracao)
+
+
 # Inicialização
-def criar_banco():
-    SQLModel.metadata.create_all(engine)
+async def criar_banco():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    await migrar_banco()
+
+
+class NotificadorTarefas:
+    """Acorda os streams abertos quando uma tarefa muda neste processo.
+
+    A notificação é entregue a cada assinante pelo seu próprio event loop
+    (`call_soon_threadsafe`), então também pode ser disparada de outras threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assinantes: dict[asyncio.Event, asyncio.AbstractEventLoop] = {}
+
+    def assinar(self) -> asyncio.Event:
+        evento = asyncio.Event()
+        with self._lock:
+            self._assinantes[evento] = asyncio.get_running_loop()
+        return evento
+
+    def cancelar(self, evento: asyncio.Event) -> None:
+        with self._lock:
+            self._assinantes.pop(evento, None)
+
+    def notificar(self) -> None:
+        with self._lock:
+            assinantes = list(self._assinantes.items())
+        for evento, loop in assinantes:
+            try:
+                loop.call_soon_threadsafe(evento.set)
+            except RuntimeError:
+                # Loop já encerrado: o stream foi fechado sem cancelar a assinatura
+                self.cancelar(evento)
+
+
+notificador = NotificadorTarefas()
+
+# --- CACHE DE LEITURAS ---
+# Por processo: com vários workers, uma escrita em outro worker só aparece aqui
+# após CACHE_TTL segundos. CACHE_BACKEND=nenhum desliga o cache.
+cache = criar_cache(
+    os.environ.get("CACHE_BACKEND", "memoria"),
+    ttl=float(os.environ.get("CACHE_TTL", "10")),
+    tamanho_max=int(os.environ.get("CACHE_TAMANHO_MAX", "256")),
+)
+
+
+async def gravar_eventos(conn, linhas, origem: str) -> None:
+    """Anexa um evento por tarefa gravada, na mesma transação da escrita.
+
+    `linhas` são tarefas após a escrita (RETURNING). No Postgres, uma trava de
+    transação ordena as inserções, para os ids serem confirmados em ordem e um
+    leitor de /api/eventos nunca pular um id menor que chegue depois.
+    """
+    linhas = [t for t in linhas if t is not None]
+    if not linhas:
+        return
+    if conn.dialect.name == "postgresql":
+        await conn.execute(select(func.pg_advisory_xact_lock(TRAVA_EVENTOS)))
+    agora = agora_utc()
+    await conn.execute(EventoTarefa.__table__.insert(), [
+        {
+            "tarefa_id": t.id,
+            "status": t.status,
+            "msgsucesso": t.msgsucesso,
+            "executou_sucesso": t.executou_sucesso,
+            "agente": t.agente,
+            "origem": origem,
+            "criado_em": agora,
+        }
+        for t in linhas
+    ])
+
+
+def registrar_alteracao() -> None:
+    """Chamado após toda escrita em tarefas: invalida o cache e acorda os streams."""
+    cache.invalidar()
+    notificador.notificar()
+
+# --- TRABALHADOR DE AGENDAMENTO ---
+def _transicoes(agora: datetime, desde: Optional[datetime] = None) -> list:
+    """(novo status, condições, valores) na ordem aplicada: primeiro os prazos
+    esgotados, depois o que chegou no horário, por fim o que está para vencer.
+    Com `desde`, só tarefas com horário depois dele (a partida do trabalhador).
+    """
+    executar_em = Configuracao.executar_em
+    transicoes = [
+        (
+            "falha",
+            (
+                Configuracao.status.not_in(STATUS_FINAIS),
+                Configuracao.executou_sucesso.is_(False),
+                executar_em <= agora - timedelta(seconds=TRABALHADOR_PRAZO),
+            ),
+            {"status": "falha", "executou_sucesso": False, "msgsucesso": "sem confirmação do agente no prazo"},
+        ),
+        (
+            "executando",
+            (Configuracao.status == "agendado", Configuracao.reservado_por.is_not(None), executar_em <= agora),
+            {"status": "executando"},
+        ),
+        (
+            "agendado",
+            (
+                Configuracao.status.in_(STATUS_RESERVAVEIS),
+                Configuracao.reservado_por.is_(None),
+                executar_em <= agora + timedelta(seconds=TRABALHADOR_ANTECEDENCIA),
+            ),
+            {"status": "agendado"},
+        ),
+    ]
+    if desde is None:
+        return transicoes
+    return [(status, (*condicoes, executar_em > desde), valores) for status, condicoes, valores in transicoes]
+
+
+async def avancar_tarefas(agora: Optional[datetime] = None, desde: Optional[datetime] = None) -> dict:
+    """Aplica as transições de status vencidas; devolve quantas tarefas cada uma mudou.
+    São UPDATEs condicionais, então vários workers podem rodar isto ao mesmo tempo.
+    `desde` limita às tarefas com horário depois desse instante (ver `_transicoes`).
+    """
+    agora = agora or agora_utc()
+    tabela = Configuracao.__table__
+    contagem = {}
+    async with transacao_escrita() as conn:
+        for status, condicoes, valores in _transicoes(agora, desde):
+            stmt = update(tabela).where(*condicoes).values(**valores).returning(*tabela.c)
+            alteradas = (await conn.execute(stmt)).all()
+            await gravar_eventos(conn, alteradas, "trabalhador")
+            contagem[status] = len(alteradas)
+    for status, quantidade in contagem.items():
+        transicoes_trabalhador.inc(quantidade, status=status)
+    if any(contagem.values()):
+        logger.info("Trabalhador: transições %s", contagem)
+        registrar_alteracao()
+    return contagem
+
+
+async def _executar_trabalhador():
+    # Tarefas que venceram antes da partida (ex.: o servidor estava fora, ou
+    # FUSO_HORARIO acabou de ser definido) não viram `falha` em massa no primeiro ciclo
+    desde = agora_utc()
+    while True:
+        try:
+            await avancar_tarefas(desde=desde)
+        except Exception:
+            logger.exception("Trabalhador: falha ao avançar tarefas")
+        await asyncio.sleep(TRABALHADOR_INTERVALO)
+
+
+_trabalhador: Optional[asyncio.Task] = None
+
+
+async def iniciar_trabalhador():
+    global _trabalhador
+    if TRABALHADOR_INTERVALO > 0:
+        _trabalhador = asyncio.create_task(_executar_trabalhador())
+
+
+async def parar_trabalhador():
+    if _trabalhador is not None:
+        _trabalhador.cancel()
+
 
+# --- RETENÇÃO ---
+def _contagens_mensais(linhas) -> dict:
+    """Total, sucessos e falhas por mês (`data_para_execucao`) de um lote de tarefas."""
+    contagens: dict = {}
+    for t in linhas:
+        mes = (t.data_para_execucao or "")[:7] or "sem-data"
+        c = contagens.setdefault(mes, {"mes": mes, "total": 0, "sucessos": 0, "falhas": 0})
+        c["total"] += 1
+        c["sucessos"] += bool(t.executou_sucesso)
+        c["falhas"] += not t.executou_sucesso and t.status == "falha"
+    return contagens
 
-app = FastAPI(on_startup=[criar_banco])
+
+async def _somar_resumo(conn, contagens: dict) -> None:
+    tabela = ResumoMensal.__table__
+    insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}[conn.dialect.name]
+    stmt = insert(tabela).values(list(contagens.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["mes"], set_={c: tabela.c[c] + stmt.excluded[c] for c in ("total", "sucessos", "falhas")}
+    )
+    await conn.execute(stmt)
+
+
+def _gravar_ndjson(linhas, diretorio: Path) -> None:
+    """Acrescenta as tarefas a <diretorio>/configuracao-YYYY-MM.ndjson.gz (um membro gzip por lote).
+    Roda antes do DELETE: se o commit falhar, o lote pode reaparecer no arquivo (mesmo `id`).
+    """
+    por_mes: dict = {}
+    for t in linhas:
+        por_mes.setdefault((t.data_para_execucao or "")[:7] or "sem-data", []).append(t)
+    diretorio.mkdir(parents=True, exist_ok=True)
+    for mes, tarefas in por_mes.items():
+        caminho = diretorio / f"configuracao-{mes}.ndjson.gz"
+        with open(caminho, "ab") as bruto:
+            with gzip.GzipFile(fileobj=bruto, mode="ab") as f:
+                f.write("".join(json.dumps(tarefa_para_dict(t), ensure_ascii=False) + "\n" for t in tarefas).encode())
+            bruto.flush()
+            os.fsync(bruto.fileno())
+
+
+async def compactar_sqlite() -> None:
+    """VACUUM devolve ao disco o espaço das linhas removidas. Roda fora de transação e
+    na fila de escritas, então nenhuma escrita deste processo fica no meio.
+    """
+    async with _lock_escrita or nullcontext(), engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.exec_driver_sql("VACUUM")
+
+
+async def aplicar_retencao(
+    dias: int = RETENCAO_DIAS,
+    destino: str = RETENCAO_DESTINO,
+    diretorio: Path = RETENCAO_DIR,
+    vacuum: bool = True,
+    lote: int = RETENCAO_LOTE,
+) -> dict:
+    """Move para o arquivo as tarefas cujo horário (ou, sem ele, a solicitação) tem mais
+    de `dias` dias, em lotes de `lote` transações curtas, somando as contagens em
+    `resumo_mensal`; apaga também os eventos e as etapas cronometradas mais antigos
+    que a janela.
+    """
+    if destino not in DESTINOS_RETENCAO:
+        raise ValueError(f"destino de retenção inválido: {destino} (opções: {', '.join(DESTINOS_RETENCAO)})")
+    corte = agora_utc() - timedelta(days=dias)
+    tabela = Configuracao.__table__
+    antigas = or_(
+        tabela.c.executar_em < corte,
+        and_(tabela.c.executar_em.is_(None), tabela.c.data_solicitacao < datetime.now() - timedelta(days=dias)),
+    )
+    # Com vários workers no Postgres, cada um pega linhas diferentes
+    stmt = select(tabela).where(antigas).order_by(tabela.c.id).limit(lote).with_for_update(skip_locked=True)
+    arquivadas = 0
+    while True:
+        async with transacao_escrita() as conn:
+            linhas = (await conn.execute(stmt)).all()
+            if not linhas:
+                break
+            if destino == "tabela":
+                agora = agora_utc()
+                await conn.execute(configuracao_arquivo.insert(), [{**t._mapping, "arquivado_em": agora} for t in linhas])
+            else:
+                await asyncio.to_thread(_gravar_ndjson, linhas, diretorio)
+            await _somar_resumo(conn, _contagens_mensais(linhas))
+            await conn.execute(delete(tabela).where(tabela.c.id.in_([t.id for t in linhas])))
+        arquivadas += len(linhas)
+    async with transacao_escrita() as conn:
+        eventos = (await conn.execute(delete(EventoTarefa.__table__).where(EventoTarefa.criado_em < corte))).rowcount
+        etapas = (await conn.execute(delete(EtapaExecucao.__table__).where(EtapaExecucao.inicio < corte))).rowcount
+    if arquivadas:
+        registrar_alteracao()
+    compactado = vacuum and bool(arquivadas or eventos or etapas) and engine.dialect.name == "sqlite"
+    if compactado:
+        await compactar_sqlite()
+    resultado = {
+        "corte": corte.isoformat(),
+        "destino": destino,
+        "arquivadas": arquivadas,
+        "eventos_removidos": eventos,
+        "etapas_removidas": etapas,
+        "vacuum": compactado,
+    }
+    if arquivadas or eventos or etapas:
+        logger.info("Retenção: %s", resultado)
+    return resultado
+
+
+async def _executar_retencao():
+    while True:
+        try:
+            await aplicar_retencao()
+        except Exception:
+            logger.exception("Retenção: falha ao arquivar tarefas")
+        await asyncio.sleep(RETENCAO_INTERVALO)
+
+
+_retencao: Optional[asyncio.Task] = None
+
+
+async def iniciar_retencao():
+    global _retencao
+    if RETENCAO_INTERVALO > 0:
+        _retencao = asyncio.create_task(_executar_retencao())
+
+
+async def parar_retencao():
+    if _retencao is not None:
+        _retencao.cancel()
+
+
+app = FastAPI(
+    on_startup=[criar_banco, iniciar_trabalhador, iniciar_retencao], on_shutdown=[parar_trabalhador, parar_retencao]
+)
 templates = Jinja2Templates(directory="templates")
 
 
+@app.middleware("http")
+async def medir_requisicoes(request: Request, call_next):
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        resposta = await call_next(request)
+        status = resposta.status_code
+        return resposta
+    finally:
+        # Rótulo pelo molde da rota (ex.: /api/historico), não pela URL com parâmetros
+        rota = request.scope.get("route")
+        latencia_http.observar(
+            time.perf_counter() - inicio,
+            metodo=request.method,
+            rota=rota.path if rota else "desconhecida",
+            status=str(status),
+        )
+
+
+# --- CONSULTAS AUXILIARES ---
+def tarefa_para_dict(t) -> dict:
+    """Converte uma tarefa (entidade ou linha do banco) para tipos primitivos."""
+    return {
+        "id": t.id,
+        "data_para_execucao": t.data_para_execucao,
+        "hora": t.hora,
+        "minuto": t.minuto,
+        "executar_em": como_utc(t.executar_em).isoformat() if t.executar_em else None,
+        "origem": t.origem,
+        "data_solicitacao": t.data_solicitacao.isoformat() if hasattr(t.data_solicitacao, "isoformat") else str(t.data_solicitacao),
+        "executou_sucesso": bool(t.executou_sucesso),
+        "status": t.status,
+        "msgsucesso": t.msgsucesso,
+        "agente": t.agente,
+        "reservado_por": t.reservado_por,
+        "reservado_ate": t.reservado_ate.isoformat() if t.reservado_ate else None,
+        "atualizado_em": t.atualizado_em.isoformat() if t.atualizado_em else None,
+    }
+
+
+def _id_mais_recente(ate: Optional[datetime] = None) -> Select:
+    """SELECT do id da tarefa mais recente (índice (data_solicitacao, id), LIMIT 1).
+
+    Com `ate`, só considera tarefas solicitadas até esse instante.
+    """
+    stmt = select(Configuracao.id)
+    if ate is not None:
+        # data_solicitacao é hora local do servidor, sem fuso
+        stmt = stmt.where(Configuracao.data_solicitacao <= como_utc(ate).astimezone().replace(tzinfo=None))
+    # Um lote grava o mesmo data_solicitacao em todas as linhas: o id desempata
+    return stmt.order_by(Configuracao.data_solicitacao.desc(), Configuracao.id.desc()).limit(1)
+
+
+def _condicoes_reservavel(agente: str, agora: datetime) -> tuple:
+    return (
+        Configuracao.executou_sucesso.is_(False),
+        # `agendado` sem reserva é o que o trabalhador marcou como próximo do horário
+        or_(
+            Configuracao.status.in_(STATUS_RESERVAVEIS),
+            and_(Configuracao.status == "agendado", Configuracao.reservado_por.is_(None)),
+        ),
+        or_(Configuracao.agente.is_(None), Configuracao.agente == agente),
+        or_(Configuracao.reservado_ate.is_(None), Configuracao.reservado_ate < agora),
+    )
+
+
+def _id_proxima_reservavel(agente: str, agora: datetime, data_execucao: Optional[str]) -> Select:
+    """SELECT do id da próxima tarefa livre para `agente`, travando a linha.
+
+    No Postgres vira `FOR UPDATE SKIP LOCKED`: agentes concorrentes pulam a linha
+    já travada e pegam a seguinte, sem fila de espera. O SQLite ignora a cláusula,
+    mas serializa escritas, então o UPDATE que envolve este SELECT já é atômico.
+    """
+    stmt = select(Configuracao.id).where(*_condicoes_reservavel(agente, agora))
+    if data_execucao:
+        stmt = stmt.where(Configuracao.data_para_execucao == data_execucao)
+    else:
+        stmt = stmt.where(Configuracao.data_para_execucao >= agora.strftime("%Y-%m-%d"))
+    return (
+        stmt.order_by(Configuracao.data_para_execucao, Configuracao.hora, Configuracao.minuto)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+
+
+async def atualizar_tarefa(alvo, valores: dict, *condicoes, origem: str = "api"):
+    """Aplica `valores` à tarefa `alvo` e devolve a linha atualizada (ou None).
+
+    `alvo` é um id ou um SELECT de id (ex.: `_id_mais_recente()`). Executa um único
+    `UPDATE ... WHERE id = (SELECT ... LIMIT 1) [AND condicoes] RETURNING *`, sem
+    carregar entidades ORM. Sem `valores`, apenas lê a tarefa. Mudanças de status
+    geram um evento com a `origem` informada.
+    """
+    tabela = Configuracao.__table__
+    async with (transacao_escrita() if valores else engine.begin()) as conn:
+        linha = await _executar_atualizacao(conn, tabela, alvo, valores, condicoes)
+        if any(c in valores for c in CAMPOS_EVENTO):
+            await gravar_eventos(conn, [linha], origem)
+    if valores and linha is not None:
+        registrar_alteracao()
+    return linha
+
+
+async def _executar_atualizacao(conn, tabela, alvo, valores: dict, condicoes: tuple):
+    if not valores:
+        return (await conn.execute(select(tabela).where(Configuracao.id == _como_escalar(alvo)))).first()
+    filtro = and_(Configuracao.id == _como_escalar(alvo), *condicoes)
+    return (await conn.execute(update(tabela).where(filtro).values(**valores).returning(*tabela.c))).first()
+
+
+def _como_escalar(alvo):
+    return alvo.scalar_subquery() if isinstance(alvo, Select) else alvo
+
+
+def _valores_agendamento(dados: DadosAgendamento, agora: datetime) -> dict:
+    """Colunas gravadas ao (re)agendar um horário."""
+    return {
+        "data_para_execucao": dados.data_execucao,
+        "hora": dados.hora,
+        "minuto": dados.minuto,
+        "executar_em": calcular_executar_em(dados.data_execucao, dados.hora, dados.minuto),
+        "origem": "web",
+        "data_solicitacao": agora,
+        "atualizado_em": agora,
+        "executou_sucesso": False,
+        # Reagendar libera a tarefa para uma nova reserva
+        "agente": dados.agente,
+        "reservado_por": None,
+        "reservado_ate": None,
+        # Se quem chamou enviou status/msgsucesso, respeita; senão marca criado
+        "status": dados.status or "criado",
+        "msgsucesso": dados.msgsucesso,
+    }
+
+
+async def upsert_tarefas(linhas: list[dict], origem: str = "agendar") -> list:
+    """Cria/atualiza vários horários em um único `INSERT ... ON CONFLICT DO UPDATE`.
+
+    O conflito é na chave (data_para_execucao, hora, minuto); `origem` de uma
+    tarefa existente é preservada. Devolve as linhas gravadas (RETURNING).
+    """
+    if not linhas:
+        return []
+    tabela = Configuracao.__table__
+    dialetos = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+    if engine.dialect.name not in dialetos:
+        raise RuntimeError(f"upsert não suportado para o banco {engine.dialect.name}")
+    chave = ["data_para_execucao", "hora", "minuto"]
+    async with transacao_escrita() as conn:
+        # `atualizado_em` só depois da trava da transação (cursor do stream)
+        agora = datetime.now()
+        valores = [{**linha, "atualizado_em": agora} for linha in linhas]
+        stmt = dialetos[engine.dialect.name](tabela).values(valores)
+        atualizar = {c: stmt.excluded[c] for c in valores[0] if c not in chave and c != "origem"}
+        stmt = stmt.on_conflict_do_update(index_elements=chave, set_=atualizar).returning(*tabela.c)
+        gravadas = (await conn.execute(stmt)).all()
+        await gravar_eventos(conn, gravadas, origem)
+    registrar_alteracao()
+    return gravadas
+
+
+def expandir_recorrencia(rec: RecorrenciaAgendamento, agente: Optional[str]) -> list[DadosAgendamento]:
+    """Gera um agendamento por (dia permitido entre data_inicio e data_fim) x horário."""
+    horarios = []
+    for horario in rec.horarios:
+        try:
+            h, m = (int(p) for p in horario.split(":"))
+            if not (0 <= h < 24 and 0 <= m < 60):
+                raise ValueError
+        except ValueError:
+            raise HTTPException(status_code=422, detail=f"horário inválido: {horario!r} (use HH:MM)")
+        horarios.append((f"{h:02d}", f"{m:02d}"))
+    dias = (rec.data_fim - rec.data_inicio).days + 1
+    if dias <= 0:
+        raise HTTPException(status_code=422, detail="data_fim anterior a data_inicio")
+    itens = []
+    for i in range(dias):
+        dia = rec.data_inicio + timedelta(days=i)
+        if dia.weekday() not in rec.dias_semana:
+            continue
+        for h, m in horarios:
+            itens.append(DadosAgendamento(hora=h, minuto=m, data_execucao=dia.isoformat(), agente=agente))
+        if len(itens) > LOTE_MAXIMO:
+            raise HTTPException(status_code=422, detail=f"recorrência grande demais (máximo {LOTE_MAXIMO} horários)")
+    return itens
+
+
+async def responder_com_cache(request: Request, chave, produzir, *, valida=None, escreve: bool = False) -> Response:
+    """Responde `chave` a partir do cache (ou de `await produzir()`), com ETag.
+
+    Se o `If-None-Match` do cliente bate com o ETag, devolve 304 sem corpo.
+    `valida(dados)` pode recusar uma entrada em cache; `escreve=True` indica que
+    `produzir` grava no banco, e o resultado vale a partir dessa própria escrita.
+    """
+    entrada = cache.obter(chave)
+    if entrada is None or (valida and not valida(entrada.dados)):
+        geracao = cache.geracao
+        dados = await produzir()
+        entrada = EntradaCache.de(dados)
+        cache.guardar(chave, entrada, cache.geracao if escreve else geracao)
+    headers = {"ETag": entrada.etag, "Cache-Control": "no-cache"}
+    if entrada.etag in request.headers.get("if-none-match", ""):
+        cache.contar_nao_modificado()
+        return Response(status_code=304, headers=headers)
+    return Response(entrada.corpo, media_type="application/json", headers=headers)
+
+
 # --- ROTAS ---
 
 
@@ -77,143 +1075,538 @@ def home(request: Request):
 
 # 1. API para AGENDAR (Cria/Atualiza a tarefa)
 @app.post("/api/agendar")
-def agendar(dados: DadosAgendamento):
-    with Session(engine) as session:
-        # Busca por registro com a mesma data/hora/minuto
-        stmt = select(Configuracao).where(
-            (Configuracao.data_para_execucao == dados.data_execucao)
-            & (Configuracao.hora == dados.hora)
-            & (Configuracao.minuto == dados.minuto)
-        )
-        tarefa = session.exec(stmt).first()
-
-        if not tarefa:
-            tarefa = Configuracao(
-                data_para_execucao=dados.data_execucao,
-                hora=dados.hora,
-                minuto=dados.minuto,
-                origem="web",
-            )
-
-        # Atualiza os campos
-        tarefa.hora = dados.hora
-        tarefa.minuto = dados.minuto
-        tarefa.data_para_execucao = dados.data_execucao
-        tarefa.origem = tarefa.origem or "web_user"
-        tarefa.data_solicitacao = datetime.now()
-        tarefa.executou_sucesso = False
+async def agendar(dados: DadosAgendamento):
+    # Um único upsert pela chave data/hora/minuto (antes: SELECT + INSERT/UPDATE + refresh)
+    gravadas = await upsert_tarefas([_valores_agendamento(dados, datetime.now())])
 
-        # Se quem chamou enviou status/msgsucesso, respeita; senão marca criado
-        tarefa.status = dados.status or "criado"
-        tarefa.msgsucesso = dados.msgsucesso
+    # Retorna representação serializável do registro (instantes em UTC com fuso)
+    return tarefa_para_dict(gravadas[0]) if gravadas else {}
 
-        session.add(tarefa)
-        session.commit()
-        # Recarrega o objeto da sessão para garantir valores padrão/atualizados
-        try:
-            session.refresh(tarefa)
-        except Exception:
-            # fallback: re-query the record
-            tarefa = session.exec(
-                select(Configuracao).where(
-                    (Configuracao.data_para_execucao == dados.data_execucao)
-                    & (Configuracao.hora == dados.hora)
-                    & (Configuracao.minuto == dados.minuto)
-                )
-            ).first()
 
-        # Retorna representação serializável do registro
-        return tarefa.dict() if tarefa is not None else {}
+# 1b. API para AGENDAR EM LOTE (vários horários, ou uma recorrência, em uma transação)
+@app.post("/api/agendar-lote")
+async def agendar_lote(lote: AgendamentoLote):
+    """Cria/atualiza muitos horários de uma vez (ex.: um mês de pontos).
+
+    Aceita uma lista em `agendamentos` e/ou uma `recorrencia` ("dias úteis às
+    12:01 e 18:30 até X"); tudo é gravado em um único INSERT ... ON CONFLICT.
+    """
+    itens = [d if d.agente or not lote.agente else d.model_copy(update={"agente": lote.agente}) for d in lote.agendamentos]
+    if lote.recorrencia:
+        itens += expandir_recorrencia(lote.recorrencia, lote.agente)
+    # Um mesmo horário repetido no lote não pode ser atualizado duas vezes no mesmo comando
+    unicos = {(d.data_execucao, d.hora, d.minuto): d for d in itens}
+    if len(unicos) > LOTE_MAXIMO:
+        raise HTTPException(status_code=422, detail=f"lote com {len(unicos)} horários (máximo {LOTE_MAXIMO})")
+
+    agora = datetime.now()
+    gravadas = await upsert_tarefas([_valores_agendamento(d, agora) for d in unicos.values()])
+    tarefas = sorted((tarefa_para_dict(t) for t in gravadas), key=lambda t: (t["data_para_execucao"], t["hora"], t["minuto"]))
+    logger.info("Lote agendado: %d horários", len(tarefas))
+    return {"quantidade": len(tarefas), "tarefas": tarefas}
 
 
 # 2. API para CONSULTAR (O Ubuntu chama essa)
 @app.get("/api/consultar")
-def consultar():
-    with Session(engine) as session:
-        # Retorna todos os registros ordenados por `data_solicitacao DESC` (útil para depuração)
-        stmt = select(Configuracao).order_by(Configuracao.data_solicitacao.desc())
-        tarefas = session.exec(stmt).all()
-        if not tarefas:
+async def consultar(request: Request):
+    async def marcar_consultado():
+        # Marca o registro mais recente como consultado e o devolve em um único comando
+        mais_recente = await atualizar_tarefa(_id_mais_recente(), {"status": "consultado"}, origem="consultar")
+        if mais_recente is None:
             return {}
+        # Retorna apenas a tarefa mais recente (convertida para tipos primitivos)
+        return tarefa_para_dict(mais_recente)
 
-        # Marca o registro mais recente como consultado para compatibilidade
-        mais_recente = tarefas[0]
-        # (removed debug logs)
-        mais_recente.status = "consultado"
-        session.add(mais_recente)
-        session.commit()
+    # Enquanto nada for escrito, a mais recente continua "consultado": o UPDATE seria
+    # repetido sem efeito, então a resposta em cache é usada
+    return await responder_com_cache(
+        request,
+        ("consultar",),
+        marcar_consultado,
+        valida=lambda dados: not dados or dados.get("status") == "consultado",
+        escreve=True,
+    )
 
-        # Retorna apenas a tarefa mais recente (convertida para tipos primitivos)
-        def to_primitive(t):
-            return {
-                "data_para_execucao": t.data_para_execucao,
-                "hora": t.hora,
-                "minuto": t.minuto,
-                "origem": t.origem,
-                "data_solicitacao": t.data_solicitacao.isoformat() if hasattr(t.data_solicitacao, "isoformat") else str(t.data_solicitacao),
-                "executou_sucesso": bool(t.executou_sucesso),
-                "status": t.status,
-                "msgsucesso": t.msgsucesso,
-            }
 
-        return to_primitive(mais_recente)
+# 2b. API para RESERVAR a próxima tarefa (vários agentes consultando em paralelo)
+@app.post("/api/reservar-tarefa")
+async def reservar_tarefa(reserva: ReservaTarefa):
+    """Reserva atomicamente a próxima tarefa pendente para `reserva.agente`.
+
+    A reserva expira após `lease_segundos`; se o agente não confirmar a tarefa
+    (por id) até lá, ela volta a ficar disponível para outro agente.
+    """
+    agora = datetime.now()
+    alvo = _id_proxima_reservavel(reserva.agente, agora, reserva.data_execucao)
+    valores = {
+        "status": "consultado",
+        "reservado_por": reserva.agente,
+        "reservado_ate": agora + timedelta(seconds=reserva.lease_segundos),
+    }
+    tarefa = await atualizar_tarefa(alvo, valores, *_condicoes_reservavel(reserva.agente, agora), origem="reservar")
+    if tarefa is None:
+        return {}
+    logger.info("Tarefa %s reservada por %s", tarefa.id, reserva.agente)
+    return tarefa_para_dict(tarefa)
 
 
 @app.get("/api/listar-ultimas")
-def listar_ultimas(limit: int = 20):
-    """Retorna as últimas `limit` tarefas ordenadas por `data_solicitacao DESC`."""
-    with Session(engine) as session:
-        stmt = select(Configuracao).order_by(Configuracao.data_solicitacao.desc()).limit(limit)
-        tarefas = session.exec(stmt).all()
-        if not tarefas:
-            return []
-
-        def to_primitive(t):
-            return {
-                "data_para_execucao": t.data_para_execucao,
-                "hora": t.hora,
-                "minuto": t.minuto,
-                "origem": t.origem,
-                "data_solicitacao": t.data_solicitacao.isoformat() if hasattr(t.data_solicitacao, "isoformat") else str(t.data_solicitacao),
-                "executou_sucesso": bool(t.executou_sucesso),
-                "status": t.status,
-                "msgsucesso": t.msgsucesso,
-            }
-
-        return [to_primitive(t) for t in tarefas]
+async def listar_ultimas(request: Request, limit: int = 20):
+    """Retorna as últimas `limit` tarefas ordenadas por `data_solicitacao DESC`.
+    Mantida por compatibilidade; use /api/historico (paginado e com filtros).
+    """
+    limite = min(max(limit, 1), HISTORICO_LIMITE_MAX)
+
+    async def listar():
+        return [tarefa_para_dict(t) for t in await pagina_historico(FiltroHistorico(), None, limite)]
+
+    return await responder_com_cache(request, ("listar-ultimas", limite), listar)
+
+
+def _filtro_historico(
+    status: list[str] = Query([]),
+    origem: Optional[str] = None,
+    data_de: Optional[date] = None,
+    data_ate: Optional[date] = None,
+) -> FiltroHistorico:
+    return FiltroHistorico(status=status, origem=origem, data_de=data_de, data_ate=data_ate)
+
+
+def codificar_cursor(t) -> str:
+    return f"{t.data_solicitacao.isoformat()}|{t.id}"
+
+
+def decodificar_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        momento, tarefa_id = cursor.rsplit("|", 1)
+        return datetime.fromisoformat(momento), int(tarefa_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"cursor inválido: {cursor}")
+
+
+async def pagina_historico(filtro: FiltroHistorico, cursor: Optional[tuple[datetime, int]], limite: int) -> list:
+    """Uma página do histórico, da mais recente para a mais antiga.
+
+    Paginação por chave (`(data_solicitacao, id) < cursor`), que usa o índice
+    composto e custa o mesmo em qualquer página; só colunas, sem entidades ORM.
+    """
+    ordem = tuple_(Configuracao.data_solicitacao, Configuracao.id)
+    stmt = select(Configuracao.__table__)
+    if filtro.status:
+        stmt = stmt.where(Configuracao.status.in_(filtro.status))
+    if filtro.origem:
+        stmt = stmt.where(Configuracao.origem == filtro.origem)
+    if filtro.data_de:
+        stmt = stmt.where(Configuracao.data_para_execucao >= filtro.data_de.isoformat())
+    if filtro.data_ate:
+        stmt = stmt.where(Configuracao.data_para_execucao <= filtro.data_ate.isoformat())
+    if cursor:
+        stmt = stmt.where(ordem < tuple_(*cursor))
+    stmt = stmt.order_by(Configuracao.data_solicitacao.desc(), Configuracao.id.desc()).limit(limite)
+    async with engine.connect() as conn:
+        return (await conn.execute(stmt)).all()
+
+
+# 2c. HISTÓRICO paginado e filtrável (substitui /api/listar-ultimas)
+@app.get("/api/historico")
+async def historico(
+    request: Request,
+    filtro: FiltroHistorico = Depends(_filtro_historico),
+    cursor: Optional[str] = None,
+    limit: int = Query(min(20, HISTORICO_LIMITE_MAX), ge=1, le=HISTORICO_LIMITE_MAX),
+):
+    """Página de tarefas (mais recentes primeiro). Para a próxima página, repasse
+    `proximo_cursor` em `cursor`; `proximo_cursor` nulo indica o fim.
+    """
+    posicao = decodificar_cursor(cursor) if cursor else None
+
+    async def pagina():
+        tarefas = await pagina_historico(filtro, posicao, limit)
+        proximo = codificar_cursor(tarefas[-1]) if len(tarefas) == limit else None
+        return {"tarefas": [tarefa_para_dict(t) for t in tarefas], "proximo_cursor": proximo}
+
+    chave = ("historico", filtro.model_dump_json(), cursor, limit)
+    return await responder_com_cache(request, chave, pagina)
+
+
+CAMPOS_EXPORTACAO = [
+    "id", "data_para_execucao", "hora", "minuto", "executar_em", "origem", "data_solicitacao",
+    "executou_sucesso", "status", "msgsucesso", "agente", "reservado_por", "reservado_ate", "atualizado_em",
+]
+
+
+async def _exportar_historico(filtro: FiltroHistorico, formato: str):
+    """Gera o histórico completo em NDJSON ou CSV, lendo o banco página a página."""
+    if formato == "csv":
+        buffer = io.StringIO()
+        escritor = csv.DictWriter(buffer, fieldnames=CAMPOS_EXPORTACAO, extrasaction="ignore")
+        escritor.writeheader()
+    cursor = None
+    while True:
+        tarefas = await pagina_historico(filtro, cursor, HISTORICO_LIMITE_MAX)
+        if formato == "csv":
+            escritor.writerows(tarefa_para_dict(t) for t in tarefas)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            yield "".join(json.dumps(tarefa_para_dict(t), ensure_ascii=False) + "\n" for t in tarefas)
+        if len(tarefas) < HISTORICO_LIMITE_MAX:
+            return
+        cursor = (tarefas[-1].data_solicitacao, tarefas[-1].id)
+
+
+@app.get("/api/historico/exportar")
+async def exportar_historico(
+    filtro: FiltroHistorico = Depends(_filtro_historico),
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+):
+    """Exporta (streaming) todas as tarefas que atendem ao filtro, para auditoria."""
+    tipo = "text/csv" if formato == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _exportar_historico(filtro, formato),
+        media_type=tipo,
+        headers={"Content-Disposition": f'attachment; filename="historico.{formato}"'},
+    )
 
 
 # 3. API para CONFIRMAR EXECUÇÃO (Atualiza status/msgsucesso)
+def _valores_confirmacao(confirm: ConfirmacaoExecucao) -> dict:
+    valores = {}
+    if confirm.status:
+        valores["status"] = confirm.status
+    if confirm.msgsucesso is not None:
+        valores["msgsucesso"] = confirm.msgsucesso
+    # Ajusta executou_sucesso quando aplicável
+    if confirm.sucesso is not None:
+        valores["executou_sucesso"] = bool(confirm.sucesso)
+    elif confirm.status == "sucesso":
+        valores["executou_sucesso"] = True
+    elif confirm.status == "falha":
+        valores["executou_sucesso"] = False
+    return valores
+
+
+async def gravar_etapas(conn, tarefa_id: Optional[int], etapas: list[DadosEtapa]) -> None:
+    if etapas:
+        # Grava em UTC (o SQLite descarta o fuso; ver `como_utc`)
+        linhas = [
+            {**e.model_dump(), "inicio": como_utc(e.inicio).astimezone(timezone.utc), "tarefa_id": tarefa_id}
+            for e in etapas
+        ]
+        await conn.execute(EtapaExecucao.__table__.insert(), linhas)
+
+
 @app.post("/api/confirmar-execucao")
-def confirmar(confirm: ConfirmacaoExecucao):
-    with Session(engine) as session:
-        # Atualiza o registro mais recente (mesma abordagem de consultar)
-        # Seleciona pelo registro mais recentemente solicitado (consistente com /api/consultar)
-        stmt = select(Configuracao).order_by(Configuracao.data_solicitacao.desc())
-        tarefa = session.exec(stmt).first()
-        if tarefa:
-            # Atualiza status/msg
-            if confirm.status:
-                tarefa.status = confirm.status
-            if confirm.msgsucesso is not None:
-                tarefa.msgsucesso = confirm.msgsucesso
-            # Ajusta executou_sucesso quando aplicável
-            if confirm.sucesso is not None:
-                tarefa.executou_sucesso = bool(confirm.sucesso)
+async def confirmar(confirm: ConfirmacaoExecucao):
+    # Atualiza a tarefa informada por id ou, sem id, a mais recente (como consultar)
+    valores = _valores_confirmacao(confirm)
+    if confirm.id is not None:
+        tarefa = await atualizar_tarefa(confirm.id, valores, origem="confirmar")
+        if tarefa is None:
+            raise HTTPException(status_code=404, detail=f"tarefa {confirm.id} não encontrada")
+    else:
+        tarefa = await atualizar_tarefa(_id_mais_recente(confirm.reportado_em), valores, origem="confirmar")
+    if confirm.etapas:
+        async with transacao_escrita() as conn:
+            await gravar_etapas(conn, tarefa.id if tarefa is not None else None, confirm.etapas)
+    if tarefa is None:
+        return {"status": "recebido"}
+    # Só conta relatórios aplicados a uma tarefa (não os 404 nem os sem tarefa)
+    relatorios_recebidos.inc(status=confirm.status or "")
+    logger.info("Relatório recebido: status=%s msgsucesso=%s", tarefa.status, tarefa.msgsucesso)
+    return {"status": "recebido", "tarefa": tarefa_para_dict(tarefa)}
+
+
+@app.post("/api/confirmar-execucao-lote")
+async def confirmar_lote(lote: LoteConfirmacoes):
+    """Aplica vários relatórios em ordem, numa única transação (ex.: a fila de um
+    agente que ficou sem acesso à API). Ids inexistentes não invalidam o lote.
+    """
+    if len(lote.confirmacoes) > LOTE_MAXIMO:
+        raise HTTPException(status_code=422, detail=f"lote com mais de {LOTE_MAXIMO} relatórios")
+    tabela = Configuracao.__table__
+    resultados = []
+    async with transacao_escrita() as conn:
+        for confirm in lote.confirmacoes:
+            alvo = confirm.id if confirm.id is not None else _id_mais_recente(confirm.reportado_em)
+            valores = _valores_confirmacao(confirm)
+            linha = await _executar_atualizacao(conn, tabela, alvo, valores, ())
+            if any(c in valores for c in CAMPOS_EVENTO):
+                await gravar_eventos(conn, [linha], "confirmar")
+            await gravar_etapas(conn, linha.id if linha is not None else None, confirm.etapas)
+            resultados.append({"id": linha.id if linha is not None else confirm.id, "encontrada": linha is not None})
+    # Contados só depois do commit, e só os que acharam a tarefa
+    for confirm, resultado in zip(lote.confirmacoes, resultados):
+        if resultado["encontrada"]:
+            relatorios_recebidos.inc(status=confirm.status or "")
+    if any(r["encontrada"] for r in resultados):
+        registrar_alteracao()
+    logger.info("Lote de %d relatórios recebido", len(resultados))
+    return {"status": "recebido", "resultados": resultados}
+
+
+# 3b. EVENTOS: mudanças de status em ordem, para sincronizar sem reler as listas
+def evento_para_dict(e) -> dict:
+    return {
+        "id": e.id,
+        "tarefa_id": e.tarefa_id,
+        "status": e.status,
+        "msgsucesso": e.msgsucesso,
+        "executou_sucesso": e.executou_sucesso,
+        "agente": e.agente,
+        "origem": e.origem,
+        "criado_em": como_utc(e.criado_em).isoformat(),
+    }
+
+
+async def _eventos_desde(desde: int, limite: int, agente: Optional[str], tarefa_id: Optional[int]) -> list:
+    stmt = select(EventoTarefa.__table__).where(EventoTarefa.id > desde)
+    if agente:
+        stmt = stmt.where(or_(EventoTarefa.agente.is_(None), EventoTarefa.agente == agente))
+    if tarefa_id is not None:
+        stmt = stmt.where(EventoTarefa.tarefa_id == tarefa_id)
+    async with engine.connect() as conn:
+        return (await conn.execute(stmt.order_by(EventoTarefa.id).limit(limite))).all()
+
+
+@app.get("/api/eventos")
+async def listar_eventos(
+    desde: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=HISTORICO_LIMITE_MAX),
+    agente: Optional[str] = None,
+    tarefa_id: Optional[int] = None,
+    espera: float = Query(0, ge=0, le=60),
+):
+    """Eventos de status com id > `desde`, em ordem; `cursor` vai no próximo `desde`.
+
+    Sem `desde`, devolve só o cursor atual, para começar "de agora" depois de
+    carregar a lista inicial. Com `espera`, se ainda não há eventos, aguarda até
+    `espera` segundos por uma escrita neste processo (long polling).
+    """
+    if desde is None:
+        async with engine.connect() as conn:
+            ultimo = (await conn.execute(select(func.max(EventoTarefa.id)))).scalar()
+        return {"eventos": [], "cursor": ultimo or 0, "mais": False}
+
+    # Assina antes de consultar: uma escrita durante a consulta não se perde
+    notificacao = notificador.assinar() if espera else None
+    try:
+        eventos = await _eventos_desde(desde, limit + 1, agente, tarefa_id)
+        if not eventos and notificacao is not None:
+            try:
+                await asyncio.wait_for(notificacao.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
             else:
-                if confirm.status == "sucesso":
-                    tarefa.executou_sucesso = True
-                elif confirm.status == "falha":
-                    tarefa.executou_sucesso = False
+                eventos = await _eventos_desde(desde, limit + 1, agente, tarefa_id)
+    finally:
+        if notificacao is not None:
+            notificador.cancelar(notificacao)
+    mais = len(eventos) > limit
+    eventos = eventos[:limit]
+    return {
+        "eventos": [evento_para_dict(e) for e in eventos],
+        "cursor": eventos[-1].id if eventos else desde,
+        "mais": mais,
+    }
+
+
+@app.get("/api/etapas/resumo")
+async def resumo_etapas(
+    dias: int = Query(30, ge=1, le=366),
+    agrupar: str = Query("total", pattern="^(total|dia)$"),
+):
+    """p50/p95/máximo da duração de cada etapa do login-ia.py nos últimos `dias`,
+    no total ou por dia (`agrupar=dia`, para ver a evolução).
+    """
+    desde = agora_utc() - timedelta(days=dias)
+    stmt = select(EtapaExecucao.etapa, EtapaExecucao.inicio, EtapaExecucao.duracao_ms, EtapaExecucao.resultado).where(
+        EtapaExecucao.inicio >= desde
+    )
+    async with engine.connect() as conn:
+        linhas = (await conn.execute(stmt)).all()
+    grupos: dict = {}
+    for etapa, inicio, duracao, resultado in linhas:
+        periodo = como_utc(inicio).date().isoformat() if agrupar == "dia" else None
+        grupo = grupos.setdefault((etapa, periodo), {"duracoes": [], "falhas": 0})
+        grupo["duracoes"].append(duracao)
+        grupo["falhas"] += resultado != "ok"
+    resumo = []
+    for (etapa, periodo), grupo in sorted(grupos.items(), key=lambda item: (item[0][0], item[0][1] or "")):
+        duracoes = sorted(grupo["duracoes"])
+        resumo.append({
+            "etapa": etapa,
+            "periodo": periodo,
+            "quantidade": len(duracoes),
+            "falhas": grupo["falhas"],
+            "p50_ms": percentil(duracoes, 50),
+            "p95_ms": percentil(duracoes, 95),
+            "max_ms": duracoes[-1],
+        })
+    return {"desde": desde.isoformat(), "etapas": resumo}
+
+
+async def calcular_resumo_mensal() -> list:
+    """Total/sucessos/falhas por mês: o resumo das tarefas arquivadas somado às que
+    ainda estão em `configuracao`.
+    """
+    mes = func.substr(Configuracao.data_para_execucao, 1, 7)
+    stmt = select(mes, Configuracao.status, Configuracao.executou_sucesso, func.count()).group_by(
+        mes, Configuracao.status, Configuracao.executou_sucesso
+    )
+    async with engine.connect() as conn:
+        arquivados = (await conn.execute(select(ResumoMensal.__table__))).all()
+        ativos = (await conn.execute(stmt)).all()
+    meses = {r.mes: {"mes": r.mes, "total": r.total, "sucessos": r.sucessos, "falhas": r.falhas} for r in arquivados}
+    for mes_tarefa, status, sucesso, quantidade in ativos:
+        mes_tarefa = mes_tarefa or "sem-data"
+        c = meses.setdefault(mes_tarefa, {"mes": mes_tarefa, "total": 0, "sucessos": 0, "falhas": 0})
+        c["total"] += quantidade
+        c["sucessos"] += quantidade if sucesso else 0
+        c["falhas"] += quantidade if not sucesso and status == "falha" else 0
+    return [meses[m] for m in sorted(meses)]
+
+
+@app.get("/api/resumo-mensal")
+async def resumo_mensal():
+    """Sucessos e falhas por mês, incluindo as tarefas já arquivadas pela retenção."""
+    return {"meses": await calcular_resumo_mensal()}
+
+
+# 4. Tarefas que vencem numa janela de tempo (para o agente buscar só o necessário)
+@app.get("/api/tarefas/devidas")
+async def tarefas_devidas(agente: Optional[str] = None, janela: int = Query(600, ge=0, le=86400)):
+    """Tarefas não finalizadas com `executar_em` nos próximos `janela` segundos,
+    incluindo as atrasadas há menos de TRABALHADOR_PRAZO, em ordem de horário.
+    """
+    agora = agora_utc()
+    stmt = select(Configuracao.__table__).where(
+        Configuracao.executar_em.between(agora - timedelta(seconds=TRABALHADOR_PRAZO), agora + timedelta(seconds=janela)),
+        Configuracao.status.not_in(STATUS_FINAIS),
+    )
+    if agente:
+        stmt = stmt.where(or_(Configuracao.agente.is_(None), Configuracao.agente == agente))
+    async with engine.connect() as conn:
+        tarefas = (await conn.execute(stmt.order_by(Configuracao.executar_em))).all()
+    return {"agora": agora.isoformat(), "tarefas": [tarefa_para_dict(t) for t in tarefas]}
+
+
+async def _tarefas_alteradas_desde(desde: tuple[datetime, int], agente: Optional[str]) -> list:
+    """Até 100 tarefas depois de `desde` em (atualizado_em, id): um lote grava o mesmo
+    `atualizado_em` em muitas linhas, e o id desempata sem pular nenhuma.
+    """
+    stmt = select(Configuracao.__table__).where(tuple_(Configuracao.atualizado_em, Configuracao.id) > tuple_(*desde))
+    if agente:
+        stmt = stmt.where(or_(Configuracao.agente.is_(None), Configuracao.agente == agente))
+    async with engine.connect() as conn:
+        return (await conn.execute(stmt.order_by(Configuracao.atualizado_em, Configuracao.id).limit(100))).all()
+
+
+async def _eventos_tarefas(request: Request, desde: tuple[datetime, int], agente: Optional[str]):
+    """Gera eventos SSE `tarefa` para cada tarefa criada/alterada após o cursor `desde`."""
+    evento = notificador.assinar()
+    try:
+        while not await request.is_disconnected():
+            # Limpa antes de consultar: uma escrita durante a consulta acorda o próximo wait
+            evento.clear()
+            tarefas = await _tarefas_alteradas_desde(desde, agente)
+            for t in tarefas:
+                desde = (t.atualizado_em, t.id)
+                dados = json.dumps(tarefa_para_dict(t), ensure_ascii=False)
+                yield f"id: {t.atualizado_em.isoformat()}|{t.id}\nevent: tarefa\ndata: {dados}\n\n"
+            if len(tarefas) == 100:
+                # Página cheia: busca a próxima sem esperar nova escrita
+                continue
+            try:
+                await asyncio.wait_for(evento.wait(), STREAM_INTERVALO)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+    finally:
+        notificador.cancelar(evento)
+
+
+# 4. STREAM de tarefas (SSE): agentes mantêm a conexão aberta em vez de consultar via cron
+@app.get("/api/tarefas/stream")
+async def stream_tarefas(request: Request, agente: Optional[str] = None, desde: Optional[str] = None):
+    """Envia (Server-Sent Events) as tarefas novas/alteradas, visíveis para `agente`.
 
-            session.add(tarefa)
-            session.commit()
-            logger.info("Relatório recebido: status=%s msgsucesso=%s", tarefa.status, tarefa.msgsucesso)
-            return {"status": "recebido", "tarefa": tarefa.dict()}
-    return {"status": "recebido"}
+    O cursor é o `id` de cada evento (`atualizado_em|id` da tarefa); ao reconectar, o
+    cliente o devolve em `Last-Event-ID` (ou `?desde=`). Sem cursor, só envia
+    alterações a partir da conexão. Um cursor só com o timestamp (versões
+    anteriores) continua aceito.
+    """
+    cursor = request.headers.get("last-event-id") or desde
+    try:
+        if not cursor:
+            inicio = (datetime.now(), 0)
+        elif "|" in cursor:
+            momento, tarefa_id = cursor.rsplit("|", 1)
+            inicio = (datetime.fromisoformat(momento), int(tarefa_id))
+        else:
+            inicio = (datetime.fromisoformat(cursor), 2**31 - 1)  # depois de qualquer id nesse instante
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"cursor inválido: {cursor}")
+    return StreamingResponse(
+        _eventos_tarefas(request, inicio, agente),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/cache/estatisticas")
+async def estatisticas_cache():
+    """Hits/misses/304s e tamanho do cache de leituras deste processo."""
+    return cache.resumo()
+
+
+def _coletar_cache() -> None:
+    eventos_cache.substituir({(evento,): valor for evento, valor in cache.estatisticas.items()})
+    tamanho_cache.definir(len(cache))
+
+
+metricas.coletores.append(_coletar_cache)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def exportar_metricas():
+    """Métricas deste processo no formato texto do Prometheus."""
+    stmt = select(Configuracao.status, func.count()).group_by(Configuracao.status)
+    async with engine.connect() as conn:
+        contagens = (await conn.execute(stmt)).all()
+    tarefas_por_status.substituir({(status,): quantidade for status, quantidade in contagens})
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/health-check")
 async def health_check():
     agora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     return {"status": "ok", "message": f"[{agora}] Resposta do health-check"}
+
+
+# --- LINHA DE COMANDO (manutenção; o servidor roda com `uvicorn main:app`) ---
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tarefas de manutenção do banco da API.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    retencao = comandos.add_parser("retencao", help="arquiva as tarefas antigas e compacta o SQLite")
+    retencao.add_argument("--dias", type=int, default=RETENCAO_DIAS, help="janela mantida em `configuracao`")
+    retencao.add_argument("--destino", choices=DESTINOS_RETENCAO, default=RETENCAO_DESTINO)
+    retencao.add_argument("--diretorio", type=Path, default=RETENCAO_DIR, help="destino dos NDJSON")
+    retencao.add_argument("--sem-vacuum", action="store_true", help="não roda VACUUM no SQLite")
+    comandos.add_parser("resumo-mensal", help="mostra sucessos/falhas por mês")
+    args = parser.parse_args()
+
+    async def executar():
+        await criar_banco()
+        try:
+            if args.comando == "retencao":
+                return await aplicar_retencao(args.dias, args.destino, args.diretorio, not args.sem_vacuum)
+            return await calcular_resumo_mensal()
+        finally:
+            await engine.dispose()
+
+    print(json.dumps(asyncio.run(executar()), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Métricas em processo no formato texto do Prometheus, expostas em /metrics (main.py).
+
+Contadores, medidores e histogramas com rótulos, sem dependências externas.
+Com vários workers, cada processo tem as suas métricas (o Prometheus agrega).
+"""
+import bisect
+import threading
+from abc import ABC, abstractmethod
+
+# Limites (segundos) padrão dos histogramas de latência
+LIMITES_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LE_INFINITO = 'le="+Inf"'
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(nomes: tuple, valores: tuple, extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def percentil(valores, p: float) -> float:
+    """Percentil `p` (0-100) por posição mais próxima (nearest-rank); 0.0 sem valores.
+
+    Única definição usada nos relatórios de latência (/api/etapas/resumo,
+    benchmark_api.py, replay de CAPTCHAs), para os números se compararem.
+    """
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))]
+
+
+def _numero(valor: float) -> str:
+    return repr(float(valor)) if valor != float("inf") else "+Inf"
+
+
+class _Metrica(ABC):
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        self._valores: dict = {}
+
+    def _chave(self, rotulos: dict) -> tuple:
+        return tuple(rotulos.get(n, "") for n in self.rotulos)
+
+    @abstractmethod
+    def _amostras(self):
+        """Linhas das séries no formato texto; chamado com o lock."""
+
+    def exportar(self) -> str:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._lock:
+            linhas.extend(self._amostras())
+        return "\n".join(linhas)
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def substituir(self, valores: dict) -> None:
+        """Troca todas as séries de uma vez: {(valor_rotulo, ...): valor}. Usado por
+        coletores que copiam contagens mantidas em outro lugar (ex.: o cache).
+        """
+        with self._lock:
+            self._valores = dict(valores)
+
+    def _amostras(self):
+        for chave, valor in sorted(self._valores.items()):
+            yield f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}"
+
+
+class Medidor(Contador):
+    """Valor que sobe e desce (ou é recalculado a cada coleta, via `substituir`)."""
+
+    tipo = "gauge"
+
+    def definir(self, valor: float, **rotulos) -> None:
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = (), limites: tuple = LIMITES_LATENCIA):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+
+    def observar(self, valor: float, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._valores.get(chave)
+            if serie is None:
+                # [contagem por faixa..., soma, total]
+                serie = self._valores[chave] = [0] * len(self.limites) + [0.0, 0]
+            indice = bisect.bisect_left(self.limites, valor)
+            if indice < len(self.limites):
+                serie[indice] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def _amostras(self):
+        for chave, serie in sorted(self._valores.items()):
+            acumulado = 0
+            for limite, quantidade in zip(self.limites, serie):
+                acumulado += quantidade
+                le = 'le="%s"' % _numero(limite)
+                yield f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {acumulado}"
+            yield f"{self.nome}_bucket{_rotulos(self.rotulos, chave, LE_INFINITO)} {serie[-1]}"
+            yield f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(serie[-2])}"
+            yield f"{self.nome}_count{_rotulos(self.rotulos, chave)} {serie[-1]}"
+
+
+class Registro:
+    """Conjunto de métricas de um processo; `coletores` atualizam medidores antes de exportar."""
+
+    def __init__(self):
+        self._metricas: list = []
+        self.coletores: list = []
+
+    def _registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome: str, ajuda: str, rotulos: tuple = ()) -> Contador:
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome: str, ajuda: str, rotulos: tuple = ()) -> Medidor:
+        return self._registrar(Medidor(nome, ajuda, rotulos))
+
+    def histograma(self, nome: str, ajuda: str, rotulos: tuple = (), limites: tuple = LIMITES_LATENCIA) -> Histograma:
+        return self._registrar(Histograma(nome, ajuda, rotulos, limites))
+
+    def exportar(self) -> str:
+        for coletor in self.coletores:
+            coletor()
+        return "\n".join(m.exportar() for m in self._metricas) + "\n"
@@ -0,0 +1,375 @@
+"""Motor de registro sem navegador: as mesmas chamadas XHR que o app Angular faz.
+
+Alternativa ao Firefox do login-ia.py (MOTOR_REGISTRO=http): login com CAPTCHA,
+"Registrar Frequência" e leitura da tabela de registros com uma `requests.Session`
+(keep-alive). A imagem do CAPTCHA é buscada direto na API, e o token de acesso
+fica em HTTP_TOKEN_ARQUIVO e é reaproveitado enquanto válido, então na maioria
+das execuções nem há login.
+
+As rotas são relativas a SITE_API_URL (padrão: origem de URL_SITE + "/api") e
+podem ser ajustadas por HTTP_ROTA_<NOME>. Respostas fora do formato esperado
+(rota inexistente, HTML no lugar de JSON) levantam `SiteIncompativel`; antes
+do registro, o login-ia.py então volta para o Selenium. Depois que o registro é
+aceito, nada volta para o Selenium (seria um segundo ponto).
+
+Para testar sem o site real há um mock local das mesmas rotas:
+
+    python motor_http.py mock --porta 8080 [--captcha ABC12]
+    URL_SITE=http://127.0.0.1:8080/ MOTOR_REGISTRO=http python login-ia.py
+"""
+import argparse
+import base64
+import binascii
+import datetime
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urljoin, urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# A sessão não verifica o certificado do site (ver ClienteSite); sem isto, cada chamada
+# gera um InsecureRequestWarning
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+SITE_API_URL = os.getenv("SITE_API_URL")
+ROTAS_HTTP = {
+    nome: os.getenv(f"HTTP_ROTA_{nome.upper()}", padrao)
+    for nome, padrao in {
+        "captcha": "auth/captcha",
+        "login": "auth/login",
+        "registrar": "frequencia-ponto/registrar-ponto",
+        "registros": "frequencia-ponto",
+    }.items()
+}
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+HTTP_TOKEN_ARQUIVO = Path(os.getenv("HTTP_TOKEN_ARQUIVO", Path.home() / ".cache" / "descall" / "token-http.json"))
+# Validade assumida quando o token não é um JWT com `exp` (segundos)
+HTTP_TOKEN_TTL = float(os.getenv("HTTP_TOKEN_TTL", "1800"))
+# Margem para não usar um token que vai expirar no meio da execução (segundos)
+HTTP_TOKEN_MARGEM = 60
+
+RE_HORARIO = re.compile(r"\b\d{2}:\d{2}\b")
+CAMPOS_TOKEN = ("token", "access_token", "accessToken", "id_token", "jwt")
+CAMPOS_LISTA = ("registros", "itens", "content", "data", "frequencias")
+
+
+class SiteIncompativel(Exception):
+    """A API do site não respondeu como o motor espera (rota, formato)."""
+
+
+class SessaoExpirada(Exception):
+    """O site recusou o token (401/403): é preciso fazer login de novo."""
+
+
+def api_padrao(url_site: Optional[str]) -> Optional[str]:
+    """Origem de URL_SITE + /api/ (o app Angular fica em /#/... na mesma origem)."""
+    if not url_site:
+        return None
+    partes = urlsplit(url_site)
+    return f"{partes.scheme}://{partes.netloc}/api/"
+
+
+def expiracao_jwt(token: str) -> Optional[float]:
+    """`exp` (epoch) do payload de um JWT, sem validar a assinatura; None se não for JWT."""
+    try:
+        payload = token.split(".")[1]
+        dados = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(dados["exp"])
+    except (IndexError, KeyError, TypeError, ValueError, binascii.Error):
+        return None
+
+
+def bytes_imagem(valor: str) -> bytes:
+    """Bytes de uma imagem em data URI ou base64 puro."""
+    if valor.startswith("data:"):
+        valor = valor.split(",", 1)[1]
+    return base64.b64decode(valor)
+
+
+def normalizar_registro(item: dict) -> dict:
+    """Item da API -> {"data": "DD/MM/YYYY", "dia": str, "marcas": ["HH:MM", ...]},
+    o mesmo formato que o login-ia.py lê da tabela na tela.
+    """
+    data = str(item.get("data") or item.get("dataRegistro") or item.get("dia_registro") or "")
+    if re.match(r"\d{4}-\d{2}-\d{2}", data):
+        data = datetime.date.fromisoformat(data[:10]).strftime("%d/%m/%Y")
+    marcas = item.get("marcas") or item.get("marcacoes") or item.get("registros") or []
+    if isinstance(marcas, str):
+        marcas = RE_HORARIO.findall(marcas)
+    else:
+        marcas = [h for m in marcas for h in RE_HORARIO.findall(str(m.get("hora", "") if isinstance(m, dict) else m))]
+    return {"data": data, "dia": str(item.get("dia") or item.get("diaSemana") or ""), "marcas": marcas}
+
+
+class ClienteSite:
+    """Sessão HTTP com a API do site, com o token persistido entre execuções."""
+
+    def __init__(self, api_url: str, arquivo_token=HTTP_TOKEN_ARQUIVO, timeout: float = HTTP_TIMEOUT):
+        self.api_url = api_url if api_url.endswith("/") else api_url + "/"
+        self.arquivo_token = Path(arquivo_token)
+        self.timeout = timeout
+        self.session = requests.Session()
+        # O site usa certificado não confiável (no Firefox: accept_insecure_certs)
+        self.session.verify = False
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount("http://", adaptador)
+        self.session.mount("https://", adaptador)
+        self.token: Optional[str] = None
+        self.expira_em = 0.0
+        self._carregar_token()
+
+    # --- token ---
+
+    def _carregar_token(self) -> None:
+        try:
+            dados = json.loads(self.arquivo_token.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if dados.get("api_url") == self.api_url:
+            self.token, self.expira_em = dados.get("token"), float(dados.get("expira_em", 0))
+
+    def _salvar_token(self) -> None:
+        try:
+            self.arquivo_token.parent.mkdir(parents=True, exist_ok=True)
+            temporario = self.arquivo_token.with_suffix(".tmp")
+            # Criado já com 0600 (sem sobra de outra execução com outra permissão): o
+            # token nunca fica legível por outros usuários
+            temporario.unlink(missing_ok=True)
+            descritor = os.open(temporario, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+            with os.fdopen(descritor, "w", encoding="utf-8") as f:
+                json.dump({"api_url": self.api_url, "token": self.token, "expira_em": self.expira_em}, f)
+            temporario.replace(self.arquivo_token)
+        except OSError as e:
+            logger.warning("Não foi possível gravar o token em %s: %s", self.arquivo_token, e)
+
+    def token_valido(self) -> bool:
+        return bool(self.token) and time.time() < self.expira_em - HTTP_TOKEN_MARGEM
+
+    def descartar_token(self) -> None:
+        self.token, self.expira_em = None, 0.0
+        self.arquivo_token.unlink(missing_ok=True)
+
+    # --- requisições ---
+
+    def _requisicao(self, metodo: str, rota: str, autenticar: bool = True, **kwargs) -> requests.Response:
+        url = urljoin(self.api_url, ROTAS_HTTP[rota])
+        cabecalhos = kwargs.pop("headers", {})
+        if autenticar and self.token:
+            cabecalhos["Authorization"] = f"Bearer {self.token}"
+        resp = self.session.request(metodo, url, headers=cabecalhos, timeout=self.timeout, **kwargs)
+        if resp.status_code in (404, 405):
+            raise SiteIncompativel(f"{metodo} {url}: HTTP {resp.status_code}")
+        if autenticar and resp.status_code in (401, 403):
+            raise SessaoExpirada(f"{metodo} {url}: HTTP {resp.status_code}")
+        return resp
+
+    @staticmethod
+    def _json(resp: requests.Response):
+        try:
+            return resp.json()
+        except ValueError:
+            raise SiteIncompativel(
+                f"{resp.request.method} {resp.url}: resposta não é JSON ({resp.headers.get('Content-Type')})"
+            ) from None
+
+    def obter_captcha(self) -> tuple:
+        """(id_do_captcha_ou_None, bytes_da_imagem). Aceita a imagem crua ou JSON com
+        a imagem em base64/data URI.
+        """
+        resp = self._requisicao("GET", "captcha", autenticar=False)
+        resp.raise_for_status()
+        if resp.headers.get("Content-Type", "").startswith("image/"):
+            return resp.headers.get("X-Captcha-Id"), resp.content
+        dados = self._json(resp)
+        imagem = next((dados[c] for c in ("imagem", "image", "captcha", "img") if dados.get(c)), None)
+        if not imagem:
+            raise SiteIncompativel(f"captcha sem imagem na resposta (campos: {sorted(dados)})")
+        identificador = next((dados[c] for c in ("id", "captchaId", "token", "chave") if dados.get(c)), None)
+        return identificador, bytes_imagem(imagem)
+
+    def login(self, usuario: str, senha: str, captcha: Optional[str], captcha_id=None) -> bool:
+        """Faz o login e guarda o token. False se o site recusou (senha/CAPTCHA)."""
+        corpo = {"username": usuario, "password": senha, "captcha": captcha or ""}
+        if captcha_id is not None:
+            corpo["captchaId"] = captcha_id
+        resp = self._requisicao("POST", "login", autenticar=False, json=corpo)
+        if resp.status_code in (400, 401, 403, 422):
+            logger.warning("Login recusado pelo site: HTTP %s %s", resp.status_code, resp.text[:200])
+            return False
+        resp.raise_for_status()
+        dados = self._json(resp)
+        token = next((dados[c] for c in CAMPOS_TOKEN if dados.get(c)), None) or resp.headers.get("Authorization")
+        if not token:
+            raise SiteIncompativel(f"login sem token na resposta (campos: {sorted(dados)})")
+        self.token = token.removeprefix("Bearer ").strip()
+        self.expira_em = expiracao_jwt(self.token) or time.time() + HTTP_TOKEN_TTL
+        self._salvar_token()
+        return True
+
+    def registrar_ponto(self) -> dict:
+        """O clique em "Registrar Frequência". Levanta SessaoExpirada se o token caiu e
+        SiteIncompativel só se a rota não existe (nada foi registrado). Depois de um 2xx o
+        ponto está registrado: o corpo é opaco e nunca vira erro.
+        """
+        resp = self._requisicao("POST", "registrar", json={})
+        resp.raise_for_status()
+        try:
+            dados = resp.json() if resp.content else {}
+        except ValueError:
+            return {"resposta": resp.text[:200]}
+        return dados if isinstance(dados, dict) else {"resposta": dados}
+
+    def ler_registros(self) -> list:
+        """Registros de ponto no formato de `normalizar_registro`."""
+        resp = self._requisicao("GET", "registros")
+        resp.raise_for_status()
+        dados = self._json(resp)
+        if isinstance(dados, dict):
+            dados = next((dados[c] for c in CAMPOS_LISTA if isinstance(dados.get(c), list)), None)
+        if not isinstance(dados, list):
+            raise SiteIncompativel("registros: resposta sem lista")
+        return [normalizar_registro(item) for item in dados if isinstance(item, dict)]
+
+
+# --- Mock local do site ---
+
+# PNG 1x1 servido como CAPTCHA pelo mock
+PNG_MOCK = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=="
+)
+DIAS_SEMANA = ("SEG", "TER", "QUA", "QUI", "SEX", "SAB", "DOM")
+
+
+class _TratadorMock(BaseHTTPRequestHandler):
+    """Rotas de ROTAS_HTTP sob /api/, com estado em `self.server`."""
+
+    def log_message(self, formato, *args):
+        logger.info("mock: " + formato, *args)
+
+    def _responder(self, status: int, dados) -> None:
+        corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _rota(self) -> Optional[str]:
+        caminho = urlsplit(self.path).path
+        return next((nome for nome, rota in ROTAS_HTTP.items() if caminho == "/api/" + rota), None)
+
+    def _autenticado(self) -> bool:
+        token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        expira = expiracao_jwt(token)
+        return token in self.server.tokens and expira is not None and expira > time.time()
+
+    def _corpo(self) -> dict:
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(tamanho) or b"{}")
+        except ValueError:
+            return {}
+
+    def do_GET(self):
+        rota = self._rota()
+        if rota == "captcha":
+            identificador = secrets.token_hex(8)
+            self.server.captchas.add(identificador)
+            imagem = "data:image/png;base64," + base64.b64encode(PNG_MOCK).decode()
+            return self._responder(200, {"id": identificador, "imagem": imagem})
+        if rota == "registros":
+            if not self._autenticado():
+                return self._responder(401, {"erro": "não autenticado"})
+            with self.server.lock:
+                return self._responder(200, self.server.registros_lista())
+        if urlsplit(self.path).path in ("/", "/index.html"):
+            return self._responder(200, {"mock": True, "rotas": ROTAS_HTTP})
+        self._responder(404, {"erro": "rota inexistente"})
+
+    def do_POST(self):
+        rota, corpo = self._rota(), self._corpo()
+        if rota == "login":
+            servidor = self.server
+            credenciais = (servidor.usuario is None or corpo.get("username") == servidor.usuario) and (
+                servidor.senha is None or corpo.get("password") == servidor.senha
+            )
+            captcha_ok = servidor.captcha is None or (
+                corpo.get("captcha") == servidor.captcha and corpo.get("captchaId") in servidor.captchas
+            )
+            servidor.captchas.discard(corpo.get("captchaId"))
+            if not (credenciais and captcha_ok):
+                return self._responder(401, {"erro": "usuário, senha ou captcha inválidos"})
+            token = servidor.emitir_token()
+            return self._responder(200, {"token": token})
+        if rota == "registrar":
+            if not self._autenticado():
+                return self._responder(401, {"erro": "não autenticado"})
+            with self.server.lock:
+                agora = datetime.datetime.now()
+                self.server.marcas.setdefault(agora.date(), []).append(agora.strftime("%H:%M"))
+            return self._responder(200, {"mensagem": "Frequência registrada com sucesso"})
+        self._responder(404, {"erro": "rota inexistente"})
+
+
+class SiteMock(ThreadingHTTPServer):
+    """Mock do site: CAPTCHA, login com token JWT (sem assinatura real), registro e tabela."""
+
+    daemon_threads = True
+
+    def __init__(self, endereco, usuario=None, senha=None, captcha=None, ttl_token: float = 3600):
+        super().__init__(endereco, _TratadorMock)
+        self.usuario, self.senha, self.captcha, self.ttl_token = usuario, senha, captcha, ttl_token
+        self.captchas: set = set()
+        self.tokens: set = set()
+        self.marcas: dict = {}  # date -> ["HH:MM", ...]
+        self.lock = threading.Lock()
+
+    def emitir_token(self) -> str:
+        def b64(dados: dict) -> str:
+            return base64.urlsafe_b64encode(json.dumps(dados).encode()).rstrip(b"=").decode()
+
+        token = ".".join([b64({"alg": "none"}), b64({"sub": self.usuario, "exp": time.time() + self.ttl_token}), "mock"])
+        self.tokens.add(token)
+        return token
+
+    def registros_lista(self) -> list:
+        return [
+            {"data": dia.isoformat(), "dia": DIAS_SEMANA[dia.weekday()], "marcas": marcas}
+            for dia, marcas in sorted(self.marcas.items(), reverse=True)
+        ]
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Motor HTTP do login-ia.py e mock local do site.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_mock = sub.add_parser("mock", help="sobe um mock local das rotas do site")
+    p_mock.add_argument("--porta", type=int, default=8080)
+    p_mock.add_argument("--captcha", help="resposta exigida do CAPTCHA (padrão: aceita qualquer uma)")
+    p_mock.add_argument("--ttl-token", type=float, default=3600)
+    args = parser.parse_args()
+
+    servidor = SiteMock(
+        ("127.0.0.1", args.porta), os.getenv("PONTO_USER"), os.getenv("PONTO_PASS"), args.captcha, args.ttl_token
+    )
+    logger.info("Mock do site em http://127.0.0.1:%d/ (API em /api/)", args.porta)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Registro de ponto de várias contas em paralelo.
+
+O login-ia.py atende um PONTO_USER/PONTO_PASS por processo. Aqui cada conta do
+arquivo de credenciais roda em um processo login-ia.py próprio, com no máximo
+MULTICONTAS_PARALELO processos de uma vez. Cada conta tem um perfil do Firefox
+isolado, e também um token do motor http, em MULTICONTAS_PERFIS_DIR/<conta>/,
+então nenhuma conta herda a sessão de outra e cada uma reaproveita o próprio
+login. As retentativas são por conta (REGISTER_ATTEMPTS do login-ia.py), e o
+limite de cada processo é MULTICONTAS_TIMEOUT por tentativa mais as esperas entre
+elas (RETRY_MAX); um processo que passar disso é encerrado junto com o Firefox e o
+geckodriver que abriu, e conta como falha.
+
+Os processos filhos não reportam ao servidor: cada um grava o resultado em um
+JSON (RESULTADO_ARQUIVO), e ao final vai um único relatório para a tarefa
+(/api/confirmar-execucao), com a linha do dia de cada conta e as etapas de todas.
+
+    python multicontas.py contas.json [--paralelo 4] [--tentativas 2]
+
+Credenciais: JSON ([{"usuario": ..., "senha": ..., "nome": ...}, ...]) ou CSV com
+cabeçalho usuario,senha[,nome]. Campos opcionais: "perfil" (diretório do
+perfil do Firefox) e "motor" (MOTOR_REGISTRO da conta).
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from relator import obter_relator
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+URL_API = os.getenv("URL_API")
+TAREFA_ID = os.getenv("TAREFA_ID")
+SCRIPT_LOGIN = Path(os.getenv("LOGIN_PYTHON", Path(__file__).resolve().parent / "login-ia.py"))
+MULTICONTAS_ARQUIVO = os.getenv("MULTICONTAS_ARQUIVO")
+MULTICONTAS_PARALELO = int(os.getenv("MULTICONTAS_PARALELO", str(min(4, os.cpu_count() or 1))))
+MULTICONTAS_PERFIS_DIR = Path(os.getenv("MULTICONTAS_PERFIS_DIR", Path.home() / ".cache" / "descall" / "perfis"))
+# Limite por tentativa do login-ia.py (segundos); cabe uma execução completa pelo Selenium
+MULTICONTAS_TIMEOUT = float(os.getenv("MULTICONTAS_TIMEOUT", "90"))
+# Espera máxima entre tentativas do login-ia.py (o mesmo RETRY_MAX que ele lê)
+RETRY_MAX = float(os.getenv("RETRY_MAX", "60"))
+# Tempo para o login-ia.py fechar o Firefox depois do SIGTERM, antes do SIGKILL
+MULTICONTAS_ESPERA_TERMINO = 5
+MULTICONTAS_RELATORIO = Path(os.getenv("MULTICONTAS_RELATORIO", "log/multicontas.json"))
+
+
+def carregar_contas(arquivo: Path) -> list:
+    """Lista de dicts com usuario, senha e nome (padrão: o usuário)."""
+    texto = arquivo.read_text(encoding="utf-8")
+    if arquivo.suffix.lower() == ".csv":
+        contas = list(csv.DictReader(texto.splitlines()))
+    else:
+        contas = json.loads(texto)
+    for i, conta in enumerate(contas, 1):
+        if not conta.get("usuario") or not conta.get("senha"):
+            raise ValueError(f"{arquivo}: conta {i} sem usuario/senha")
+        conta.setdefault("nome", conta["usuario"])
+    nomes = [c["nome"] for c in contas]
+    if len(set(nomes)) != len(nomes):
+        raise ValueError(f"{arquivo}: nomes de conta repetidos")
+    return contas
+
+
+def diretorio_conta(conta: dict) -> Path:
+    return MULTICONTAS_PERFIS_DIR / re.sub(r"[^A-Za-z0-9_.-]", "_", conta["nome"])
+
+
+def limite_processo(tentativas: int, timeout: float) -> float:
+    """Limite total de um login-ia.py: `timeout` por tentativa mais as esperas entre elas."""
+    return tentativas * timeout + (tentativas - 1) * RETRY_MAX
+
+
+def encerrar_grupo(proc: subprocess.Popen) -> str:
+    """Encerra o login-ia.py e tudo que ele abriu (Firefox, geckodriver), que estão no
+    mesmo grupo de processos; devolve o que ainda havia de saída.
+    """
+    for sinal in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sinal)
+        except ProcessLookupError:
+            pass
+        try:
+            return proc.communicate(timeout=MULTICONTAS_ESPERA_TERMINO)[0] or ""
+        except subprocess.TimeoutExpired:
+            continue
+    return ""
+
+
+def executar_conta(conta: dict, tentativas: int, timeout: float) -> dict:
+    """Roda o login-ia.py para uma conta e devolve o resultado (o último relatório dela).
+    `timeout` vale por tentativa.
+    """
+    diretorio = diretorio_conta(conta)
+    perfil = Path(conta.get("perfil") or diretorio / "firefox")
+    for caminho in (diretorio, perfil):
+        caminho.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(prefix="resultado-", suffix=".json", dir=diretorio, delete=False) as f:
+        arquivo_resultado = Path(f.name)
+    env = dict(
+        os.environ,
+        PONTO_USER=conta["usuario"],
+        PONTO_PASS=conta["senha"],
+        FIREFOX_PROFILE_PATH=str(perfil),
+        HTTP_TOKEN_ARQUIVO=str(diretorio / "token-http.json"),
+        REGISTER_ATTEMPTS=str(tentativas),
+        RESULTADO_ARQUIVO=str(arquivo_resultado),
+    )
+    if conta.get("motor"):
+        env["MOTOR_REGISTRO"] = conta["motor"]
+
+    inicio = time.monotonic()
+    resultado = {"nome": conta["nome"], "status": "falha", "msgsucesso": None, "sucesso": False, "etapas": []}
+    limite = limite_processo(tentativas, timeout)
+    # Sessão própria: no tempo esgotado o grupo inteiro (com o Firefox) é encerrado
+    proc = subprocess.Popen(
+        [sys.executable, str(SCRIPT_LOGIN)], env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        start_new_session=True,
+    )
+    try:
+        saida = proc.communicate(timeout=limite)[0]
+        codigo = proc.returncode
+    except subprocess.TimeoutExpired:
+        codigo = None
+        saida = encerrar_grupo(proc)
+        resultado["msgsucesso"] = f"tempo esgotado ({limite:.0f}s)"
+    try:
+        relatorio = json.loads(arquivo_resultado.read_text(encoding="utf-8") or "{}")
+    except (OSError, ValueError):
+        relatorio = {}
+    finally:
+        arquivo_resultado.unlink(missing_ok=True)
+    if codigo is not None:
+        resultado.update({k: relatorio[k] for k in ("status", "msgsucesso", "sucesso", "etapas") if k in relatorio})
+        if codigo != 0:
+            resultado.update(status="falha", sucesso=False, msgsucesso=resultado["msgsucesso"] or f"código de saída {codigo}")
+    # Guarda a saída da conta para diagnóstico (as contas rodam ao mesmo tempo)
+    (diretorio / "ultima_execucao.log").write_text(saida, encoding="utf-8")
+    resultado["codigo_saida"] = codigo
+    resultado["duracao_s"] = round(time.monotonic() - inicio, 1)
+    logger.info("Conta %s: %s em %.1fs (%s)", conta["nome"], resultado["status"], resultado["duracao_s"], resultado["msgsucesso"])
+    return resultado
+
+
+def combinar(resultados: list) -> dict:
+    """Relatório único da tarefa: sucesso só se todas as contas deram certo."""
+    sucesso = all(r["status"] == "sucesso" for r in resultados)
+    linhas = [f"{r['nome']}: {r['status']}" + (f" - {r['msgsucesso']}" if r["msgsucesso"] else "") for r in resultados]
+    etapas = [{**e, "detalhe": e.get("detalhe") or r["nome"]} for r in resultados for e in r["etapas"]]
+    return {"status": "sucesso" if sucesso else "falha", "msgsucesso": "\n".join(linhas), "sucesso": sucesso, "etapas": etapas}
+
+
+def executar(contas: list, paralelo: int, tentativas: int, timeout: float, tarefa_id: Optional[str] = TAREFA_ID) -> dict:
+    relator = obter_relator(URL_API, "multicontas")
+    relator.reportar("executando", f"{len(contas)} contas", tarefa_id)
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, paralelo), thread_name_prefix="conta") as executor:
+        resultados = list(executor.map(lambda c: executar_conta(c, tentativas, timeout), contas))
+    combinado = combinar(resultados)
+    relator.reportar(combinado["status"], combinado["msgsucesso"], tarefa_id, combinado["sucesso"], combinado["etapas"])
+    relatorio = {**combinado, "duracao_s": round(time.monotonic() - inicio, 1), "contas": resultados}
+    try:
+        MULTICONTAS_RELATORIO.parent.mkdir(parents=True, exist_ok=True)
+        MULTICONTAS_RELATORIO.write_text(json.dumps(relatorio, ensure_ascii=False, indent=2), encoding="utf-8")
+    except OSError as e:
+        logger.warning("Falha ao gravar %s: %s", MULTICONTAS_RELATORIO, e)
+    logger.info("%d contas em %.1fs: %s", len(contas), relatorio["duracao_s"], combinado["status"])
+    relator.esvaziar()
+    return relatorio
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Registra o ponto de várias contas em paralelo.")
+    parser.add_argument("credenciais", type=Path, nargs="?", default=MULTICONTAS_ARQUIVO, help="JSON ou CSV de contas")
+    parser.add_argument("--paralelo", type=int, default=MULTICONTAS_PARALELO, help="processos simultâneos")
+    parser.add_argument("--tentativas", type=int, default=int(os.getenv("REGISTER_ATTEMPTS", "2")), help="por conta")
+    parser.add_argument("--timeout", type=float, default=MULTICONTAS_TIMEOUT, help="segundos por tentativa de cada conta")
+    args = parser.parse_args()
+    if args.credenciais is None:
+        parser.error("informe o arquivo de credenciais (ou MULTICONTAS_ARQUIVO)")
+
+    relatorio = executar(carregar_contas(Path(args.credenciais)), args.paralelo, args.tentativas, args.timeout)
+    sys.exit(0 if relatorio["sucesso"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,9 +10,12 @@ else
 fi
 
 # --- TRECHO PARA FECHAR FIREFOX ---
+# Com USAR_DAEMON=1 o Firefox aberto é o do daemon (login-ia.py --daemon) e não deve ser fechado
 # Define o nome do processo (pode ser firefox ou firefox-bin)
 PROCESSO="firefox"
-if pgrep -f "$PROCESSO" > /dev/null; then    
+if [ "$USAR_DAEMON" = "1" ]; then
+    echo "[$(date +'%Y-%m-%d %H:%M:%S.%3N')] USAR_DAEMON=1: mantendo o Firefox do daemon aberto." >> $ARQUIVO_LOG
+elif pgrep -f "$PROCESSO" > /dev/null; then    
     echo "[$(date +'%Y-%m-%d %H:%M:%S.%3N')] Firefox detectado aberto. Fechando..." >> $ARQUIVO_LOG        
     sudo pkill -f "$PROCESSO"        
     sleep 5   
@@ -39,7 +42,15 @@ echo "[$(date +'%Y-%m-%d %H:%M:%S.%3N')] Iniciando registrar.sh" >> "$ARQUIVO_LO
 export DISPLAY=:0
 # Roda o script Python e salva o resultado (erros e prints) no arquivo de log
 
-python3 "$LOGIN_PYTHON" >> "$ARQUIVO_LOG" 2>&1
+if [ -n "$MULTICONTAS_ARQUIVO" ]; then
+    # Várias contas: um login-ia.py por conta, em paralelo, com relatório único (multicontas.py)
+    python3 "$PROJETO_DIR/multicontas.py" "$MULTICONTAS_ARQUIVO" >> "$ARQUIVO_LOG" 2>&1
+elif [ "$USAR_DAEMON" = "1" ]; then
+    # Pede o registro ao daemon (navegador já aquecido); se ele não estiver rodando, executa localmente
+    python3 "$LOGIN_PYTHON" --via-daemon >> "$ARQUIVO_LOG" 2>&1
+else
+    python3 "$LOGIN_PYTHON" >> "$ARQUIVO_LOG" 2>&1
+fi
 
 # Registra o fim
 echo "[$(date +'%Y-%m-%d %H:%M:%S.%3N')] Fim registrar.sh" >> "$ARQUIVO_LOG"
@@ -0,0 +1,279 @@
+"""Envio de status ao servidor (/api/confirmar-execucao) sem bloquear quem reporta.
+
+`Relator.reportar()` só enfileira: uma thread em segundo plano envia os relatórios
+em ordem, por uma `requests.Session` com keep-alive, agrupando o que estiver
+pendente em /api/confirmar-execucao-lote. Relatórios repetidos (mesmo conteúdo
+para a mesma tarefa) são descartados.
+
+A fila é gravada em disco a cada mudança, num outbox por processo
+(RELATOR_DIR/outbox-<script>-<pid>.jsonl), então o que não foi entregue — ex.: a
+API hospedada estava dormindo — é reenviado quando ela volta ou na próxima
+execução do script. Cada processo mantém um flock no seu `.lock` enquanto vive;
+ao iniciar, o relator adota os outboxes do mesmo script cujo dono já terminou
+(inclusive o antigo outbox-<script>.jsonl, sem pid). Relatórios sem id levam
+`reportado_em`, para o servidor resolver a tarefa "mais recente" daquele
+momento mesmo se o envio só acontecer horas depois.
+"""
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RELATOR_DIR = Path(os.getenv("RELATOR_DIR", Path.home() / ".cache" / "descall"))
+RELATOR_LOTE_MAX = int(os.getenv("RELATOR_LOTE_MAX", "50"))
+RELATOR_RETRY_MAX = float(os.getenv("RELATOR_RETRY_MAX", "300"))  # segundos entre reenvios
+RELATOR_ESPERA_SAIDA = float(os.getenv("RELATOR_ESPERA_SAIDA", "10"))  # espera na saída do script
+
+
+class Relator:
+    """Fila persistente de relatórios de status com uma thread de envio."""
+
+    def __init__(self, url_api: Optional[str], outbox, timeout: float = 6):
+        self.url_api = url_api
+        self.outbox = Path(outbox)
+        self.timeout = timeout
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount("http://", adaptador)
+        self.session.mount("https://", adaptador)
+        self._cond = threading.Condition()
+        self._pendentes: list = self._carregar(self.outbox)
+        self._ultimo_entregue: dict = {}  # id da tarefa -> último payload entregue
+        self._lote_suportado = True
+        self._thread: Optional[threading.Thread] = None
+        self._trava: Optional[int] = None  # flock que marca o outbox como deste processo
+        if self._pendentes:
+            logger.info("Relator: %d relatório(s) pendente(s) em %s", len(self._pendentes), self.outbox)
+            self._iniciar()
+
+    @staticmethod
+    def _carregar(outbox: Path) -> list:
+        if not outbox.exists():
+            return []
+        pendentes = []
+        for linha in outbox.read_text(encoding="utf-8").splitlines():
+            try:
+                pendentes.append(json.loads(linha))
+            except ValueError:
+                logger.warning("Relator: linha inválida ignorada em %s", outbox)
+        return pendentes
+
+    def _persistir(self) -> None:
+        """Regrava a fila (pequena) de forma atômica; chamado com o lock."""
+        try:
+            if not self._pendentes:
+                self.outbox.unlink(missing_ok=True)
+                return
+            self.outbox.parent.mkdir(parents=True, exist_ok=True)
+            temporario = self.outbox.with_suffix(".tmp")
+            temporario.write_text(
+                "".join(json.dumps(p, ensure_ascii=False) + "\n" for p in self._pendentes), encoding="utf-8"
+            )
+            temporario.replace(self.outbox)
+        except OSError as e:
+            logger.warning("Relator: falha ao gravar %s: %s", self.outbox, e)
+
+    def adotar(self, outbox) -> None:
+        """Passa para esta fila os relatórios de outro outbox (de um processo que
+        terminou) e o remove. Grava a fila antes de remover, para não perder nada.
+        """
+        outbox = Path(outbox)
+        adotados = Relator._carregar(outbox)
+        with self._cond:
+            if adotados:
+                logger.info("Relator: %d relatório(s) pendente(s) adotados de %s", len(adotados), outbox)
+                self._pendentes.extend(adotados)
+                self._persistir()
+                self._cond.notify_all()
+            outbox.unlink(missing_ok=True)
+        if adotados:
+            self._iniciar()
+
+    def _iniciar(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._laco, name="relator", daemon=True)
+            self._thread.start()
+
+    def reportar(
+        self,
+        status: str,
+        msgsucesso: Optional[str] = None,
+        tarefa_id=None,
+        sucesso: Optional[bool] = None,
+        etapas: Optional[list] = None,
+    ) -> None:
+        """Enfileira um relatório de status; retorna imediatamente."""
+        payload = {"status": status}
+        if tarefa_id is not None:
+            payload["id"] = int(tarefa_id)
+        else:
+            payload["reportado_em"] = datetime.now(timezone.utc).isoformat()
+        if msgsucesso is not None:
+            payload["msgsucesso"] = msgsucesso
+        if sucesso is not None:
+            payload["sucesso"] = bool(sucesso)
+        if etapas:
+            payload["etapas"] = list(etapas)
+        self.enfileirar(payload)
+
+    def enfileirar(self, payload: dict) -> None:
+        with self._cond:
+            anteriores = [p for p in self._pendentes if p.get("id") == payload.get("id")]
+            anterior = anteriores[-1] if anteriores else self._ultimo_entregue.get(payload.get("id"))
+            if anterior is not None and _conteudo(anterior) == _conteudo(payload):
+                logger.debug("Relator: relatório repetido descartado: %s", payload)
+                return
+            self._pendentes.append(payload)
+            self._persistir()
+            self._cond.notify_all()
+        self._iniciar()
+
+    def esvaziar(self, timeout: float = RELATOR_ESPERA_SAIDA) -> bool:
+        """Espera até `timeout` segundos pela entrega da fila. O que sobrar fica no outbox."""
+        limite = time.monotonic() + timeout
+        with self._cond:
+            while self._pendentes:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    logger.warning("Relator: %d relatório(s) ficam no outbox para reenvio", len(self._pendentes))
+                    return False
+                self._cond.wait(restante)
+        return True
+
+    def _laco(self) -> None:
+        espera = 1.0
+        while True:
+            with self._cond:
+                while not self._pendentes:
+                    self._cond.wait()
+                lote = self._pendentes[:RELATOR_LOTE_MAX]
+            try:
+                entregues = self._enviar(lote)
+            except Exception as e:
+                logger.warning("Relator: API indisponível (%s); nova tentativa em %.0fs", e, espera)
+                time.sleep(espera)
+                espera = min(espera * 2, RELATOR_RETRY_MAX)
+                continue
+            espera = 1.0
+            with self._cond:
+                # Só há inserções no fim da fila, então o lote enviado continua no início
+                del self._pendentes[:entregues]
+                for payload in lote[:entregues]:
+                    self._ultimo_entregue[payload.get("id")] = payload
+                self._persistir()
+                self._cond.notify_all()
+
+    def _enviar(self, lote: list) -> int:
+        """Envia `lote` e retorna quantos itens saíram da fila. Levanta exceção se a API
+        não respondeu (ou respondeu 5xx), para o laço tentar de novo mais tarde.
+        """
+        if not self.url_api:
+            raise RuntimeError("URL_API não configurada")
+        if len(lote) > 1 and self._lote_suportado:
+            resp = self.session.post(
+                f"{self.url_api}/api/confirmar-execucao-lote", json={"confirmacoes": lote}, timeout=self.timeout
+            )
+            if resp.status_code in (404, 405):
+                logger.info("Relator: servidor sem envio em lote; usando envios individuais")
+                self._lote_suportado = False
+            elif resp.status_code < 400:
+                logger.info("Relator: %d relatório(s) entregues em lote", len(lote))
+                return len(lote)
+            elif resp.status_code >= 500:
+                resp.raise_for_status()
+            # Outro 4xx: algum item inválido; envia um a um para isolá-lo
+        payload = lote[0]
+        resp = self.session.post(f"{self.url_api}/api/confirmar-execucao", json=payload, timeout=self.timeout)
+        if resp.status_code >= 500:
+            resp.raise_for_status()
+        if resp.status_code >= 400:
+            # Erro permanente (ex.: tarefa removida): reenviar não adianta
+            logger.warning("Relator: servidor recusou %s: %s %s", payload, resp.status_code, resp.text)
+        else:
+            logger.info("Status atualizado no servidor: %s", payload.get("status"))
+        return 1
+
+
+def _conteudo(payload: dict) -> dict:
+    """Payload sem `reportado_em`, para reconhecer relatórios repetidos."""
+    return {k: v for k, v in payload.items() if k != "reportado_em"}
+
+
+def _travar(caminho: Path, criar: bool) -> Optional[int]:
+    """flock exclusivo, sem esperar, em `caminho`; o descritor mantém a trava.
+
+    None se outro processo já a tem. Sem `criar`, levanta FileNotFoundError se
+    o arquivo não existir.
+    """
+    fd = os.open(caminho, os.O_RDWR | (os.O_CREAT if criar else 0), 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _adotar_orfaos(relator: Relator, nome: str) -> None:
+    """Adota os outboxes de `nome` cujo processo dono terminou e apaga suas travas.
+
+    As varreduras de processos do mesmo script são serializadas por
+    outbox-<nome>.varredura.lock, então cada órfão é adotado uma única vez.
+    """
+    padrao = re.compile(rf"outbox-{re.escape(nome)}(-\d+)?\.(jsonl|lock)")
+    varredura = os.open(RELATOR_DIR / f"outbox-{nome}.varredura.lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(varredura, fcntl.LOCK_EX)
+        orfaos = {c.with_suffix("") for c in RELATOR_DIR.iterdir() if padrao.fullmatch(c.name)}
+        orfaos.discard(relator.outbox.with_suffix(""))
+        for base in sorted(orfaos):
+            trava = base.with_suffix(".lock")
+            try:
+                fd = _travar(trava, criar=False)
+            except FileNotFoundError:
+                fd = -1  # Sem trava: outbox antigo (sem pid)
+            if fd is None:
+                continue  # Dono ainda rodando
+            try:
+                relator.adotar(base.with_suffix(".jsonl"))
+                trava.unlink(missing_ok=True)
+            finally:
+                if fd >= 0:
+                    os.close(fd)
+    finally:
+        os.close(varredura)
+
+
+_relatores: dict = {}
+_lock_relatores = threading.Lock()
+
+
+def obter_relator(url_api: Optional[str], nome: str) -> Relator:
+    """Relator do processo para o script `nome` (outbox próprio do processo).
+
+    Na criação, trava o outbox deste processo e adota os de processos do mesmo
+    script que terminaram sem entregar tudo.
+    """
+    with _lock_relatores:
+        if nome not in _relatores:
+            base = RELATOR_DIR / f"outbox-{nome}-{os.getpid()}"
+            relator = Relator(url_api, base.with_suffix(".jsonl"))
+            try:
+                RELATOR_DIR.mkdir(parents=True, exist_ok=True)
+                relator._trava = _travar(base.with_suffix(".lock"), criar=True)
+                _adotar_orfaos(relator, nome)
+            except OSError as e:
+                logger.warning("Relator: falha ao adotar outboxes pendentes em %s: %s", RELATOR_DIR, e)
+            _relatores[nome] = relator
+        return _relatores[nome]
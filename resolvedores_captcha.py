@@ -0,0 +1,275 @@
+"""Resolvedores de CAPTCHA usados pelo login-ia.py.
+
+Cada resolvedor recebe os bytes da imagem e devolve uma `Resposta` (texto +
+confiança de 0 a 1) ou None. `ResolvedorEmCascata` tenta os resolvedores na
+ordem de CAPTCHA_RESOLVEDORES e aceita a primeira resposta com confiança
+>= CAPTCHA_CONFIANCA_MIN; o OCR local (Tesseract) responde em milissegundos e
+o Gemini fica como fallback. Novos backends entram em `RESOLVEDORES`.
+
+Também serve de bancada para medir acerto e latência com imagens guardadas:
+
+    python resolvedores_captcha.py replay DIRETORIO [--resolvedores tesseract]
+
+O gabarito de cada imagem vem de DIRETORIO/rotulos.json ({"arquivo": "resposta"})
+ou, sem ele, do nome do arquivo sem extensão. Um corpus gravado pelo login-ia.py
+(CORPUS_DIR, ver corpus_captcha.py) também pode ser usado como DIRETORIO.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from metricas import percentil
+
+logger = logging.getLogger(__name__)
+
+CAPTCHA_RESOLVEDORES = os.getenv("CAPTCHA_RESOLVEDORES", "tesseract,gemini")
+CAPTCHA_CONFIANCA_MIN = float(os.getenv("CAPTCHA_CONFIANCA_MIN", "0.8"))
+CAPTCHA_TAMANHO = int(os.getenv("CAPTCHA_TAMANHO", "0"))  # 0 = qualquer tamanho
+CAPTCHA_ALFABETO = os.getenv(
+    "CAPTCHA_ALFABETO", "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+)
+GEMINI_MODELO = os.getenv("GEMINI_MODELO", "models/gemini-flash-latest")
+PROMPT_GEMINI = "Retorne APENAS os caracteres alfanuméricos desta imagem. Sem espaços, sem texto extra."
+
+RE_NAO_ALFANUMERICO = re.compile(r"[^0-9A-Za-z]")
+EXTENSOES_IMAGEM = {".png", ".jpg", ".jpeg", ".gif", ".bmp"}
+
+
+@dataclass
+class Resposta:
+    texto: str
+    confianca: float  # 0..1
+    resolvedor: str
+    duracao: float = 0.0  # segundos
+
+
+def limpar_texto(texto: str) -> str:
+    return RE_NAO_ALFANUMERICO.sub("", texto or "")
+
+
+def tamanho_confere(texto: str) -> bool:
+    return not CAPTCHA_TAMANHO or len(texto) == CAPTCHA_TAMANHO
+
+
+class Resolvedor(ABC):
+    """Interface dos backends: `disponivel()` e `resolver(imagem)`."""
+
+    nome = "base"
+
+    def disponivel(self) -> bool:
+        return True
+
+    @abstractmethod
+    def resolver(self, imagem: bytes) -> Optional[Resposta]:
+        """Texto do CAPTCHA em `imagem`, ou None se não conseguiu."""
+
+
+class ResolvedorTesseract(Resolvedor):
+    """OCR local via pytesseract + Pillow (opcionais); a confiança é a média do Tesseract."""
+
+    nome = "tesseract"
+
+    def __init__(self):
+        try:
+            import pytesseract
+            from PIL import Image, ImageOps
+        except ImportError:
+            self._pytesseract = None
+        else:
+            self._pytesseract, self._Image, self._ImageOps = pytesseract, Image, ImageOps
+        # Uma linha de texto, só os caracteres do alfabeto do CAPTCHA
+        self._config = f"--psm 7 -c tessedit_char_whitelist={CAPTCHA_ALFABETO}"
+
+    def disponivel(self) -> bool:
+        return self._pytesseract is not None
+
+    def _preparar(self, imagem: bytes):
+        img = self._ImageOps.grayscale(self._Image.open(io.BytesIO(imagem)))
+        img = img.resize((img.width * 3, img.height * 3))
+        img = self._ImageOps.autocontrast(img)
+        return img.point(lambda p: 255 if p > 140 else 0)
+
+    def resolver(self, imagem: bytes) -> Optional[Resposta]:
+        dados = self._pytesseract.image_to_data(
+            self._preparar(imagem), config=self._config, output_type=self._pytesseract.Output.DICT
+        )
+        pares = [(t, float(c)) for t, c in zip(dados["text"], dados["conf"]) if t.strip() and float(c) >= 0]
+        texto = limpar_texto("".join(t for t, _ in pares))
+        if not texto:
+            return None
+        confianca = sum(c for _, c in pares) / len(pares) / 100
+        if not tamanho_confere(texto):
+            confianca = 0.0
+        return Resposta(texto, confianca, self.nome)
+
+
+_modelos_gemini: dict = {}
+_lock_gemini = threading.Lock()
+
+
+def modelo_gemini(api_key: str, modelo: str = GEMINI_MODELO):
+    """Cliente do Gemini criado uma vez por processo (por chave/modelo)."""
+    with _lock_gemini:
+        if (api_key, modelo) not in _modelos_gemini:
+            import google.generativeai as genai
+
+            genai.configure(api_key=api_key)
+            _modelos_gemini[(api_key, modelo)] = genai.GenerativeModel(modelo)
+        return _modelos_gemini[(api_key, modelo)]
+
+
+class ResolvedorGemini(Resolvedor):
+    """Envia a imagem ao Gemini. Sem nota de confiança: vale 1.0 se o tamanho confere."""
+
+    nome = "gemini"
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
+
+    def disponivel(self) -> bool:
+        return bool(self.api_key)
+
+    def resolver(self, imagem: bytes) -> Optional[Resposta]:
+        resposta = modelo_gemini(self.api_key).generate_content(
+            [{"mime_type": "image/png", "data": imagem}, PROMPT_GEMINI]
+        )
+        texto = limpar_texto(getattr(resposta, "text", ""))
+        if not texto:
+            return None
+        return Resposta(texto, 1.0 if tamanho_confere(texto) else 0.5, self.nome)
+
+
+RESOLVEDORES = {"tesseract": ResolvedorTesseract, "gemini": ResolvedorGemini}
+
+
+class ResolvedorEmCascata(Resolvedor):
+    """Tenta cada resolvedor em ordem e para na primeira resposta confiável.
+    Se nenhuma atingir `confianca_min`, devolve a de maior confiança.
+    """
+
+    nome = "cascata"
+
+    def __init__(self, resolvedores: list, confianca_min: float = CAPTCHA_CONFIANCA_MIN):
+        self.resolvedores = resolvedores
+        self.confianca_min = confianca_min
+
+    def disponivel(self) -> bool:
+        return any(r.disponivel() for r in self.resolvedores)
+
+    def resolver(self, imagem: bytes) -> Optional[Resposta]:
+        melhor = None
+        for resolvedor in self.resolvedores:
+            if not resolvedor.disponivel():
+                continue
+            inicio = time.perf_counter()
+            try:
+                resposta = resolvedor.resolver(imagem)
+            except Exception as e:
+                logger.warning("Resolvedor %s falhou: %s", resolvedor.nome, e)
+                continue
+            if resposta is None:
+                logger.info("Resolvedor %s não reconheceu o CAPTCHA", resolvedor.nome)
+                continue
+            resposta.duracao = time.perf_counter() - inicio
+            logger.info(
+                "Resolvedor %s: %s (confiança %.2f, %.0f ms)",
+                resolvedor.nome, resposta.texto, resposta.confianca, resposta.duracao * 1000,
+            )
+            if resposta.confianca >= self.confianca_min:
+                return resposta
+            if melhor is None or resposta.confianca > melhor.confianca:
+                melhor = resposta
+        return melhor
+
+
+def criar_resolvedor(nomes: str = CAPTCHA_RESOLVEDORES, confianca_min: float = CAPTCHA_CONFIANCA_MIN) -> ResolvedorEmCascata:
+    """Monta a cascata a partir de uma lista separada por vírgulas (ex.: "tesseract,gemini")."""
+    resolvedores = []
+    for nome in (n.strip() for n in nomes.split(",") if n.strip()):
+        if nome not in RESOLVEDORES:
+            raise ValueError(f"Resolvedor de CAPTCHA desconhecido: {nome} (opções: {', '.join(RESOLVEDORES)})")
+        resolvedores.append(RESOLVEDORES[nome]())
+    return ResolvedorEmCascata(resolvedores, confianca_min)
+
+
+# --- Bancada de replay ---
+
+
+def carregar_amostras(diretorio: Path) -> list:
+    """Lista (caminho, resposta_esperada) das imagens de `diretorio`."""
+    if (diretorio / "indice.jsonl").exists():
+        from corpus_captcha import Corpus
+
+        return Corpus(diretorio).amostras_rotuladas()
+    rotulos_arquivo = diretorio / "rotulos.json"
+    rotulos = json.loads(rotulos_arquivo.read_text()) if rotulos_arquivo.exists() else None
+    amostras = []
+    for caminho in sorted(diretorio.iterdir()):
+        if caminho.suffix.lower() not in EXTENSOES_IMAGEM:
+            continue
+        esperado = rotulos.get(caminho.name) if rotulos is not None else caminho.stem
+        if esperado:
+            amostras.append((caminho, esperado))
+    return amostras
+
+
+def replay(diretorio: Path, resolvedor: ResolvedorEmCascata) -> dict:
+    """Resolve cada amostra e mede acerto e latência (total e por backend)."""
+    amostras = carregar_amostras(diretorio)
+    duracoes, acertos, por_backend = [], 0, {}
+    for caminho, esperado in amostras:
+        inicio = time.perf_counter()
+        resposta = resolvedor.resolver(caminho.read_bytes())
+        duracoes.append(time.perf_counter() - inicio)
+        certo = resposta is not None and resposta.texto == esperado
+        acertos += certo
+        nome = resposta.resolvedor if resposta else "nenhum"
+        backend = por_backend.setdefault(nome, {"respostas": 0, "acertos": 0})
+        backend["respostas"] += 1
+        backend["acertos"] += certo
+        logger.debug("%s: esperado=%s obtido=%s", caminho.name, esperado, resposta.texto if resposta else None)
+    return {
+        "amostras": len(amostras),
+        "acertos": acertos,
+        "taxa_acerto": round(acertos / len(amostras), 4) if amostras else None,
+        "latencia_ms": {
+            "p50": round(percentil(duracoes, 50) * 1000, 1),
+            "p95": round(percentil(duracoes, 95) * 1000, 1),
+            "max": round(max(duracoes, default=0) * 1000, 1),
+        },
+        "por_resolvedor": por_backend,
+    }
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Resolvedores de CAPTCHA e bancada de replay.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_replay = sub.add_parser("replay", help="mede acerto e latência sobre imagens guardadas")
+    p_replay.add_argument("diretorio", type=Path)
+    p_replay.add_argument("--resolvedores", default=CAPTCHA_RESOLVEDORES)
+    p_replay.add_argument("--confianca-min", type=float, default=CAPTCHA_CONFIANCA_MIN)
+    p_resolver = sub.add_parser("resolver", help="resolve uma única imagem")
+    p_resolver.add_argument("imagem", type=Path)
+    p_resolver.add_argument("--resolvedores", default=CAPTCHA_RESOLVEDORES)
+    args = parser.parse_args()
+
+    if args.comando == "replay":
+        resultado = replay(args.diretorio, criar_resolvedor(args.resolvedores, args.confianca_min))
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    else:
+        resposta = criar_resolvedor(args.resolvedores).resolver(args.imagem.read_bytes())
+        print(json.dumps(resposta.__dict__ if resposta else None, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""`login-ia.py --via-daemon`: o pedido chega ao daemon com o TAREFA_ID do ambiente."""
+import importlib.util
+import json
+import socketserver
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def login_ia(monkeypatch, tmp_path):
+    monkeypatch.syspath_prepend(str(RAIZ))
+    monkeypatch.setenv("RELATOR_DIR", str(tmp_path / "relator"))
+    spec = importlib.util.spec_from_file_location("login_ia", RAIZ / "login-ia.py")
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    monkeypatch.setattr(modulo, "DAEMON_SOCKET", str(tmp_path / "daemon.sock"))
+    monkeypatch.setattr(modulo, "TAREFA_ID", "7")
+    monkeypatch.setattr(modulo, "RESULTADO_ARQUIVO", str(tmp_path / "resultado.json"))
+    monkeypatch.setattr(sys, "argv", ["login-ia.py", "--via-daemon"])
+    return modulo
+
+
+def test_via_daemon_envia_tarefa_id(login_ia):
+    pedidos = []
+
+    class Tratador(socketserver.StreamRequestHandler):
+        def handle(self):
+            pedidos.append(json.loads(self.rfile.readline()))
+            self.wfile.write(b'{"ok": true}\n')
+
+    with socketserver.UnixStreamServer(login_ia.DAEMON_SOCKET, Tratador) as servidor:
+        thread = threading.Thread(target=servidor.handle_request, daemon=True)
+        thread.start()
+        with pytest.raises(SystemExit) as saida:
+            login_ia.main()
+        thread.join(5)
+
+    assert saida.value.code == 0
+    assert pedidos == [{"acao": "registrar", "tarefa_id": "7"}]
+
+
+def test_via_daemon_indisponivel_executa_localmente(login_ia, monkeypatch):
+    chamadas = []
+    monkeypatch.setattr(login_ia, "registrar", lambda tarefa_id=None: chamadas.append(tarefa_id) or True)
+
+    with pytest.raises(SystemExit) as saida:
+        login_ia.main()
+
+    assert saida.value.code == 0
+    assert chamadas == ["7"]